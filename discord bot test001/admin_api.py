@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import math
+import time
+from aiohttp import web
+from config import ADMIN_API_HOST, ADMIN_API_PORT, ADMIN_API_PAGE_SIZE, ADMIN_API_MAX_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 記録・期限の表示が依存するストア
+ASSIGNMENT_STORES = ["role_data", "user_remove_seconds", "expiring_roles"]
+
+class AdminApi:
+    """ダッシュボード向けの読み取り専用 HTTP API（JSON）。
+
+    GET /api/guilds
+    GET /api/guilds/{guild_id}/tracked?offset=&limit=                 記録中のユーザーと付与時刻・削除期限
+    GET /api/guilds/{guild_id}/expiries?before=&offset=&limit=        削除期限の近い順（before は UNIX 時刻）
+    GET /api/guilds/{guild_id}/expiring_roles | tenure_rules | escalation_rules | log_channel
+
+    応答はメモリ上の内容（書き込み時コピーのストアは snapshot）から作り、データファイル・Discord API は参照しない。
+    ETag は依存するストアの変更バージョンから求めるため、If-None-Match が一致する場合は内容を作らずに 304 を返す。"""
+
+    def __init__(self, bot, host=ADMIN_API_HOST, port=ADMIN_API_PORT):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self._runner = None
+        # バージョンは起動ごとに 0 から数え直すため、再起動前の ETag と一致しないよう起動時刻を含める
+        self._boot = f"{int(time.time()):x}"
+        # guild_id -> (バージョン, ID 順のユーザー一覧)
+        self._sorted_users = {}
+        self.requests = 0
+        self.not_modified = 0
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_get("/api/guilds", self.guilds)
+        app.router.add_get("/api/guilds/{guild_id}/tracked", self.tracked)
+        app.router.add_get("/api/guilds/{guild_id}/expiries", self.expiries)
+        for name in ("expiring_roles", "tenure_rules", "escalation_rules", "log_channel"):
+            app.router.add_get(f"/api/guilds/{{guild_id}}/{name}", self.store_view)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Admin API listening on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _etag(self, *parts):
+        return f'W/"{self._boot}-' + "-".join(str(p) for p in parts) + '"'
+
+    def _respond(self, request, etag, build):
+        """If-None-Match が一致すれば 304、それ以外は build() の内容を JSON で返す"""
+        self.requests += 1
+        if etag in {tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")}:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        body = json.dumps(build(), ensure_ascii=False, separators=(",", ":"))
+        return web.Response(text=body, content_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def _guild_id(self, request):
+        guild_id = request.match_info["guild_id"]
+        if not any(str(g.id) == guild_id for g in self.bot.guilds):
+            raise web.HTTPNotFound(text="unknown guild")
+        return guild_id
+
+    @staticmethod
+    def _page(request):
+        try:
+            offset = int(request.query.get("offset", 0))
+            limit = int(request.query.get("limit", ADMIN_API_PAGE_SIZE))
+        except ValueError:
+            raise web.HTTPBadRequest(text="offset / limit must be integers")
+        return max(0, offset), min(max(1, limit), ADMIN_API_MAX_PAGE_SIZE)
+
+    @staticmethod
+    def _paginated(items, total, offset, limit):
+        next_offset = offset + limit if offset + limit < total else None
+        return {"items": items, "offset": offset, "limit": limit, "total": total, "next_offset": next_offset}
+
+    async def guilds(self, request):
+        guilds = sorted(self.bot.guilds, key=lambda g: g.id)
+        # ギルドの増減は少ないため一覧そのものから ETag を求める
+        etag = self._etag("guilds", hash(tuple((g.id, g.name, g.member_count) for g in guilds)) & 0xFFFFFFFF)
+        return self._respond(request, etag, lambda: [
+            {"id": str(g.id), "name": g.name, "member_count": g.member_count} for g in guilds
+        ])
+
+    def _users(self, guild_id, version):
+        cached = self._sorted_users.get(guild_id)
+        if cached is None or cached[0] != version:
+            users = sorted(self.bot.data.snapshot(guild_id, "role_data"), key=int)
+            cached = self._sorted_users[guild_id] = (version, users)
+        return cached[1]
+
+    async def tracked(self, request):
+        guild_id = self._guild_id(request)
+        offset, limit = self._page(request)
+        data = self.bot.data
+        version = data.store_version(guild_id, ASSIGNMENT_STORES)
+        # 同じ内容でもページ範囲が違えば応答が異なるため、範囲も ETag に含める
+        etag = self._etag(guild_id, "tracked", *version, offset, limit)
+
+        def build():
+            roles_data = data.snapshot(guild_id, "role_data")
+            users = self._users(guild_id, version)
+            items = [
+                {
+                    "user_id": user_id,
+                    "roles": {
+                        role_id: {"assigned_at": ts, "expires_at": ts + data.get_remove_seconds(guild_id, user_id, role_id)}
+                        for role_id, ts in roles_data[user_id].items()
+                    },
+                }
+                for user_id in users[offset:offset + limit]
+            ]
+            return self._paginated(items, len(users), offset, limit)
+        return self._respond(request, etag, build)
+
+    async def expiries(self, request):
+        guild_id = self._guild_id(request)
+        offset, limit = self._page(request)
+        try:
+            before = float(request.query["before"]) if "before" in request.query else math.inf
+        except ValueError:
+            raise web.HTTPBadRequest(text="before must be a number")
+        data = self.bot.data
+        etag = self._etag(guild_id, "expiries", *data.store_version(guild_id, ASSIGNMENT_STORES), offset, limit, before)
+
+        def build():
+            index = data.expiry_index(guild_id)
+            total = index.count_range(-math.inf, before)
+            entries = index.page(-math.inf, before, offset, limit)
+            items = [{"user_id": u, "role_id": r, "expires_at": deadline} for deadline, u, r in entries]
+            return self._paginated(items, total, offset, limit)
+        return self._respond(request, etag, build)
+
+    async def store_view(self, request):
+        guild_id = self._guild_id(request)
+        name = request.path.rsplit("/", 1)[1]
+        store = "guild_log_channels" if name == "log_channel" else name
+        etag = self._etag(guild_id, name, *self.bot.data.store_version(guild_id, [store]))
+        return self._respond(request, etag, lambda: getattr(self.bot.data, store).get(guild_id))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import csv
+import io
+import logging
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from config import JST
+from helpers import timestamp_to_jst
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+WEEK_SECONDS = 7 * 86400
+# 1970/01/01 (木) を基準に、JST の月曜 0 時で週を区切るためのオフセット
+_WEEK_OFFSET = 3 * 86400 + int(JST.utcoffset(None).total_seconds())
+
+class HistoryColumns:
+    """ギルドの履歴を列形式（ユーザー番号・ロール番号・タイムスタンプ）で保持する。
+    roles はロールID の一覧（ギルドの期限付きロール定義の順）。
+    (ユーザー, 時刻) 順に並べ、NumPy が無い環境では array モジュールで保持する。"""
+
+    def __init__(self, rows, roles):
+        self.roles = list(roles)
+        role_codes = {r: i for i, r in enumerate(self.roles)}
+        self.users = sorted({u for u, _, _ in rows})
+        user_codes = {u: i for i, u in enumerate(self.users)}
+        rows = sorted(
+            ((user_codes[u], role_codes[r], ts) for u, r, ts in rows if r in role_codes),
+            key=lambda row: (row[0], row[2])
+        )
+        if np is not None:
+            self.user = np.fromiter((r[0] for r in rows), dtype=np.int32, count=len(rows))
+            self.role = np.fromiter((r[1] for r in rows), dtype=np.int16, count=len(rows))
+            self.ts = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        else:
+            self.user = array("i", (r[0] for r in rows))
+            self.role = array("h", (r[1] for r in rows))
+            self.ts = array("d", (r[2] for r in rows))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def weekly_counts(self):
+        """週（JST 月曜始まり）ごとのロール別件数 -> {週開始タイムスタンプ: [件数, ...]}"""
+        nroles = len(self.roles)
+        result = {}
+        if np is not None:
+            if not len(self.ts):
+                return result
+            weeks = ((self.ts + _WEEK_OFFSET) // WEEK_SECONDS).astype(np.int64)
+            keys, counts = np.unique(weeks * nroles + self.role, return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                week, role = divmod(key, nroles)
+                result.setdefault(week * WEEK_SECONDS - _WEEK_OFFSET, [0] * nroles)[role] = count
+        else:
+            counter = Counter(
+                (int((t + _WEEK_OFFSET) // WEEK_SECONDS), r) for t, r in zip(self.ts, self.role)
+            )
+            for (week, role), count in counter.items():
+                result.setdefault(week * WEEK_SECONDS - _WEEK_OFFSET, [0] * nroles)[role] = count
+        return dict(sorted(result.items()))
+
+    def repeat_offenders(self, role_id, threshold, window_seconds):
+        """role_id を window_seconds 以内に threshold 回以上付与されたことがあるユーザー
+        -> [(user_id, 期間内の最大回数, 総回数)]（最大回数の多い順）"""
+        if role_id not in self.roles or threshold < 1:
+            return []
+        code = self.roles.index(role_id)
+        if np is not None:
+            mask = self.role == code
+            users, ts = self.user[mask], self.ts[mask]
+            if not len(ts):
+                return []
+            # (ユーザー, 時刻) 順なので、同一ユーザーの区間ごとに searchsorted で窓内件数を求める
+            bounds = np.flatnonzero(np.diff(users)) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [len(ts)]))
+            offenders = []
+            for s, e in zip(starts.tolist(), ends.tolist()):
+                if e - s < threshold:
+                    continue
+                seg = ts[s:e]
+                in_window = np.searchsorted(seg, seg + window_seconds, side="right") - np.arange(e - s)
+                peak = int(in_window.max())
+                if peak >= threshold:
+                    offenders.append((self.users[int(users[s])], peak, e - s))
+        else:
+            per_user = defaultdict(list)
+            for u, r, t in zip(self.user, self.role, self.ts):
+                if r == code:
+                    per_user[u].append(t)
+            offenders = []
+            for u, seg in per_user.items():
+                if len(seg) < threshold:
+                    continue
+                peak = max(bisect_left(seg, t + window_seconds + 1e-9) - i for i, t in enumerate(seg))
+                if peak >= threshold:
+                    offenders.append((self.users[u], peak, len(seg)))
+        offenders.sort(key=lambda x: (-x[1], -x[2]))
+        return offenders
+
+    def escalation_gaps(self, from_role, to_role):
+        """to_role 付与時点から、同じユーザーの直前の from_role 付与までの経過秒数の一覧"""
+        if from_role not in self.roles or to_role not in self.roles:
+            return []
+        src, dst = self.roles.index(from_role), self.roles.index(to_role)
+        if np is not None:
+            n = len(self.ts)
+            if not n:
+                return []
+            idx = np.where(self.role == src, np.arange(n), -1)
+            last_src = np.maximum.accumulate(idx)
+            valid = (self.role == dst) & (last_src >= 0)
+            valid &= self.user[np.maximum(last_src, 0)] == self.user
+            return (self.ts[valid] - self.ts[last_src[valid]]).tolist()
+        gaps = []
+        last_user, last_ts = None, None
+        for u, r, t in zip(self.user, self.role, self.ts):
+            if u != last_user:
+                last_user, last_ts = u, None
+            if r == src:
+                last_ts = t
+            elif r == dst and last_ts is not None:
+                gaps.append(t - last_ts)
+        return gaps
+
+def median(values):
+    if not values:
+        return None
+    if np is not None:
+        return float(np.median(values))
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+class HistoryAnalytics:
+    """ギルドごとに列データと集計結果をキャッシュする。履歴バージョン・ロール定義が変わると破棄される。
+    列データの構築と集計はイベントループを止めないようスレッドで行う"""
+
+    def __init__(self, data):
+        self.data = data
+        self._cache = {}
+
+    async def columns(self, guild_id):
+        version = (self.data.history_guild_version(guild_id), self.data.store_version(guild_id, ["expiring_roles"]))
+        cached = self._cache.get(guild_id)
+        if cached is None or cached["version"] != version:
+            roles = self.data.expiring_role_defs(guild_id)
+            columns = await self.data.scan_full_history(
+                guild_id, lambda history: HistoryColumns([(u, r, e["timestamp"]) for u, r, e in history], roles)
+            )
+            cached = self._cache[guild_id] = {"version": version, "columns": columns, "results": {}}
+        return cached
+
+    async def query(self, guild_id, name, *args):
+        """集計結果を返す（同じ引数の結果はキャッシュから返す）"""
+        cached = await self.columns(guild_id)
+        key = (name,) + args
+        if key not in cached["results"]:
+            cols = cached["columns"]
+            if name == "weekly":
+                func = cols.weekly_counts
+            elif name == "offenders":
+                func = cols.repeat_offenders
+            elif name == "gaps":
+                func = cols.escalation_gaps
+            else:
+                raise ValueError(f"Unknown query: {name}")
+            cached["results"][key] = await asyncio.to_thread(func, *args)
+        return cached["results"][key]
+
+def weekly_csv(weekly, roles):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["week_start"] + list(roles))
+    for week_start, counts in weekly.items():
+        writer.writerow([timestamp_to_jst(week_start).strftime("%Y-%m-%d")] + counts)
+    return buf.getvalue().encode("utf-8-sig")
+
+def offenders_csv(offenders):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["user_id", "peak_in_window", "total"])
+    writer.writerows(offenders)
+    return buf.getvalue().encode("utf-8-sig")
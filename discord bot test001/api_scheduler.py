@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import logging
+import time
+import discord
+from config import (
+    API_WORKERS, API_MIN_INTERVAL, API_MAX_INTERVAL, API_SLOW_CALL_SECONDS, API_MAX_RETRIES, API_LOW_PRIORITY_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+# 優先度クラス（小さいほど優先）
+INTERACTIVE = 0  # スラッシュコマンドの応答に必要な呼び出し（/mention など）
+BACKGROUND = 1   # 自動削除・同期・一括付与
+LOW = 2          # ログチャンネルへの送信
+
+# キューの並び順は 登録時刻 + 優先度ごとの猶予。低優先度の呼び出しも猶予を過ぎれば
+# 以降に登録された呼び出しより先に実行されるため、一括処理が続いても送信されなくなることは無い
+_PRIORITY_DELAY = {BACKGROUND: 0.0, LOW: API_LOW_PRIORITY_DELAY}
+
+def role_route(guild):
+    """メンバーのロール編集はギルド単位でレート制限される"""
+    return ("member_roles", guild.id)
+
+def message_route(channel):
+    return ("messages", channel.id)
+
+class _Bucket:
+    """ルートごとの送信間隔。成功が続くと短くし、レート制限を観測すると長くする"""
+
+    __slots__ = ("interval", "next_at", "interactive", "calls", "limited")
+
+    def __init__(self):
+        self.interval = API_MIN_INTERVAL
+        self.next_at = 0.0
+        self.interactive = 0
+        self.calls = 0
+        self.limited = 0
+
+    def observe(self, elapsed):
+        self.calls += 1
+        if elapsed >= API_SLOW_CALL_SECONDS:
+            # discord.py 内部でレート制限待ちが発生したとみなす
+            self.interval = min(API_MAX_INTERVAL, self.interval * 2)
+        else:
+            self.interval = max(API_MIN_INTERVAL, self.interval * 0.9)
+
+    def penalize(self, retry_after, now):
+        self.limited += 1
+        self.interval = min(API_MAX_INTERVAL, self.interval * 2)
+        self.next_at = max(self.next_at, now + retry_after)
+
+def _retry_after(error):
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        try:
+            return float(error.response.headers.get("Retry-After", 1.0))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    return None
+
+class ApiScheduler:
+    """ロール編集・メッセージ送信などの Discord API 呼び出しを一元管理する。
+    対話的な呼び出しは待たせずに即時実行し、それ以外は優先度順のキューから
+    固定数のワーカーがルートごとの間隔を空けて実行する。
+    対話的な呼び出しの実行中はバックグラウンドの呼び出しを開始しない。
+    低優先度の呼び出しは API_LOW_PRIORITY_DELAY 秒まで後回しにする（それ以上は待たせない）。"""
+
+    def __init__(self, workers=API_WORKERS):
+        self.worker_count = workers
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._interactive = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = []
+        self.counts = {"interactive": 0, "background": 0, "rate_limited": 0, "retried": 0, "failed": 0}
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = _Bucket()
+        return bucket
+
+    async def run(self, route, func, *args, priority=BACKGROUND, **kwargs):
+        """func(*args, **kwargs) を優先度に従って実行し、結果を返す"""
+        if priority == INTERACTIVE:
+            return await self._run_interactive(route, func, args, kwargs)
+        if not self._workers:
+            # 起動前（setup_hook 以前）の呼び出しはそのまま実行する
+            return await self._execute(route, self._bucket(route), func, args, kwargs)
+        return await self.submit(route, func, *args, priority=priority, **kwargs)
+
+    def submit(self, route, func, *args, priority=BACKGROUND, **kwargs):
+        """キューへ登録して Future を返す（完了を待たない呼び出し用）"""
+        future = asyncio.get_running_loop().create_future()
+        if not self._workers:
+            task = asyncio.create_task(self._execute(route, self._bucket(route), func, args, kwargs))
+            task.add_done_callback(lambda t: _chain(t, future))
+        else:
+            rank = asyncio.get_running_loop().time() + _PRIORITY_DELAY.get(priority, 0.0)
+            self._queue.put_nowait((rank, next(self._seq), route, func, args, kwargs, future))
+        future.add_done_callback(_log_unretrieved)
+        return future
+
+    async def _run_interactive(self, route, func, args, kwargs):
+        bucket = self._bucket(route)
+        self._interactive += 1
+        bucket.interactive += 1
+        self._idle.clear()
+        self.counts["interactive"] += 1
+        try:
+            return await self._execute(route, bucket, func, args, kwargs)
+        finally:
+            bucket.interactive -= 1
+            self._interactive -= 1
+            if not self._interactive:
+                self._idle.set()
+
+    async def _execute(self, route, bucket, func, args, kwargs):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                self.counts["rate_limited"] += 1
+                bucket.penalize(retry_after, loop.time())
+                logger.warning(f"Rate limited on {route}: retry after {retry_after:.2f}s (interval {bucket.interval:.2f}s)")
+            raise
+        bucket.observe(time.monotonic() - start)
+        return result
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, route, func, args, kwargs, future = await self._queue.get()
+            try:
+                if future.done():
+                    continue
+                bucket = self._bucket(route)
+                for attempt in range(API_MAX_RETRIES + 1):
+                    # 同じルートの呼び出しは間隔を予約して順番に実行する
+                    start_at = max(loop.time(), bucket.next_at)
+                    bucket.next_at = start_at + bucket.interval
+                    if start_at > loop.time():
+                        await asyncio.sleep(start_at - loop.time())
+                    await self._idle.wait()
+                    try:
+                        result = await self._execute(route, bucket, func, args, kwargs)
+                    except Exception as e:
+                        if _retry_after(e) is not None and attempt < API_MAX_RETRIES:
+                            self.counts["retried"] += 1
+                            continue
+                        self.counts["failed"] += 1
+                        if not future.done():
+                            future.set_exception(e)
+                        break
+                    self.counts["background"] += 1
+                    if not future.done():
+                        future.set_result(result)
+                    break
+            except Exception as e:
+                logger.error(f"API scheduler error on {route}: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        intervals = [b.interval for b in self._buckets.values()]
+        return {
+            **self.counts,
+            "depth": self.depth(),
+            "routes": len(self._buckets),
+            "limited_routes": sum(1 for b in self._buckets.values() if b.limited),
+            "max_interval": max(intervals) if intervals else API_MIN_INTERVAL,
+        }
+
+def _chain(task, future):
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+def _log_unretrieved(future):
+    """submit の結果を待たない呼び出し元のために、失敗をログへ残す"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.debug(f"Scheduled API call failed: {future.exception()}")
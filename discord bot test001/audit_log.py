@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left, bisect_right
+from config import AUDIT_DIR, AUDIT_SEGMENT_BYTES, AUDIT_SEGMENT_SECONDS
+from storage import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+# 操作の種類（/audit の絞り込みにも使用）
+AUDIT_ACTIONS = {
+    "set_expiring_role": "期限付きロール設定",
+    "delete_expiring_role": "期限付きロール解除",
+    "set_remove_period": "削除期間変更",
+    "adjust_remove_time": "残り時間調整",
+    "edit_reason": "理由編集",
+    "set_tenure_rule": "テニュアルール設定",
+    "delete_tenure_rule": "テニュアルール削除",
+    "set_escalation_rule": "エスカレーションルール設定",
+    "delete_escalation_rule": "エスカレーションルール削除",
+    "restore_backup": "バックアップ復元",
+    "set_log_channel": "ログ送信先設定",
+    "set_mention_role": "メンション設定",
+    "job": "一括処理ジョブ",
+}
+
+def _segment_name(start_ts):
+    return f"seg-{int(start_ts * 1000):015d}.jsonl"
+
+class _Segment:
+    """1つのセグメントファイル（JSON Lines、追記のみ）とその索引。
+    索引は {キー: [[時刻, ファイル内の位置], ...]}（時刻順）で、キーはギルド・ギルド+実行者・ギルド+操作"""
+
+    def __init__(self, path, start, end=None, size=0, postings=None):
+        self.path = path
+        self.start = start
+        self.end = end if end is not None else start
+        self.size = size
+        self.postings = postings or {}
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def add(self, entry, offset):
+        self.end = max(self.end, entry["ts"])
+        for key in _keys(entry):
+            self.postings.setdefault(key, []).append([entry["ts"], offset])
+
+    def to_index(self):
+        return {"start": self.start, "end": self.end, "size": self.size, "postings": self.postings}
+
+def _keys(entry):
+    guild_id = entry["guild"]
+    return (guild_id, f"{guild_id}/a:{entry['actor']}", f"{guild_id}/o:{entry['action']}")
+
+class AuditLog:
+    """管理操作の監査ログ。data/audit/ に追記専用のセグメントファイルとして保存する。
+
+    セグメントは AUDIT_SEGMENT_BYTES または AUDIT_SEGMENT_SECONDS を超えると切り替え、
+    閉じたセグメントには索引ファイル（<セグメント名>.idx）を書き出す。
+    セグメントの期間（時刻の疎な索引）と、ギルド・実行者・操作ごとの位置の索引から対象の行だけを読むため、
+    検索時に関係の無いセグメント・行は読み込まない。書き込み中のセグメントの索引は起動時に走査して作り直す。"""
+
+    def __init__(self, base_dir=AUDIT_DIR, segment_bytes=AUDIT_SEGMENT_BYTES, segment_seconds=AUDIT_SEGMENT_SECONDS):
+        self.base_dir = base_dir
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._segments = []
+        self._lock = asyncio.Lock()
+        self.load()
+
+    def load(self):
+        self._segments = []
+        paths = sorted(glob.glob(os.path.join(self.base_dir, "seg-*.jsonl")))
+        for i, path in enumerate(paths):
+            index = read_json(path + ".idx")
+            is_active = i == len(paths) - 1
+            if not is_active and index is not None and index.get("size") == os.path.getsize(path):
+                self._segments.append(_Segment(path, index["start"], index["end"], index["size"], index["postings"]))
+                continue
+            segment = self._scan(path)
+            self._segments.append(segment)
+            if not is_active:
+                write_json(path + ".idx", segment.to_index(), compact=True)
+        if self._segments:
+            logger.info(f"Loaded audit log: {len(self._segments)} segments")
+
+    def _scan(self, path):
+        """セグメントを先頭から読み、索引を作り直す。末尾の書きかけの行は切り捨てる"""
+        segment = _Segment(path, None)
+        offset = 0
+        with open(path, "rb+") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if segment.start is None:
+                    segment.start = segment.end = entry["ts"]
+                segment.add(entry, offset)
+                offset += len(line)
+            if offset != os.path.getsize(path):
+                logger.warning(f"Truncating incomplete audit record in {path} at {offset}")
+                f.truncate(offset)
+        segment.size = offset
+        if segment.start is None:
+            segment.start = segment.end = 0
+        return segment
+
+    async def record(self, guild_id, actor, action, target=None, **details):
+        """操作を1件記録する（書き込みはスレッドで行い、記録順は保証する）"""
+        entry = {
+            "ts": time.time(),
+            "guild": str(guild_id),
+            "actor": str(getattr(actor, "id", actor)),
+            "actor_name": getattr(actor, "display_name", None),
+            "action": action,
+            "target": target,
+            "details": details,
+        }
+        try:
+            async with self._lock:
+                await asyncio.to_thread(self._append, entry)
+        except Exception as e:
+            logger.error(f"Audit log write error: {e}")
+
+    def _append(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        segment = self._segments[-1] if self._segments else None
+        if (segment is None or (segment.size and segment.size + len(line) > self.segment_bytes)
+                or entry["ts"] - segment.start > self.segment_seconds):
+            if segment is not None:
+                write_json(segment.path + ".idx", segment.to_index(), compact=True)
+            os.makedirs(self.base_dir, exist_ok=True)
+            segment = _Segment(os.path.join(self.base_dir, _segment_name(entry["ts"])), entry["ts"])
+            self._segments.append(segment)
+        with open(segment.path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        segment.add(entry, segment.size)
+        segment.size += len(line)
+
+    def _matches(self, guild_id, actor=None, action=None, since=None, until=None):
+        """条件に合う記録の (セグメント, 位置) を新しい順に返す（索引のみ参照し、ファイルは読まない）"""
+        key = f"{guild_id}/a:{actor}" if actor else f"{guild_id}/o:{action}" if action else guild_id
+        other = f"{guild_id}/o:{action}" if actor and action else None
+        since = since if since is not None else float("-inf")
+        until = until if until is not None else float("inf")
+        results = []
+        for segment in reversed(self._segments):
+            if segment.end < since or segment.start > until:
+                continue
+            postings = segment.postings.get(key)
+            if not postings:
+                continue
+            lo = bisect_left(postings, since, key=lambda p: p[0])
+            hi = bisect_right(postings, until, key=lambda p: p[0])
+            offsets = [p[1] for p in postings[lo:hi]]
+            if other is not None:
+                allowed = {p[1] for p in segment.postings.get(other, ())}
+                offsets = [o for o in offsets if o in allowed]
+            results.extend((segment, o) for o in reversed(offsets))
+        return results
+
+    async def query(self, guild_id, actor=None, action=None, since=None, until=None, offset=0, limit=10):
+        """条件に合う記録を新しい順に offset 件目から limit 件返す。(記録の一覧, 総件数)
+        索引は記録の追記（別スレッド）と同時に参照しないようロック中に引き、記録の読み込みのみスレッドで行う"""
+        async with self._lock:
+            matches = self._matches(str(guild_id), actor and str(actor), action, since, until)
+        entries = await asyncio.to_thread(self._read_entries, matches[offset:offset + limit])
+        return entries, len(matches)
+
+    @staticmethod
+    def _read_entries(page):
+        """(セグメント, 位置) の記録を読み込む。セグメントは追記のみのため、ロックは不要"""
+        entries = []
+        handles = {}
+        try:
+            for segment, position in page:
+                f = handles.get(segment.path)
+                if f is None:
+                    f = handles[segment.path] = open(segment.path, "rb")
+                f.seek(position)
+                entries.append(json.loads(f.readline()))
+        finally:
+            for f in handles.values():
+                f.close()
+        return entries
+
+    def stats(self):
+        return {
+            "segments": len(self._segments),
+            "bytes": sum(s.size for s in self._segments),
+        }
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""ストアのファイル形式ごとの書き込み・読み込み時間とサイズの計測スクリプト。
+
+履歴（role_history、schema 2 形式）を件数ごとに生成し、各形式で dumps / loads した時間と
+バイト数を比較する。orjson は未インストールの場合は計測しない。
+
+    python bench_serializers.py [件数 ...]
+"""
+import os
+import random
+import sys
+import time
+
+DEFAULT_SIZES = [10_000, 100_000, 300_000]
+REASONS = ["", "", "", "スパム", "荒らし行為", "警告 3 回目"]
+
+def _generate(entries):
+    from config import ROLES_TO_AUTO_REMOVE
+    from migrations import wrap
+    now = time.time()
+    rng = random.Random(entries)
+    history = {}
+    users = max(1, entries // 5)
+    for _ in range(entries):
+        user = str(rng.randrange(users) + 10 ** 17)
+        role = rng.choice(ROLES_TO_AUTO_REMOVE)
+        history.setdefault(user, {}).setdefault(role, []).append(
+            {"timestamp": now - rng.uniform(0, 150 * 86400), "reason": rng.choice(REASONS)}
+        )
+    for roles in history.values():
+        for entries_ in roles.values():
+            entries_.sort(key=lambda e: e["timestamp"])
+    return wrap("role_history", history)
+
+def _best(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main(sizes):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    import serializers
+    formats = [f for f in serializers.FORMATS if f != "orjson" or serializers.orjson is not None]
+    print(f"{'entries':>10} {'format':>8} {'dump (s)':>10} {'load (s)':>10} {'bytes':>14}")
+    for entries in sizes:
+        obj = _generate(entries)
+        for fmt in formats:
+            dump_time, raw = _best(lambda: serializers.dumps(obj, fmt))
+            load_time, loaded = _best(lambda: serializers.loads(raw))
+            if loaded != obj:
+                print(f"{entries:>10} {fmt:>8} round-trip mismatch")
+                return 1
+            print(f"{entries:>10} {fmt:>8} {dump_time:>10.3f} {load_time:>10.3f} {len(raw):>14,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES))
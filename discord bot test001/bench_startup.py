@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""起動時間（DataManager の読み込み＋ギルドデータ読み込み）の計測スクリプト。
+
+一時ディレクトリに旧スキーマ（タイムスタンプのみの履歴）のギルドデータを生成し、
+初回起動（スキーマ移行あり）と 2 回目以降の起動（移行済み）の読み込み時間を履歴件数ごとに比較する。
+移行済みデータの読み込みが予算（履歴 10 万件あたり STARTUP_BUDGET_PER_100K 秒）を超えた場合は
+終了コード 1 を返す。
+
+    python bench_startup.py [件数 ...]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+STARTUP_BUDGET_PER_100K = 1.0
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 300_000]
+GUILD_ID = "100000000000000000"
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+def _generate(entries):
+    """旧形式の履歴（float のリスト、順不同）を entries 件生成する"""
+    from config import ROLES_TO_AUTO_REMOVE, MANIFEST_FILE
+    from storage import shard_path
+    now = time.time()
+    rng = random.Random(entries)
+    history = {}
+    users = max(1, entries // 5)
+    for _ in range(entries):
+        user = str(rng.randrange(users) + 10 ** 17)
+        role = rng.choice(ROLES_TO_AUTO_REMOVE)
+        history.setdefault(user, {}).setdefault(role, []).append(now - rng.uniform(0, 150 * 86400))
+    roles = {u: {r: hist[-1] for r, hist in rs.items()} for u, rs in list(history.items())[:users // 10]}
+    _write(shard_path(GUILD_ID, "role_history"), history)
+    _write(shard_path(GUILD_ID, "roles_data"), roles)
+    _write(MANIFEST_FILE, {"version": 1, "guilds": {GUILD_ID: ["role_history", "roles_data"]}})
+
+def _load_once():
+    from data_manager import DataManager
+    start = time.perf_counter()
+    data = DataManager()
+    data.ensure_guild(GUILD_ID)
+    return time.perf_counter() - start
+
+def main(sizes):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    import logging
+    logging.disable(logging.INFO)
+    over_budget = False
+    print(f"{'entries':>10} {'migrate (s)':>12} {'current (s)':>12} {'speedup':>8} {'budget (s)':>11}")
+    for entries in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            _generate(entries)
+            first = _load_once()
+            second = min(_load_once() for _ in range(3))
+            os.chdir(here)
+        budget = STARTUP_BUDGET_PER_100K * max(1.0, entries / 100_000)
+        over_budget |= second > budget
+        print(f"{entries:>10} {first:>12.3f} {second:>12.3f} {first / second:>7.1f}x {budget:>11.1f}")
+    print(f"budget: {'NG' if over_budget else 'OK'}")
+    return 1 if over_budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES))
@@ -7,8 +7,9 @@ import functools
 import asyncio
 import os
 
-from config import ROLES_TO_AUTO_REMOVE, DEFAULT_REMOVE_SECONDS, BATCH_SIZE, API_DELAY, DATA_FILE, BACKUP_DIR
 from helpers import now_jst, format_duration, parse_duration, timestamp_to_jst, validate_role_data
+from api_scheduler import INTERACTIVE, message_route
+from audit_log import AUDIT_ACTIONS
 import datetime as _dt
 
 logger = logging.getLogger(__name__)
@@ -29,12 +30,14 @@ async def create_embed(title, color=0x0099ff, **fields):
     return embed
 
 class ReasonModal(Modal, title="理由を編集"):
-    def __init__(self, guild_id, user_id, role_name, index, old_reason, view_instance, bot):
+    def __init__(self, guild_id, user_id, role_id, index, old_reason, view_instance, bot):
         super().__init__()
         self.guild_id = guild_id
         self.user_id = user_id
-        self.role_name = role_name
+        self.role_id = role_id
+        self.role_name = bot.data.role_name(guild_id, role_id)
         self.index = index
+        self.old_reason = old_reason
         self.view_instance = view_instance
         self.bot = bot
         self.reason_input = TextInput(
@@ -49,9 +52,9 @@ class ReasonModal(Modal, title="理由を編集"):
     async def on_submit(self, interaction: discord.Interaction):
         from core import log_message
         reason = self.reason_input.value.strip()
-        success = self.bot.data.edit_role_history_reason(self.guild_id, self.user_id, self.role_name, self.index, reason)
+        success = await self.bot.data.edit_role_history_reason(self.guild_id, self.user_id, self.role_id, self.index, reason)
         if success:
-            await self.bot.data.save_all()
+            await self.bot.data.save_guild(self.guild_id)
             await interaction.response.send_message(
                 f"✅ 理由を更新しました\n**{self.role_name} {self.index+1}回目:** {reason or '(理由なし)'}",
                 ephemeral=True
@@ -62,16 +65,20 @@ class ReasonModal(Modal, title="理由を編集"):
             user_name = user.display_name if user else self.user_id
             log_msg = f"{interaction.user.display_name} が {user_name} の '{self.role_name} {self.index+1}回目' 理由を編集: {reason or '(理由なし)'}"
             await log_message(self.bot, guild, log_msg, "info")
+            await self.bot.audit.record(
+                self.guild_id, interaction.user, "edit_reason", self.user_id,
+                role_id=self.role_id, index=self.index, old=self.old_reason or "", new=reason
+            )
         else:
             await interaction.response.send_message("❌ 理由の更新に失敗しました", ephemeral=True)
 
 class EditReasonButton(Button):
-    def __init__(self, guild_id, user_id, role_name, index, old_reason, view_instance, display_info, bot):
+    def __init__(self, guild_id, user_id, role_id, index, old_reason, view_instance, display_info, bot):
         label = f"{'✏️' if old_reason else '➕'} {display_info}"
         super().__init__(label=label, style=discord.ButtonStyle.secondary)
         self.guild_id = guild_id
         self.user_id = user_id
-        self.role_name = role_name
+        self.role_id = role_id
         self.index = index
         self.old_reason = old_reason
         self.view_instance = view_instance
@@ -79,7 +86,7 @@ class EditReasonButton(Button):
 
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.send_modal(
-            ReasonModal(self.guild_id, self.user_id, self.role_name, self.index, self.old_reason, self.view_instance, self.bot)
+            ReasonModal(self.guild_id, self.user_id, self.role_id, self.index, self.old_reason, self.view_instance, self.bot)
         )
 
 class NavigationButton(Button):
@@ -101,46 +108,74 @@ class NavigationButton(Button):
         await view.update_view(interaction.message, interaction)
 
 class RoleHistoryView(View):
-    def __init__(self, guild_id, user_id, user_name, history, bot):
+    def __init__(self, guild_id, user_id, user_name, bot):
         super().__init__(timeout=600)
         self.guild_id = guild_id
         self.user_id = user_id
         self.user_name = user_name
-        self.history = history
         self.bot = bot
         self.current_page = 0
         self.items_per_role_per_page = 5
+        self._version = None
+        self._page_cache = {}
+        self._embed_cache = {}
         self._calc_pages()
-        self.update_buttons()
 
     def _calc_pages(self):
+        # (アーカイブ件数, メモリ上の件数) から総ページ数を求める（アーカイブ本体は読み込まない）
+        version = self.bot.data.history_version(self.guild_id, self.user_id)
+        if version == self._version:
+            return
+        self._version = version
+        self._page_cache.clear()
+        self._embed_cache.clear()
+        self.counts = self.bot.data.get_history_counts(self.guild_id, self.user_id)
         self.role_pages = {
-            r: (len(items) + self.items_per_role_per_page - 1) // self.items_per_role_per_page
-            for r, items in self.history.items()
+            r: (archived + hot + self.items_per_role_per_page - 1) // self.items_per_role_per_page
+            for r, (archived, hot) in self.counts.items()
         }
         self.total_pages = max(self.role_pages.values()) if self.role_pages else 1
 
+    def _needs_archive(self):
+        """現在のページが保持期間内の履歴を超えてアーカイブ分に及ぶか"""
+        end_idx = (self.current_page + 1) * self.items_per_role_per_page
+        return any(archived and end_idx > hot for archived, hot in self.counts.values())
+
+    async def refresh(self):
+        """必要ならアーカイブを読み込んでからボタンを更新。
+        ページ内容は読み込み直後に（await を挟まずに）組み立ててキャッシュするため、
+        その後アーカイブがキャッシュから追い出されてもイベントループ上で再読み込みしない"""
+        if self.current_page not in self._page_cache and self._needs_archive():
+            await self.bot.data.load_history_archive(self.guild_id)
+        self.update_buttons()
+
     def get_current_page_data(self):
+        # 履歴は古い順に保持されているため、新しい順のページは末尾からの範囲として直接求める
+        if self.current_page in self._page_cache:
+            return self._page_cache[self.current_page]
         page_data = {}
-        for role_name, items in self.history.items():
-            sorted_items = sorted(enumerate(items), key=lambda x: x[1]['timestamp'], reverse=True)
-            start_idx = self.current_page * self.items_per_role_per_page
-            end_idx = start_idx + self.items_per_role_per_page
-            page_items = sorted_items[start_idx:end_idx] if start_idx < len(sorted_items) else []
+        start_idx = self.current_page * self.items_per_role_per_page
+        for role_id, (archived, hot) in self.counts.items():
+            total = archived + hot
+            if start_idx >= total:
+                continue
+            hi = total - start_idx
+            lo = max(0, hi - self.items_per_role_per_page)
+            page_items = self.bot.data.get_role_history_range(self.guild_id, self.user_id, role_id, lo, hi)
             if page_items:
-                page_items_with_index = [
-                    {
-                        'item': item,
-                        'original_index': idx,
-                        'display_number': idx + 1
-                    }
-                    for idx, item in page_items
-                ]
-                page_data[role_name] = {
-                    'items': page_items_with_index,
+                page_data[role_id] = {
+                    'items': [
+                        {
+                            'item': item,
+                            'original_index': idx,
+                            'display_number': idx + 1
+                        }
+                        for idx, item in reversed(page_items)
+                    ],
                     'start_index': start_idx,
-                    'total_count': len(items)
+                    'total_count': total
                 }
+        self._page_cache[self.current_page] = page_data
         return page_data
 
     def update_buttons(self):
@@ -148,29 +183,37 @@ class RoleHistoryView(View):
         page_data = self.get_current_page_data()
         self.add_item(NavigationButton("prev", self.current_page == 0))
         self.add_item(NavigationButton("next", self.current_page >= self.total_pages - 1))
-        role_rows = {"注意": 1, "警告": 2}
-        for role_name, role_data in page_data.items():
-            if role_name not in role_rows:
-                continue
+        # 1行目はページ移動。ロールごとに1行ずつ（メッセージの行数上限のため最大4ロール）
+        for row, (role_id, role_data) in enumerate(page_data.items(), start=1):
+            if row > 4:
+                break
+            role_name = self.bot.data.role_name(self.guild_id, role_id)
             for item_data in role_data['items'][:self.items_per_role_per_page]:
                 entry = item_data['item']
                 original_index = item_data['original_index']
                 display_num = item_data['display_number']
                 display_info = f"{role_name} {display_num}回目"
-                b = EditReasonButton(self.guild_id, self.user_id, role_name, original_index, entry["reason"], self, display_info, self.bot)
-                b.row = role_rows[role_name]
+                b = EditReasonButton(self.guild_id, self.user_id, role_id, original_index, entry["reason"], self, display_info, self.bot)
+                b.row = row
                 self.add_item(b)
 
     def create_embed(self):
+        if self.current_page in self._embed_cache:
+            return self._embed_cache[self.current_page]
+        embed = self._build_embed()
+        self._embed_cache[self.current_page] = embed
+        return embed
+
+    def _build_embed(self):
         embed = discord.Embed(
-            title=f"📝 {self.user_name} のロール付与履歴（注意・警告のみ）",
+            title=f"📝 {self.user_name} のロール付与履歴（期限付きロールのみ）",
             color=0x0099ff
         )
         page_data = self.get_current_page_data()
         if not page_data:
             embed.description = "このページには表示する履歴がありません。"
             return embed
-        for role_name, role_data in page_data.items():
+        for role_id, role_data in page_data.items():
             items_with_index = role_data['items']
             start_index = role_data['start_index']
             total_count = role_data['total_count']
@@ -184,18 +227,17 @@ class RoleHistoryView(View):
             display_start = start_index + 1
             display_end = start_index + len(items_with_index)
             page_info = f"（新しい順 {display_start}-{display_end}/{total_count}件）"
-            field_name = f"{role_name} {page_info}"
+            field_name = f"{self.bot.data.role_name(self.guild_id, role_id)} {page_info}"
             embed.add_field(name=field_name, value="\n".join(lines), inline=False)
         if self.total_pages > 1:
             embed.set_footer(text=f"ページ {self.current_page + 1}/{self.total_pages} （新しい順）")
         return embed
 
     async def update_view(self, message, interaction=None):
-        self.history = self.bot.data.role_add_history.get(self.guild_id, {}).get(self.user_id, {})
         self._calc_pages()
         if self.current_page >= self.total_pages:
             self.current_page = max(0, self.total_pages - 1)
-        self.update_buttons()
+        await self.refresh()
         embed = self.create_embed()
         if interaction:
             await interaction.response.edit_message(embed=embed, view=self)
@@ -206,45 +248,30 @@ class RoleHistoryView(View):
         for item in self.children:
             item.disabled = True
 
-def _backup_current_file_to_dir(src_path: str, prefix: str):
-    """現在のファイル(src_path)をBACKUP_DIRへタイムスタンプ付きでコピー（存在する場合のみ）"""
-    import shutil
-    try:
-        if not os.path.exists(src_path):
-            return None
-        ts = now_jst().strftime("%Y%m%d_%H%M%S")
-        dst_name = f"{prefix}{ts}.json"
-        dst_path = os.path.join(BACKUP_DIR, dst_name)
-        shutil.copy2(src_path, dst_path)
-        return dst_path
-    except Exception as e:
-        logger.error(f"Backup current file failed: {e}")
-        return None
-
-def _compose_backup_filename(data_type: str, timestamp: str) -> str:
-    """data_type + timestamp -> backup filename"""
-    prefix_map = {
-        "roles_data": "roles_data_",
-        "settings": "settings_",
-        "role_history": "role_history_",
-        "log_channel": "log_channel_",
-        "tenure_rules": "tenure_rules_",
-    }
-    prefix = prefix_map.get(data_type)
-    if not prefix:
-        return ""
-    return f"{prefix}{timestamp}.json"
-
-def _data_type_to_file(data_type: str) -> str:
-    from config import DATA_FILE, SETTINGS_FILE, ROLE_HISTORY_FILE, LOG_CHANNEL_FILE, TENURE_RULES_FILE
-    mapping = {
-        "roles_data": DATA_FILE,
-        "settings": SETTINGS_FILE,
-        "role_history": ROLE_HISTORY_FILE,
-        "log_channel": LOG_CHANNEL_FILE,
-        "tenure_rules": TENURE_RULES_FILE,
-    }
-    return mapping.get(data_type, "")
+class RestoreConfirmView(View):
+    """復元プレビューの 実行 / キャンセル ボタン（コマンドの実行者のみ操作可能）"""
+
+    def __init__(self, user_id, on_confirm, timeout):
+        super().__init__(timeout=timeout)
+        self.user_id = user_id
+        self.on_confirm = on_confirm
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("❌ コマンドの実行者のみ操作できます", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="復元する", style=discord.ButtonStyle.danger)
+    async def confirm(self, interaction: discord.Interaction, button: Button):
+        self.stop()
+        await interaction.response.edit_message(view=None)
+        await self.on_confirm(interaction)
+
+    @discord.ui.button(label="キャンセル", style=discord.ButtonStyle.secondary)
+    async def cancel(self, interaction: discord.Interaction, button: Button):
+        self.stop()
+        await interaction.response.edit_message(content="復元をキャンセルしました", embed=None, view=None)
 
 def _validate_timestamp_format(ts: str) -> bool:
     try:
@@ -259,34 +286,103 @@ def setup_commands(bot):
     @bot.tree.command(name="giveall", description="全員に指定ロールを付与（管理者限定）")
     @app_commands.describe(role="付与するロール")
     async def giveall(interaction: discord.Interaction, role: discord.Role):
-        from core import add_role_with_timestamp, log_message
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("❌ 管理者権限が必要です。", ephemeral=True)
             return
         if role >= interaction.guild.me.top_role:
             await interaction.response.send_message("❌ そのロールは付与できません", ephemeral=True)
             return
+        reason = f"一括付与 by {interaction.user.display_name}"
+        await _enqueue_job(interaction, "grant", {"role_id": str(role.id), "reason": reason}, f"{role.name} の一括付与")
+
+    @bot.tree.command(name="revokeall", description="全員から指定ロールを削除（管理者限定）")
+    @app_commands.describe(role="削除するロール")
+    @admin_required
+    async def revokeall(interaction: discord.Interaction, role: discord.Role):
+        if role >= interaction.guild.me.top_role:
+            await interaction.response.send_message("❌ そのロールは削除できません", ephemeral=True)
+            return
+        reason = f"一括削除 by {interaction.user.display_name}"
+        await _enqueue_job(interaction, "revoke", {"role_id": str(role.id), "reason": reason}, f"{role.name} の一括削除")
+
+    @bot.tree.command(name="bulk_reason", description="期限付きロール履歴の理由を一括編集（管理者限定）")
+    @app_commands.describe(
+        role="期限付きロール",
+        reason="設定する理由",
+        days="直近何日分の履歴を対象にするか（省略時は保持中の全履歴）",
+        overwrite="既に理由がある履歴も上書きするか（省略時は理由が空の履歴のみ）"
+    )
+    @admin_required
+    async def bulk_reason(interaction: discord.Interaction, role: discord.Role, reason: str, days: int = None, overwrite: bool = False):
+        guild_id, role_id = str(interaction.guild.id), str(role.id)
+        if not bot.data.is_expiring(guild_id, role_id):
+            await interaction.response.send_message(f"❌ {role.name} は期限付きロールではありません。", ephemeral=True)
+            return
+        now = now_jst().timestamp()
+        params = {
+            "role_id": role_id,
+            "reason": reason[:500],
+            "since": now - days * 86400 if days else 0,
+            "until": now,
+            "overwrite": overwrite,
+        }
+        await _enqueue_job(interaction, "reason", params, f"{role.name} の理由一括編集")
+
+    async def _enqueue_job(interaction, kind, params, label):
+        """一括処理をジョブとして登録し、進捗表示用のメッセージを紐づける"""
+        from core import log_message
+        from job_queue import QUEUED
+        guild_id = str(interaction.guild.id)
         await interaction.response.defer(thinking=True)
-        members = [m for m in interaction.guild.members if not m.bot and role not in m.roles]
-        if not members:
-            await interaction.followup.send("✅ 全員が既にロールを持っています。")
-            return
-        progress_msg = await interaction.followup.send(f"🔄 {role.name} を {len(members)} 人に付与中...")
-        success = 0
-        for i, member in enumerate(members):
-            if await add_role_with_timestamp(bot, member, role, f"一括付与 by {interaction.user.display_name}"):
-                success += 1
-            if (i + 1) % BATCH_SIZE == 0:
-                await progress_msg.edit(content=f"🔄 進行状況: {i + 1}/{len(members)}")
-                await asyncio.sleep(API_DELAY)
-            else:
-                await asyncio.sleep(0.1)
-        result = f"✅ {role.name} 付与完了！成功: {success}人"
-        if role.name in ROLES_TO_AUTO_REMOVE:
-            seconds = bot.data.settings["remove_seconds"].get(role.name, DEFAULT_REMOVE_SECONDS[role.name])
-            result += f"\n⏰ {format_duration(seconds)}後に自動削除"
-        await progress_msg.edit(content=result)
-        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が {role.name} を一括付与: {success}人", "success")
+        job_id = bot.jobs.create(guild_id, kind, params, interaction.user.id)
+        waiting = sum(1 for j in bot.jobs.list(guild_id, limit=None) if j["status"] == QUEUED and j["id"] != job_id)
+        note = f"（待機中のジョブ {waiting}件の後に実行）" if waiting else ""
+        progress_msg = await interaction.followup.send(f"🔄 {label}をジョブ `{job_id}` として登録しました{note}", wait=True)
+        bot.jobs.set_message(job_id, [progress_msg.channel.id, progress_msg.id])
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が {label}を開始（ジョブ {job_id}）", "info")
+        await _audit(interaction, "job", job_id, operation="create", kind=kind, **params)
+
+    @bot.tree.command(name="jobs", description="一括処理ジョブの一覧表示")
+    async def jobs(interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        job_list = bot.jobs.list(guild_id)
+        embed = discord.Embed(title="📋 一括処理ジョブ", color=0x0099ff)
+        if not job_list:
+            embed.description = "ジョブはありません"
+        else:
+            embed.description = "\n".join(bot.jobs.describe(j) for j in job_list)[:4000]
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="job_pause", description="一括処理ジョブを一時停止（管理者限定）")
+    @app_commands.describe(job_id="ジョブID（/jobs で確認）")
+    @admin_required
+    async def job_pause(interaction: discord.Interaction, job_id: str):
+        await _control_job(interaction, job_id, bot.jobs.pause, "一時停止", "待機中・実行中のジョブのみ一時停止できます")
+
+    @bot.tree.command(name="job_resume", description="一時停止中の一括処理ジョブを再開（管理者限定）")
+    @app_commands.describe(job_id="ジョブID（/jobs で確認）")
+    @admin_required
+    async def job_resume(interaction: discord.Interaction, job_id: str):
+        await _control_job(interaction, job_id, bot.jobs.resume, "再開", "一時停止中のジョブのみ再開できます")
+
+    @bot.tree.command(name="job_cancel", description="一括処理ジョブをキャンセル（管理者限定。処理済みの分は元に戻りません）")
+    @app_commands.describe(job_id="ジョブID（/jobs で確認）")
+    @admin_required
+    async def job_cancel(interaction: discord.Interaction, job_id: str):
+        await _control_job(interaction, job_id, bot.jobs.cancel, "キャンセル", "終了したジョブはキャンセルできません")
+
+    async def _control_job(interaction, job_id, action, label, error):
+        from core import log_message
+        job = bot.jobs.get(str(interaction.guild.id), job_id.strip())
+        if job is None:
+            await interaction.response.send_message(f"❌ ジョブ `{job_id}` が見つかりません", ephemeral=True)
+            return
+        if not action(job):
+            await interaction.response.send_message(f"❌ {error}", ephemeral=True)
+            return
+        await interaction.response.send_message(f"✅ {bot.jobs.describe(job)}")
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} がジョブ {job['id']} を{label}", "info")
+        await _audit(interaction, "job", job["id"], operation=action.__name__)
 
     @bot.tree.command(name="test_add", description="自分にロール付与（テスト用）")
     @app_commands.describe(role="付与するロール")
@@ -298,11 +394,11 @@ def setup_commands(bot):
         if role in interaction.user.roles:
             await interaction.response.send_message(f"ℹ️ 既に {role.name} を持っています", ephemeral=True)
             return
-        result = await add_role_with_timestamp(bot, interaction.user, role, "テストコマンド")
+        result = await add_role_with_timestamp(bot, interaction.user, role, "テストコマンド", INTERACTIVE)
         if result:
             msg = f"✅ {role.name} を付与しました"
-            if role.name in ROLES_TO_AUTO_REMOVE:
-                seconds = bot.data.get_remove_seconds(str(interaction.guild.id), str(interaction.user.id), role.name)
+            if bot.data.is_expiring(str(interaction.guild.id), str(role.id)):
+                seconds = bot.data.get_remove_seconds(str(interaction.guild.id), str(interaction.user.id), str(role.id))
                 msg += f"\n⏰ {format_duration(seconds)}後に自動削除"
             await interaction.response.send_message(msg)
         else:
@@ -310,66 +406,199 @@ def setup_commands(bot):
 
     @bot.tree.command(name="status", description="Bot状態表示")
     async def status(interaction: discord.Interaction):
-        from config import CHECK_INTERVAL, SYNC_INTERVAL, DEBUG
         guild_id = str(interaction.guild.id)
-        tracked = len(bot.data.role_data.get(guild_id, {}))
+        embed = await bot.response_cache.get(
+            (guild_id, "status"), ["role_data", "guild_log_channels", "expiring_roles"],
+            lambda: _build_status_embed(interaction.guild)
+        )
+        await interaction.response.send_message(embed=embed)
+
+    async def _build_status_embed(guild):
+        from config import CHECK_INTERVAL, SYNC_INTERVAL, DEBUG, RESPONSE_CACHE_STATUS_TTL, LOW_MEMORY_MODE
+        guild_id = str(guild.id)
+        tracked = len(bot.data.snapshot(guild_id, "role_data"))
         log_channel_id = bot.data.guild_log_channels.get(guild_id)
-        log_channel = interaction.guild.get_channel(log_channel_id) if log_channel_id else None
+        log_channel = guild.get_channel(log_channel_id) if log_channel_id else None
         log_channel_disp = log_channel.mention if log_channel else "未設定"
         debug_mode = "ON" if DEBUG else "OFF"
         embed = await create_embed(
             "Bot ステータス", 0x00ff00,
             追跡中ユーザー=f"{tracked}人",
             チェック間隔=f"{CHECK_INTERVAL//60}分",
-            同期間隔=f"{SYNC_INTERVAL//60}分",
+            整合性チェック周期=f"{SYNC_INTERVAL//60}分",
             タイムゾーン="日本時間 (JST)",
             ログ送信先=log_channel_disp,
             デバッグモード=debug_mode
         )
-        remove_info = [f"{role}: {format_duration(bot.data.settings['remove_seconds'].get(role, DEFAULT_REMOVE_SECONDS[role]))}" for role in ROLES_TO_AUTO_REMOVE]
-        embed.add_field(name="自動削除期間", value="\n".join(remove_info), inline=False)
-        await interaction.response.send_message(embed=embed)
+        remove_info = [f"{d['name']}: {format_duration(d['seconds'])}" for d in bot.data.expiring_role_defs(guild_id).values()]
+        embed.add_field(name="自動削除期間", value="\n".join(remove_info)[:1024] or "期限付きロール未設定", inline=False)
+        q = bot.event_queue.stats()
+        embed.add_field(
+            name="イベントキュー",
+            value=(
+                f"待機: {bot.event_queue.depth(guild_id)}件（全体 {q['depth']}件）\n"
+                f"処理済み: {q['processed']}件 / 統合: {q['coalesced']}件 / 破棄: {q['dropped']}件\n"
+                f"遅延: 平均 {q['latency_avg']:.2f}秒 / p95 {q['latency_p95']:.2f}秒 / 最大 {q['latency_max']:.2f}秒"
+            ),
+            inline=False
+        )
+        a = bot.api.stats()
+        embed.add_field(
+            name="API スケジューラ",
+            value=(
+                f"待機: {a['depth']}件 / 対話: {a['interactive']}件 / バックグラウンド: {a['background']}件\n"
+                f"レート制限: {a['rate_limited']}回（再試行 {a['retried']}回, 失敗 {a['failed']}件）\n"
+                f"ルート: {a['routes']}（制限観測 {a['limited_routes']}）/ 最大間隔 {a['max_interval']:.2f}秒"
+            ),
+            inline=False
+        )
+        c = bot.response_cache.stats()
+        embed.add_field(
+            name="応答キャッシュ",
+            value=f"ヒット率: {c['hit_ratio']:.1%}（ヒット {c['hits']} / ミス {c['misses']}）/ 保持: {c['entries']}件",
+            inline=False
+        )
+        progress = bot.sweeper.progress(guild_id)
+        last = bot.sweeper.last_cycle.get(guild_id)
+        sweep_info = f"進行中: {progress[0]}/{progress[1]}人（{progress[2]}人/回）" if progress else "待機中"
+        if last:
+            sweep_info += f"\n前回: {last['checked']}人を照合、修正 {last['corrected']}件（{format_duration(last['elapsed'])}）"
+        embed.add_field(name="整合性チェック", value=sweep_info, inline=False)
+        embed.add_field(
+            name="メンバーキャッシュ",
+            value=f"{len(guild.members)}人 / {guild.member_count}人（{'省メモリモード' if LOW_MEMORY_MODE else '通常'}）",
+            inline=False
+        )
+        embed.set_footer(text=f"統計は最大{RESPONSE_CACHE_STATUS_TTL}秒前の値です")
+        return embed, RESPONSE_CACHE_STATUS_TTL
 
-    @bot.tree.command(name="set_remove_period", description="デフォルト削除期間設定（管理者限定）")
-    @app_commands.describe(role="ロール名", days="日", hours="時間", minutes="分", seconds="秒")
-    @app_commands.choices(role=[app_commands.Choice(name=r, value=r) for r in ROLES_TO_AUTO_REMOVE])
+    @bot.tree.command(name="set_remove_period", description="期限付きロールのデフォルト削除期間設定（管理者限定）")
+    @app_commands.describe(role="期限付きロール", days="日", hours="時間", minutes="分", seconds="秒")
     @admin_required
     async def set_remove_period(
         interaction: discord.Interaction,
-        role: str,
+        role: discord.Role,
         days: int = 0,
         hours: int = 0,
         minutes: int = 0,
         seconds: int = 0
     ):
         from core import log_message
+        guild_id, role_id = str(interaction.guild.id), str(role.id)
+        definition = bot.data.expiring_role_defs(guild_id).get(role_id)
+        if not definition:
+            await interaction.response.send_message(f"❌ {role.name} は期限付きロールではありません。`/set_expiring_role` で登録してください", ephemeral=True)
+            return
         total_seconds = parse_duration(days, hours, minutes, seconds)
         if total_seconds < 0:
             await interaction.response.send_message("❌ 期間は0以上で指定してください", ephemeral=True)
             return
-        old_seconds = bot.data.settings["remove_seconds"].get(role, DEFAULT_REMOVE_SECONDS[role])
-        bot.data.settings["remove_seconds"][role] = total_seconds
-        await bot.data.save_all()
+        old_seconds = definition["seconds"]
+        bot.data.set_expiring_role(guild_id, role_id, role.name, total_seconds)
+        await bot.data.save_guild(guild_id)
         embed = await create_embed(
             "✅ デフォルト削除期間設定完了", 0x00ff00,
-            ロール=role,
+            ロール=role.name,
             変更前=format_duration(old_seconds),
             変更後=format_duration(total_seconds)
         )
         await interaction.response.send_message(embed=embed)
-        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が '{role}' 期間を {format_duration(old_seconds)}→{format_duration(total_seconds)}に変更", "info")
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が '{role.name}' 期間を {format_duration(old_seconds)}→{format_duration(total_seconds)}に変更", "info")
+        await _audit(interaction, "set_remove_period", role_id, old=old_seconds, new=total_seconds)
+
+    @bot.tree.command(name="set_expiring_role", description="期限付きロール（一定期間後に自動削除）の登録・更新（管理者限定）")
+    @app_commands.describe(role="対象ロール", days="日", hours="時間", minutes="分", seconds="秒（すべて0の場合は既存の期間、新規は既定の期間）")
+    @admin_required
+    async def set_expiring_role(
+        interaction: discord.Interaction,
+        role: discord.Role,
+        days: int = 0,
+        hours: int = 0,
+        minutes: int = 0,
+        seconds: int = 0
+    ):
+        from core import log_message
+        if role.is_default() or role.managed:
+            await interaction.response.send_message("❌ そのロールは登録できません", ephemeral=True)
+            return
+        total_seconds = parse_duration(days, hours, minutes, seconds)
+        if total_seconds < 0:
+            await interaction.response.send_message("❌ 期間は0以上で指定してください", ephemeral=True)
+            return
+        guild_id, role_id = str(interaction.guild.id), str(role.id)
+        old = bot.data.expiring_role_defs(guild_id).get(role_id)
+        bot.data.set_expiring_role(guild_id, role_id, role.name, total_seconds or None)
+        await bot.data.save_guild(guild_id)
+        new_seconds = bot.data.expiring_role_defs(guild_id)[role_id]["seconds"]
+        embed = await create_embed(
+            "✅ 期限付きロール設定完了", 0x00ff00,
+            ロール=role.name,
+            削除期間=format_duration(new_seconds),
+            変更前=format_duration(old["seconds"]) if old else "新規登録"
+        )
+        if not old:
+            embed.set_footer(text="現在の保持者は次回の同期（/sync_check）で記録されます")
+        await interaction.response.send_message(embed=embed)
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が期限付きロールを設定: {role.name} ({format_duration(new_seconds)})", "info")
+        await _audit(interaction, "set_expiring_role", role_id, name=role.name, old=old["seconds"] if old else None, new=new_seconds)
+
+    @bot.tree.command(name="show_expiring_roles", description="期限付きロールの一覧表示")
+    async def show_expiring_roles(interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        embed = await bot.response_cache.get(
+            (guild_id, "show_expiring_roles"), ["expiring_roles", "role_data"],
+            lambda: _build_expiring_roles_embed(guild_id)
+        )
+        await interaction.response.send_message(embed=embed)
+
+    async def _build_expiring_roles_embed(guild_id):
+        defs = bot.data.expiring_role_defs(guild_id)
+        embed = discord.Embed(title="⏳ 期限付きロール一覧", color=0x0099ff)
+        if not defs:
+            embed.description = "⚠️ 期限付きロールが登録されていません。`/set_expiring_role` で登録してください"
+            return embed, None
+        holders = {}
+        for roles in bot.data.snapshot(guild_id, "role_data").values():
+            for role_id in roles:
+                holders[role_id] = holders.get(role_id, 0) + 1
+        for role_id, definition in defs.items():
+            embed.add_field(
+                name=definition["name"],
+                value=f"<@&{role_id}>\n削除期間: {format_duration(definition['seconds'])}\n記録中: {holders.get(role_id, 0)}人",
+                inline=True
+            )
+        return embed, None
+
+    @bot.tree.command(name="delete_expiring_role", description="期限付きロールの登録解除（管理者限定。履歴は残ります）")
+    @app_commands.describe(role="登録を解除するロール")
+    @admin_required
+    async def delete_expiring_role(interaction: discord.Interaction, role: discord.Role):
+        from core import log_message
+        guild_id, role_id = str(interaction.guild.id), str(role.id)
+        if not bot.data.is_expiring(guild_id, role_id):
+            await interaction.response.send_message(f"❌ {role.name} は期限付きロールではありません", ephemeral=True)
+            return
+        cleared = bot.data.remove_expiring_role(guild_id, role_id)
+        await bot.data.save_guild(guild_id)
+        embed = await create_embed(
+            "✅ 期限付きロール登録解除", 0x00ff00,
+            ロール=role.name,
+            解除した記録=f"{cleared}人"
+        )
+        await interaction.response.send_message(embed=embed)
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が期限付きロールの登録を解除: {role.name}（{cleared}人の記録を削除）", "info")
+        await _audit(interaction, "delete_expiring_role", role_id, name=role.name, cleared=cleared)
 
     @bot.tree.command(name="adjust_remove_time", description="個人のロール削除までの残り時間を増加・減少・セット（管理者限定）")
     @app_commands.describe(
         user="対象ユーザー",
-        role="ロール名",
+        role="期限付きロール",
         action="操作（増加/減少/セット）",
         days="日",
         hours="時間",
         minutes="分",
         seconds="秒"
     )
-    @app_commands.choices(role=[app_commands.Choice(name=r, value=r) for r in ROLES_TO_AUTO_REMOVE])
     @app_commands.choices(action=[
         app_commands.Choice(name="増加", value="add"),
         app_commands.Choice(name="減少", value="sub"),
@@ -379,7 +608,7 @@ def setup_commands(bot):
     async def adjust_remove_time(
         interaction: discord.Interaction,
         user: discord.Member,
-        role: str,
+        role: discord.Role,
         action: str,
         days: int = 0,
         hours: int = 0,
@@ -387,14 +616,17 @@ def setup_commands(bot):
         seconds: int = 0
     ):
         from core import log_message
-        guild_id, user_id = str(interaction.guild.id), str(user.id)
+        guild_id, user_id, role_id = str(interaction.guild.id), str(user.id), str(role.id)
+        if not bot.data.is_expiring(guild_id, role_id):
+            await interaction.response.send_message(f"❌ {role.name} は期限付きロールではありません。", ephemeral=True)
+            return
         role_data = bot.data.role_data.get(guild_id, {}).get(user_id, {})
-        if role not in role_data:
-            await interaction.response.send_message(f"❌ {user.display_name} は現在 {role} を持っていません。", ephemeral=True)
+        if role_id not in role_data:
+            await interaction.response.send_message(f"❌ {user.display_name} は現在 {role.name} を持っていません。", ephemeral=True)
             return
         now = now_jst().timestamp()
-        assigned_ts = role_data[role]
-        remove_seconds = bot.data.get_remove_seconds(guild_id, user_id, role)
+        assigned_ts = role_data[role_id]
+        remove_seconds = bot.data.get_remove_seconds(guild_id, user_id, role_id)
         remain = assigned_ts + remove_seconds - now
         if remain <= 0:
             await interaction.response.send_message(f"❌ 既に削除対象です。", ephemeral=True)
@@ -410,34 +642,50 @@ def setup_commands(bot):
             await interaction.response.send_message("❌ 不正な操作です。", ephemeral=True)
             return
         if new_remain <= 0:
-            removed = bot.data.remove_user_setting(guild_id, user_id, role)
-            await bot.data.save_all()
-            msg = f"✅ {user.display_name} の {role} の個人削除期間設定を削除しデフォルトに戻しました。"
+            removed = bot.data.remove_user_setting(guild_id, user_id, role_id)
+            await bot.data.save_guild(guild_id)
+            msg = f"✅ {user.display_name} の {role.name} の個人削除期間設定を削除しデフォルトに戻しました。"
             await interaction.response.send_message(msg)
-            await log_message(bot, interaction.guild, f"{interaction.user.display_name} が {user.display_name} の {role} の個人削除期間設定を削除", "info")
+            await log_message(bot, interaction.guild, f"{interaction.user.display_name} が {user.display_name} の {role.name} の個人削除期間設定を削除", "info")
+            await _audit(interaction, "adjust_remove_time", user_id, role_id=role_id, action=action, old_remain=remain, new_remain=None)
             return
-        bot.data.set_user_remove_seconds(guild_id, user_id, role, int(now - assigned_ts + new_remain))
-        await bot.data.save_all()
-        msg = f"✅ {user.display_name} の {role} の残り時間を {format_duration(remain)} → {format_duration(new_remain)} に{('増加' if action=='add' else '減少' if action=='sub' else 'セット')}しました。"
+        bot.data.set_user_remove_seconds(guild_id, user_id, role_id, int(now - assigned_ts + new_remain))
+        await bot.data.save_guild(guild_id)
+        msg = f"✅ {user.display_name} の {role.name} の残り時間を {format_duration(remain)} → {format_duration(new_remain)} に{('増加' if action=='add' else '減少' if action=='sub' else 'セット')}しました。"
         await interaction.response.send_message(msg)
-        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が {user.display_name} の {role} の残り時間を {format_duration(remain)} → {format_duration(new_remain)} に{('増加' if action=='add' else '減少' if action=='sub' else 'セット')}", "info")
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が {user.display_name} の {role.name} の残り時間を {format_duration(remain)} → {format_duration(new_remain)} に{('増加' if action=='add' else '減少' if action=='sub' else 'セット')}", "info")
+        await _audit(interaction, "adjust_remove_time", user_id, role_id=role_id, action=action, old_remain=remain, new_remain=new_remain)
 
     @bot.tree.command(name="show_remove_time", description="指定ユーザーの自動削除ロールの残り時間を表示")
     @app_commands.describe(user="対象ユーザー（省略時は自分）")
     async def show_remove_time(interaction: discord.Interaction, user: discord.Member = None):
         user = user or interaction.user
-        guild_id, user_id = str(interaction.guild.id), str(user.id)
-        role_data = bot.data.role_data.get(guild_id, {}).get(user_id, {})
+        guild_id = str(interaction.guild.id)
+        embed = await bot.response_cache.get(
+            (guild_id, "show_remove_time", str(user.id), user.display_name),
+            ["role_data", "user_remove_seconds", "expiring_roles"],
+            lambda: _build_remove_time_embed(guild_id, user)
+        )
+        await interaction.response.send_message(embed=embed)
+
+    async def _build_remove_time_embed(guild_id, user):
+        """残り時間は秒単位で変わるため、最も近い期限までの時間（最大 RESPONSE_CACHE_REMAIN_TTL 秒）を有効期限とする"""
+        from config import RESPONSE_CACHE_REMAIN_TTL
+        user_id = str(user.id)
+        role_data = bot.data.snapshot(guild_id, "role_data").get(user_id, {})
         now = now_jst().timestamp()
         embed = discord.Embed(title=f"⏰ {user.display_name} のロール削除までの残り時間", color=0x0099ff)
+        ttl = None
         found = False
-        for role_name in ROLES_TO_AUTO_REMOVE:
-            if role_name in role_data:
-                assigned_ts = role_data[role_name]
-                remove_seconds = bot.data.get_remove_seconds(guild_id, user_id, role_name)
+        for role_id, definition in bot.data.expiring_role_defs(guild_id).items():
+            role_name = definition["name"]
+            if role_id in role_data:
+                assigned_ts = role_data[role_id]
+                remove_seconds = bot.data.get_remove_seconds(guild_id, user_id, role_id)
                 remain = int(assigned_ts + remove_seconds - now)
                 if remain > 0:
                     embed.add_field(name=role_name, value=f"残り: {format_duration(remain)}", inline=True)
+                    ttl = min(ttl or RESPONSE_CACHE_REMAIN_TTL, remain)
                 else:
                     embed.add_field(name=role_name, value="削除対象（まもなく削除）", inline=True)
                 found = True
@@ -445,27 +693,189 @@ def setup_commands(bot):
                 embed.add_field(name=role_name, value="未付与", inline=True)
         if not found:
             embed.description = "自動削除対象ロールは付与されていません。"
-        await interaction.response.send_message(embed=embed)
+        return embed, ttl
 
-    @bot.tree.command(name="show_role_history", description="指定ユーザーのロール付与履歴表示（注意・警告のみ。理由編集機能付き）")
+    @bot.tree.command(name="upcoming_removals", description="今後の自動削除予定を表示（管理者限定）")
+    @app_commands.describe(
+        role="対象ロール（省略時はすべて）",
+        count="表示件数（最大30）",
+        days="指定日数以内の予定を対象にする（0 の場合は直近の予定）",
+        histogram="件数の分布を表示"
+    )
+    @app_commands.choices(histogram=[
+        app_commands.Choice(name="時間別（24時間）", value="hour"),
+        app_commands.Choice(name="日別", value="day")
+    ])
+    @admin_required
+    async def upcoming_removals(
+        interaction: discord.Interaction,
+        role: discord.Role = None,
+        count: int = 10,
+        days: int = 0,
+        histogram: str = None
+    ):
+        guild_id = str(interaction.guild.id)
+        index = bot.data.expiry_index(guild_id)
+        now = now_jst().timestamp()
+        count = max(1, min(count, 30))
+        role_id = str(role.id) if role else None
+        if days > 0:
+            entries = index.range(now, now + days * 86400, role_id)
+            scope = f"{days}日以内"
+        else:
+            entries = index.next(count, now, role_id)
+            scope = "直近"
+        overdue = index.count_range(float("-inf"), now, role_id)
+        embed = discord.Embed(
+            title=f"📅 自動削除予定（{role.name if role else 'すべて'} / {scope}）",
+            color=0x0099ff
+        )
+        lines = [
+            f"`{timestamp_to_jst(deadline).strftime('%m/%d %H:%M')}` <@{user_id}> {bot.data.role_name(guild_id, entry_role)}（残り {format_duration(deadline - now)}）"
+            for deadline, user_id, entry_role in entries[:count]
+        ]
+        embed.description = "\n".join(lines) if lines else "該当する削除予定はありません。"
+        footer = f"{len(entries)}件中 {len(lines)}件を表示" if days > 0 else f"{len(lines)}件を表示"
+        if overdue:
+            footer += f" / 削除待ち {overdue}件"
+        embed.set_footer(text=footer)
+        if histogram:
+            if histogram == "hour":
+                bucket, buckets = 3600, 24
+                start = now - now % 3600
+                fmt = "%m/%d %H時"
+            else:
+                bucket, buckets = 86400, max(1, min(days or 7, 31))
+                start = now_jst().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+                fmt = "%m/%d"
+            counts = index.histogram(start, bucket, buckets, role_id)
+            peak = max(counts) or 1
+            rows = [
+                f"`{timestamp_to_jst(start + i * bucket).strftime(fmt)}` {'█' * max(1, round(c / peak * 10)) if c else '·'} {c}"
+                for i, c in enumerate(counts)
+            ]
+            embed.add_field(name="件数の分布", value="\n".join(rows)[:1024], inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @bot.tree.command(name="show_role_history", description="指定ユーザーのロール付与履歴表示（期限付きロールのみ。理由編集機能付き）")
     @app_commands.describe(user="履歴を表示したいユーザー（省略時は自分）")
     async def show_role_history(interaction: discord.Interaction, user: discord.Member = None):
         user = user or interaction.user
         guild_id = str(interaction.guild.id)
         user_id = str(user.id)
-        history = bot.data.role_add_history.get(guild_id, {}).get(user_id, {})
-        if not history:
+        if not bot.data.get_history_counts(guild_id, user_id):
             embed = discord.Embed(
-                title=f"📝 {user.display_name} のロール付与履歴（注意・警告のみ）",
+                title=f"📝 {user.display_name} のロール付与履歴（期限付きロールのみ）",
                 description="履歴がありません。",
                 color=0x0099ff
             )
             await interaction.response.send_message(embed=embed)
             return
-        view = RoleHistoryView(guild_id, user_id, user.display_name, history, bot)
+        view = RoleHistoryView(guild_id, user_id, user.display_name, bot)
+        await view.refresh()
         embed = view.create_embed()
         await interaction.response.send_message(embed=embed, view=view)
 
+    @bot.tree.command(name="history_stats", description="期限付きロール履歴の集計とCSV出力（管理者限定）")
+    @app_commands.describe(
+        weeks="週別件数を表示する週数（最大26）",
+        threshold="常習者とみなす回数",
+        window_days="常習者判定の期間（日）",
+        role="常習者判定・段階分析の起点ロール（省略時は1番目の期限付きロール）",
+        next_role="段階分析の次のロール（省略時は2番目の期限付きロール）"
+    )
+    @admin_required
+    async def history_stats(
+        interaction: discord.Interaction,
+        weeks: int = 8,
+        threshold: int = 3,
+        window_days: int = 30,
+        role: discord.Role = None,
+        next_role: discord.Role = None
+    ):
+        from analytics import WEEK_SECONDS, median, weekly_csv, offenders_csv
+        import io
+        guild_id = str(interaction.guild.id)
+        role_ids = list(bot.data.expiring_role_defs(guild_id))
+        if not role_ids:
+            await interaction.response.send_message("❌ 期限付きロールが登録されていません", ephemeral=True)
+            return
+        await interaction.response.defer(thinking=True)
+        weeks = max(1, min(weeks, 26))
+        threshold = max(2, threshold)
+        window_days = max(1, window_days)
+        first = str(role.id) if role else role_ids[0]
+        second = str(next_role.id) if next_role else (role_ids[1] if len(role_ids) > 1 else None)
+        first_name = bot.data.role_name(guild_id, first)
+        role_names = [bot.data.role_name(guild_id, r) for r in role_ids]
+        weekly = await bot.analytics.query(guild_id, "weekly")
+        offenders = await bot.analytics.query(guild_id, "offenders", first, threshold, window_days * 86400)
+        gaps = await bot.analytics.query(guild_id, "gaps", first, second) if second else []
+
+        embed = discord.Embed(title="📊 期限付きロール履歴の集計", color=0x0099ff)
+        this_week = now_jst().replace(hour=0, minute=0, second=0, microsecond=0) - _dt.timedelta(days=now_jst().weekday())
+        week_lines = []
+        for i in range(weeks - 1, -1, -1):
+            start = this_week.timestamp() - i * WEEK_SECONDS
+            counts = weekly.get(start, [0] * len(role_ids))
+            detail = " / ".join(f"{r} {c}" for r, c in zip(role_names, counts))
+            week_lines.append(f"`{timestamp_to_jst(start).strftime('%m/%d')}〜` {detail}")
+        embed.add_field(name=f"週別件数（直近{weeks}週）", value="\n".join(week_lines)[:1024], inline=False)
+
+        if offenders:
+            offender_lines = [
+                f"<@{user_id}> 期間内最大 {peak}回 / 累計 {total}回"
+                for user_id, peak, total in offenders[:10]
+            ]
+            if len(offenders) > 10:
+                offender_lines.append(f"…他 {len(offenders) - 10}人（CSV参照）")
+            offender_value = "\n".join(offender_lines)
+        else:
+            offender_value = "該当者なし"
+        embed.add_field(name=f"{first_name} {threshold}回以上 / {window_days}日以内", value=offender_value[:1024], inline=False)
+
+        if second:
+            gap_median = median(gaps)
+            embed.add_field(
+                name=f"{first_name} → {bot.data.role_name(guild_id, second)} までの期間",
+                value=f"中央値: {format_duration(gap_median)}（{len(gaps)}件）" if gap_median is not None else "データなし",
+                inline=False
+            )
+        files = [
+            discord.File(io.BytesIO(weekly_csv(weekly, role_names)), filename=f"weekly_{guild_id}.csv"),
+            discord.File(io.BytesIO(offenders_csv(offenders)), filename=f"offenders_{guild_id}.csv"),
+        ]
+        await interaction.followup.send(embed=embed, files=files)
+
+    @bot.tree.command(name="export", description="このサーバーのロールデータ・個人設定・履歴をエクスポート（管理者限定）")
+    @app_commands.rename(fmt="format")
+    @app_commands.describe(fmt="出力形式（gzip 圧縮）")
+    @app_commands.choices(fmt=[
+        app_commands.Choice(name="NDJSON", value="ndjson"),
+        app_commands.Choice(name="CSV", value="csv")
+    ])
+    @admin_required
+    async def export(interaction: discord.Interaction, fmt: str = "ndjson"):
+        from core import log_message
+        from export import export_guild
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        guild_id = str(interaction.guild.id)
+        parts, total = await export_guild(bot.data, guild_id, fmt, interaction.guild.filesize_limit)
+        try:
+            if not parts:
+                await interaction.followup.send("ℹ️ エクスポートするデータがありません。", ephemeral=True)
+                return
+            for i, (fp, filename) in enumerate(parts):
+                await interaction.followup.send(
+                    f"📦 エクスポート {i + 1}/{len(parts)}（全{total}件）",
+                    file=discord.File(fp, filename=filename),
+                    ephemeral=True
+                )
+        finally:
+            for fp, _ in parts:
+                fp.close()
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} がデータをエクスポート: {total}件 ({fmt})", "info")
+
     @bot.tree.command(name="sync_check", description="手動同期・チェック実行（管理者限定）")
     @admin_required
     async def sync_check(interaction: discord.Interaction):
@@ -473,18 +883,48 @@ def setup_commands(bot):
         await interaction.response.defer(thinking=True)
         await sync_data_with_reality(bot, interaction.guild)
         removed = await process_role_removal(bot, interaction.guild)
-        await bot.data.save_all()
+        await bot.data.save_guild(str(interaction.guild.id))
         await interaction.followup.send(f"✅ 手動同期完了\n削除されたロール: {removed}個")
         await log_message(bot, interaction.guild, f"{interaction.user.display_name} が手動同期実行: {removed}個削除", "info")
 
+    @bot.tree.command(name="history_compact", description="履歴アーカイブの状況表示・圧縮実行（管理者限定）")
+    @app_commands.describe(execute="True で保持期間を過ぎた履歴をアーカイブへ移動")
+    @admin_required
+    async def history_compact(interaction: discord.Interaction, execute: bool = False):
+        from core import log_message
+        from config import HISTORY_HOT_MONTHS
+        guild_id = str(interaction.guild.id)
+        await interaction.response.defer(thinking=True)
+        moved = 0
+        if execute:
+            async with bot.data.guild_lock(guild_id):
+                moved = await bot.data.archive_history(guild_id)
+            if moved:
+                await bot.data.save_guild(guild_id)
+        stats = bot.data.get_history_stats(guild_id)
+        embed = await create_embed(
+            "🗄️ 履歴アーカイブ状況", 0x0099ff,
+            保持期間=f"直近{HISTORY_HOT_MONTHS}ヶ月",
+            メモリ上の履歴=f"{stats['hot_entries']}件 / {stats['hot_users']}人",
+            アーカイブ済み=f"{stats['archived_entries']}件 / {stats['archived_users']}人",
+            アーカイブサイズ=f"{stats['archive_size'] / 1024:.1f} KB",
+            圧縮対象=f"{stats['pending']}件"
+        )
+        if execute:
+            embed.add_field(name="実行結果", value=f"{moved}件をアーカイブへ移動しました", inline=False)
+        await interaction.followup.send(embed=embed)
+        if execute:
+            await log_message(bot, interaction.guild, f"{interaction.user.display_name} が履歴圧縮を実行: {moved}件をアーカイブへ移動", "info")
+
     @bot.tree.command(name="set_log_channel", description="このチャンネルをログ送信先に設定（管理者限定）")
     @admin_required
     async def set_log_channel(interaction: discord.Interaction):
         from core import log_message
         bot.data.guild_log_channels[str(interaction.guild.id)] = interaction.channel.id
-        await bot.data.save_all()
+        await bot.data.save_guild(str(interaction.guild.id))
         await interaction.response.send_message(f"✅ ログ送信先を {interaction.channel.mention} に設定しました", ephemeral=True)
         await log_message(bot, interaction.guild, f"{interaction.user.display_name} がログ送信先を {interaction.channel.mention} に設定", "info")
+        await _audit(interaction, "set_log_channel", str(interaction.channel.id))
 
     @bot.tree.command(name="message", description="指定したチャンネルにメッセージを送信")
     @app_commands.describe(
@@ -518,7 +958,7 @@ def setup_commands(bot):
             )
             return
         try:
-            await target_channel.send(content)
+            await bot.api.run(message_route(target_channel), target_channel.send, content, priority=INTERACTIVE)
             await interaction.response.send_message(
                 f"✅ メッセージを {target_channel.mention} に送信しました", ephemeral=True
             )
@@ -552,7 +992,7 @@ def setup_commands(bot):
             "required_role_name": required_role.name if required_role else "（誰でも実行可能）"
         }
         
-        await bot.data.save_all()
+        await bot.data.save_guild(guild_id)
         
         old_info = f"メンション: {old_config.get('mention_role_name', 'なし')}, 権限: {old_config.get('required_role_name', 'なし')}" if old_config else "ルールなし"
         
@@ -569,6 +1009,7 @@ def setup_commands(bot):
             f"{interaction.user.display_name} がメンション設定を変更: {mention_role.name} / 権限: {required_role.name if required_role else '誰でも'}",
             "info"
         )
+        await _audit(interaction, "set_mention_role", str(mention_role.id), old=old_config, new=bot.data.mention_config[guild_id])
 
     @bot.tree.command(name="mention", description="「勧誘歓迎」ロールをメンション")
     async def mention(interaction: discord.Interaction):
@@ -606,7 +1047,9 @@ def setup_commands(bot):
             
             # チャンネルに直接メッセージ送信（メンション通知がトリガーされる）
             mention_message = f"{interaction.user.display_name} が {mention_role.mention} をメンションしました(´・ω・｀)"
-            await interaction.channel.send(mention_message)
+            await bot.api.run(
+                message_route(interaction.channel), interaction.channel.send, mention_message, priority=INTERACTIVE
+            )
             
             # ログ記録
             await log_message(
@@ -624,21 +1067,42 @@ def setup_commands(bot):
 
     @bot.tree.command(name="help", description="コマンド一覧表示")
     async def help_command(interaction: discord.Interaction):
+        embed = await bot.response_cache.get((None, "help"), [], _build_help_embed)
+        await interaction.response.send_message(embed=embed)
+
+    async def _build_help_embed():
         embed = discord.Embed(title="🤖 コマンド一覧", color=0x0099ff)
         commands_info = {
-            "/giveall": "全員にロール付与（管理者限定）",
+            "/giveall": "全員にロール付与（管理者限定。ジョブとして実行）",
+            "/revokeall": "全員からロール削除（管理者限定。ジョブとして実行）",
+            "/bulk_reason": "期限付きロール履歴の理由を一括編集（管理者限定。ジョブとして実行）",
+            "/jobs": "一括処理ジョブの一覧・進捗表示",
+            "/job_pause": "ジョブの一時停止（管理者限定）",
+            "/job_resume": "ジョブの再開（管理者限定）",
+            "/job_cancel": "ジョブのキャンセル（管理者限定）",
             "/test_add": "自分にロール付与（テスト用）",
             "/status": "Bot状態表示",
-            "/set_remove_period": "デフォルト削除期間設定（管理者限定）",
+            "/set_expiring_role": "期限付きロールの登録・更新（管理者限定）",
+            "/show_expiring_roles": "期限付きロールの一覧表示",
+            "/delete_expiring_role": "期限付きロールの登録解除（管理者限定）",
+            "/set_remove_period": "期限付きロールのデフォルト削除期間設定（管理者限定）",
             "/adjust_remove_time": "個人のロール削除までの残り時間を増加・減少・セット（管理者限定）",
             "/show_remove_time": "自動削除ロールの残り時間を表示",
-            "/show_role_history": "ロール付与履歴表示（注意・警告のみ。理由編集機能付き）",
+            "/upcoming_removals": "今後の自動削除予定・件数分布を表示（管理者限定）",
+            "/show_role_history": "ロール付与履歴表示（期限付きロールのみ。理由編集機能付き）",
+            "/history_stats": "期限付きロール履歴の集計とCSV出力（管理者限定）",
+            "/export": "ロールデータ・履歴を NDJSON / CSV でエクスポート（管理者限定）",
             "/sync_check": "手動同期・チェック（管理者限定）",
+            "/history_compact": "履歴アーカイブの状況表示・圧縮実行（管理者限定）",
             "/set_log_channel": "このチャンネルをログ送信先に設定（管理者限定）",
             "/set_tenure_rule": "テニュアルール設定（管理者限定）",
             "/show_tenure_rules": "テニュアルール一覧表示",
             "/delete_tenure_rule": "テニュアルール削除（管理者限定）",
-            "/restore_backup": "バックアップから復元（管理者限定）",
+            "/set_escalation_rule": "エスカレーションルール設定（管理者限定）",
+            "/show_escalation_rules": "エスカレーションルール一覧表示",
+            "/delete_escalation_rule": "エスカレーションルール削除（管理者限定）",
+            "/restore_backup": "バックアップから復元。ユーザー・ロール単位も可（管理者限定）",
+            "/audit": "管理操作の監査ログを実行者・操作・期間で検索（管理者限定）",
             "/set_mention_role": "メンション設定（管理者限定）",
             "/mention": "設定ロールをメンション",
             "/message": "指定したチャンネルにメッセージ送信"
@@ -648,19 +1112,21 @@ def setup_commands(bot):
         embed.add_field(
             name="⚠️ 重要事項",
             value=(
-                "• 自動削除対象: " + ", ".join(ROLES_TO_AUTO_REMOVE) +
+                "• 自動削除対象: サーバーごとに `/set_expiring_role` で登録（ロール名を変更しても追跡を継続）"
                 "\n• 不定期起動対応"
-                "\n• ロール付与履歴確認・理由編集可能（注意・警告のみ）"
+                "\n• ロール付与履歴確認・理由編集可能（期限付きロールのみ）"
                 "\n• ページネーション対応（各ロール5件ずつ表示）"
                 "\n• **テニュアルール機能: 特定ロール付与時に参加期間をチェック**"
                 "\n• `/set_tenure_rule` でトリガーロール→対象ロール マッピング設定可能"
                 "\n• 例: 'チェック' ロール付与時、参加90日以上なら 'メンバー' ロール自動付与"
+                "\n• **エスカレーション機能: 例: 30日以内に '注意' 3回で '警告' を自動付与**"
                 "\n• ログ送信先チャンネルをサーバーごとに設定可能"
+                "\n• 一括付与・一括削除・理由の一括編集はジョブとして実行（再起動後も続きから再開、`/jobs` で進捗確認）"
                 "\n• **メンション機能: `/set_mention_role` でメンション対象ロール設定後、`/mention` で実行**"
             ),
             inline=False
         )
-        await interaction.response.send_message(embed=embed)
+        return embed, None
 
     @bot.tree.command(name="set_tenure_rule", description="トリガーロール付与時のテニュアベース自動付与ルール設定（管理者限定）")
     @app_commands.describe(
@@ -690,7 +1156,7 @@ def setup_commands(bot):
             "tenure_days": tenure_days
         }
         
-        await bot.data.save_all()
+        await bot.data.save_guild(guild_id)
         
         old_info = f"対象役割: {old_rule['target_role']}, 期間: {old_rule['tenure_days']}日" if old_rule else "ルールなし"
         
@@ -708,10 +1174,17 @@ def setup_commands(bot):
             f"{interaction.user.display_name} が テニュアルールを設定: {trigger_role.name} → {target_role.name} ({tenure_days}日以上)",
             "info"
         )
+        await _audit(interaction, "set_tenure_rule", trigger_role.name, old=old_rule, new=bot.data.tenure_rules[guild_id][trigger_role.name])
 
     @bot.tree.command(name="show_tenure_rules", description="設定されているテニュアルール一覧表示")
     async def show_tenure_rules(interaction: discord.Interaction):
         guild_id = str(interaction.guild.id)
+        embed = await bot.response_cache.get(
+            (guild_id, "show_tenure_rules"), ["tenure_rules"], lambda: _build_tenure_rules_embed(guild_id)
+        )
+        await interaction.response.send_message(embed=embed)
+
+    async def _build_tenure_rules_embed(guild_id):
         rules = bot.data.tenure_rules.get(guild_id, {})
         
         embed = discord.Embed(
@@ -722,8 +1195,7 @@ def setup_commands(bot):
         
         if not rules:
             embed.description += "\n\n⚠️ ルール設定がありません"
-            await interaction.response.send_message(embed=embed)
-            return
+            return embed, None
         
         for trigger_role, rule in rules.items():
             target_role = rule.get("target_role", "不明")
@@ -733,8 +1205,7 @@ def setup_commands(bot):
                 value=f"→ **{target_role}** (参加{tenure_days}日以上で自動付与)",
                 inline=False
             )
-        
-        await interaction.response.send_message(embed=embed)
+        return embed, None
 
     @bot.tree.command(name="delete_tenure_rule", description="テニュアルールを削除（管理者限定）")
     @app_commands.describe(trigger_role="削除するトリガー役割")
@@ -757,7 +1228,7 @@ def setup_commands(bot):
         if not bot.data.tenure_rules[guild_id]:
             del bot.data.tenure_rules[guild_id]
         
-        await bot.data.save_all()
+        await bot.data.save_guild(guild_id)
         
         embed = await create_embed(
             "✅ テニュアルール削除完了", 0x00ff00,
@@ -772,52 +1243,291 @@ def setup_commands(bot):
             f"{interaction.user.display_name} が テニュアルール削除: {trigger_role.name}",
             "info"
         )
+        await _audit(interaction, "delete_tenure_rule", trigger_role.name, old=old_rule)
+
+    @bot.tree.command(name="set_escalation_rule", description="エスカレーションルール設定（管理者限定）")
+    @app_commands.describe(
+        source_role="回数を数える期限付きロール",
+        count="付与する回数",
+        window_days="回数を数える期間（日）",
+        target_role="規定回数に達したときに付与するロール",
+        target_days="付与したロールを自動削除するまでの日数（0 の場合は対象ロールの既定の期間）"
+    )
+    @admin_required
+    async def set_escalation_rule(
+        interaction: discord.Interaction,
+        source_role: discord.Role,
+        count: int,
+        window_days: int,
+        target_role: discord.Role,
+        target_days: int = 0
+    ):
+        from core import log_message
+        from config import HISTORY_HOT_SECONDS, HISTORY_HOT_MONTHS
+        guild_id = str(interaction.guild.id)
+        source_id, target_id = str(source_role.id), str(target_role.id)
+        if not bot.data.is_expiring(guild_id, source_id):
+            await interaction.response.send_message(f"❌ {source_role.name} は期限付きロールではありません（履歴が記録されません）", ephemeral=True)
+            return
+        if source_id == target_id:
+            await interaction.response.send_message("❌ 元ロールと付与ロールに同じロールは指定できません", ephemeral=True)
+            return
+        if count < 2 or window_days < 1 or target_days < 0:
+            await interaction.response.send_message("❌ 回数は2以上、期間は1日以上で指定してください", ephemeral=True)
+            return
+        if window_days * 86400 > HISTORY_HOT_SECONDS:
+            await interaction.response.send_message(f"❌ 期間は履歴の保持期間（{HISTORY_HOT_MONTHS}ヶ月）以内で指定してください", ephemeral=True)
+            return
+        if target_days and not bot.data.is_expiring(guild_id, target_id):
+            await interaction.response.send_message(f"❌ 自動削除日数を指定する場合、{target_role.name} を期限付きロールに登録してください", ephemeral=True)
+            return
+        if target_role >= interaction.guild.me.top_role:
+            await interaction.response.send_message("❌ そのロールは付与できません", ephemeral=True)
+            return
+
+        old_rule = bot.data.escalation_rules.get(guild_id, {}).get(source_id)
+        bot.data.escalation_rules.setdefault(guild_id, {})[source_id] = {
+            "count": count,
+            "window_seconds": window_days * 86400,
+            "target_role": target_id,
+            "target_seconds": target_days * 86400 or None
+        }
+        await bot.data.save_guild(guild_id)
+
+        embed = await create_embed(
+            "✅ エスカレーションルール設定完了", 0x00ff00,
+            条件=f"{window_days}日以内に {source_role.name} {count}回",
+            付与ロール=target_role.name,
+            自動削除=f"{target_days}日後" if target_days else "対象ロールの設定に従う",
+            変更前=_escalation_text(guild_id, source_id, old_rule) if old_rule else "ルールなし"
+        )
+        await interaction.response.send_message(embed=embed)
+        await log_message(
+            bot, interaction.guild,
+            f"{interaction.user.display_name} が エスカレーションルールを設定: {window_days}日以内に {source_role.name} {count}回 → {target_role.name}",
+            "info"
+        )
+        await _audit(interaction, "set_escalation_rule", source_id, old=old_rule, new=bot.data.escalation_rules[guild_id][source_id])
+
+    def _escalation_text(guild_id, source_id, rule):
+        target = bot.data.role_name(guild_id, rule["target_role"])
+        if target == rule["target_role"]:
+            target = f"<@&{target}>"  # 期限付きでないロールは名前を保持していないためメンションで表示
+        text = f"{format_duration(rule['window_seconds'])}以内に {bot.data.role_name(guild_id, source_id)} {rule['count']}回 → **{target}**"
+        if rule.get("target_seconds"):
+            text += f"（{format_duration(rule['target_seconds'])}後に自動削除）"
+        return text
+
+    @bot.tree.command(name="show_escalation_rules", description="エスカレーションルール一覧表示")
+    async def show_escalation_rules(interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        embed = await bot.response_cache.get(
+            (guild_id, "show_escalation_rules"), ["escalation_rules", "expiring_roles"],
+            lambda: _build_escalation_rules_embed(guild_id)
+        )
+        await interaction.response.send_message(embed=embed)
 
-    @bot.tree.command(name="restore_backup", description="バックアップからデータ復元（管理者限定）")
-    @app_commands.describe(data_type="復元するデータ種別", timestamp="バックアップのタイムスタンプ (YYYYMMDD_HHMMSS)")
+    async def _build_escalation_rules_embed(guild_id):
+        rules = bot.data.escalation_rules.get(guild_id, {})
+        embed = discord.Embed(
+            title="📈 エスカレーションルール一覧",
+            color=0x0099ff,
+            description="期間内に規定回数付与されたとき、別のロールを自動付与"
+        )
+        if not rules:
+            embed.description += "\n\n⚠️ ルール設定がありません"
+            return embed, None
+        for source_id, rule in rules.items():
+            embed.add_field(
+                name=f"🔺 {bot.data.role_name(guild_id, source_id)}",
+                value=_escalation_text(guild_id, source_id, rule),
+                inline=False
+            )
+        return embed, None
+
+    @bot.tree.command(name="delete_escalation_rule", description="エスカレーションルールを削除（管理者限定）")
+    @app_commands.describe(source_role="削除するルールの元ロール")
+    @admin_required
+    async def delete_escalation_rule(interaction: discord.Interaction, source_role: discord.Role):
+        from core import log_message
+        guild_id, source_id = str(interaction.guild.id), str(source_role.id)
+        rules = bot.data.escalation_rules.get(guild_id, {})
+        if source_id not in rules:
+            await interaction.response.send_message(
+                f"❌ '{source_role.name}' のエスカレーションルール設定が見つかりません",
+                ephemeral=True
+            )
+            return
+        old_rule = rules.pop(source_id)
+        if not rules:
+            del bot.data.escalation_rules[guild_id]
+        await bot.data.save_guild(guild_id)
+        bot.escalation.forget(guild_id)
+        embed = await create_embed(
+            "✅ エスカレーションルール削除完了", 0x00ff00,
+            削除したルール=_escalation_text(guild_id, source_id, old_rule)
+        )
+        await interaction.response.send_message(embed=embed)
+        await log_message(bot, interaction.guild, f"{interaction.user.display_name} が エスカレーションルール削除: {source_role.name}", "info")
+        await _audit(interaction, "delete_escalation_rule", source_id, old=old_rule)
+
+    @bot.tree.command(name="restore_backup", description="このサーバーのデータをバックアップから復元（管理者限定）")
+    @app_commands.describe(
+        data_type="復元するデータ種別",
+        timestamp="バックアップのタイムスタンプ (YYYYMMDD_HHMMSS)",
+        user="このユーザーの分のみ復元（roles_data / role_history / settings）",
+        role="このロールの分のみ復元（roles_data / role_history / settings / expiring_roles / escalation_rules）"
+    )
     @app_commands.choices(data_type=[
         app_commands.Choice(name="roles_data", value="roles_data"),
         app_commands.Choice(name="settings", value="settings"),
         app_commands.Choice(name="role_history", value="role_history"),
         app_commands.Choice(name="log_channel", value="log_channel"),
         app_commands.Choice(name="tenure_rules", value="tenure_rules"),
+        app_commands.Choice(name="mention_config", value="mention_config"),
+        app_commands.Choice(name="expiring_roles", value="expiring_roles"),
+        app_commands.Choice(name="escalation_rules", value="escalation_rules"),
     ])
     @admin_required
-    async def restore_backup(interaction: discord.Interaction, data_type: str, timestamp: str):
-        from core import log_message
-        import shutil
+    async def restore_backup(interaction: discord.Interaction, data_type: str, timestamp: str,
+                             user: discord.User = None, role: discord.Role = None):
+        from config import RESTORE_PREVIEW_LINES, RESTORE_CONFIRM_TIMEOUT
+        from restore import RestorePlan, scope_supported
         await interaction.response.defer(thinking=True)
         if not _validate_timestamp_format(timestamp):
             await interaction.followup.send("❌ タイムスタンプ形式が不正です。YYYYMMDD_HHMMSS の形式で指定してください。", ephemeral=True)
             return
+        user_id, role_id = (str(user.id) if user else None), (str(role.id) if role else None)
+        if not scope_supported(data_type, user_id, role_id):
+            await interaction.followup.send(f"❌ {data_type} はユーザー・ロールを指定した復元に対応していません", ephemeral=True)
+            return
 
-        backup_filename = _compose_backup_filename(data_type, timestamp)
-        backup_path = os.path.join(BACKUP_DIR, backup_filename)
+        guild_id = str(interaction.guild.id)
+        backup_path = bot.data.backup_path(guild_id, data_type, timestamp)
+        backup_filename = os.path.basename(backup_path)
         if not os.path.exists(backup_path):
             await interaction.followup.send(f"❌ 指定されたバックアップが見つかりません: {backup_filename}", ephemeral=True)
             return
 
-        target_file = _data_type_to_file(data_type)
-        if not target_file:
-            await interaction.followup.send("❌ 不正なデータ種別です。", ephemeral=True)
+        try:
+            plan = await asyncio.to_thread(RestorePlan(data_type, backup_path, user_id, role_id).load)
+        except Exception as e:
+            logger.error(f"Restore backup failed: {e}")
+            await interaction.followup.send(f"❌ バックアップを読み込めませんでした: {e}", ephemeral=True)
+            return
+        changes = bot.data.preview_restore(guild_id, plan)
+        scope = _restore_scope_text(user, role)
+        if not changes:
+            await interaction.followup.send(f"ℹ️ {data_type}（{scope}）は {backup_filename} と差分がありません")
             return
 
-        try:
-            os.makedirs(BACKUP_DIR, exist_ok=True)
-            pre_backup = _backup_current_file_to_dir(target_file, backup_filename.split('_')[0] + "_pre_")
-            shutil.copy2(backup_path, target_file)
-            post_backup = _backup_current_file_to_dir(target_file, backup_filename.split('_')[0] + "_restored_")
-            bot.data.load_all()
-            await interaction.followup.send(
-                f"✅ 復元完了: {data_type}\n"
+        embed = discord.Embed(
+            title=f"🗂️ 復元プレビュー: {data_type}（{scope}）",
+            color=0xffaa00,
+            description="\n".join(_restore_change_line(guild_id, data_type, c) for c in changes[:RESTORE_PREVIEW_LINES])[:4000]
+        )
+        if len(changes) > RESTORE_PREVIEW_LINES:
+            embed.description += f"\n…ほか {len(changes) - RESTORE_PREVIEW_LINES}件"
+        embed.set_footer(text=f"{backup_filename} ・ 変更 {len(changes)}件（範囲外のデータは変更されません）")
+
+        async def apply(button_interaction):
+            from core import log_message
+            try:
+                applied, pre_backup = await bot.data.restore_guild_store(guild_id, plan)
+            except Exception as e:
+                logger.error(f"Restore backup failed: {e}")
+                await button_interaction.followup.send(f"❌ 復元に失敗しました: {e}", ephemeral=True)
+                return
+            if data_type == "escalation_rules":
+                bot.escalation.forget(guild_id)
+            pre_name = os.path.basename(pre_backup) if pre_backup else None
+            await button_interaction.followup.send(
+                f"✅ 復元完了: {data_type}（{scope}）{len(applied)}件の変更\n"
                 f"指定バックアップ: {backup_filename}\n"
-                f"復元前バックアップ: {os.path.basename(pre_backup) if pre_backup else 'なし'}\n"
-                f"復元後バックアップ: {os.path.basename(post_backup) if post_backup else 'なし'}"
+                f"復元前バックアップ: {pre_name or 'なし'}"
             )
-            await log_message(bot, interaction.guild, f"{interaction.user.display_name} がバックアップから復元: {data_type} ← {backup_filename}", "info")
-        except Exception as e:
-            logger.error(f"Restore backup failed: {e}")
-            await interaction.followup.send(f"❌ 復元に失敗しました: {e}", ephemeral=True)
+            await log_message(
+                bot, interaction.guild,
+                f"{interaction.user.display_name} がバックアップから復元: {data_type}（{scope}）← {backup_filename}", "info"
+            )
+            await _audit(
+                interaction, "restore_backup", data_type,
+                backup=backup_filename, pre_backup=pre_name, user_id=user_id, role_id=role_id, changes=len(applied)
+            )
+
+        view = RestoreConfirmView(interaction.user.id, apply, RESTORE_CONFIRM_TIMEOUT)
+        await interaction.followup.send(embed=embed, view=view)
+
+    def _restore_scope_text(user, role):
+        parts = [f"ユーザー: {user.display_name}" if user else None, f"ロール: {role.name}" if role else None]
+        return "、".join(p for p in parts if p) or "サーバー全体"
+
+    def _restore_change_line(guild_id, kind, change):
+        key, sub, old, new = change
+        mark = "➕ 追加" if old is None else "➖ 削除" if new is None else "✏️ 変更"
+        if key is None:
+            target = "全体"
+        elif kind in ("roles_data", "role_history", "settings"):
+            target = f"<@{key}>" + (f" {bot.data.role_name(guild_id, sub)}" if sub is not None else "")
+        elif kind in ("expiring_roles", "escalation_rules"):
+            target = bot.data.role_name(guild_id, key)
+        else:
+            target = key
+        return f"{mark} {target}: {_restore_value_text(kind, old)} → {_restore_value_text(kind, new)}"
+
+    def _restore_value_text(kind, value):
+        if value is None:
+            return "なし"
+        if isinstance(value, list):
+            return f"{len(value)}件"
+        if isinstance(value, dict):
+            return f"{len(value)}項目"
+        if kind == "roles_data":
+            return timestamp_to_jst(value).strftime('%Y/%m/%d %H:%M')
+        if kind == "settings":
+            return format_duration(value)
+        return str(value)[:50]
+
+    async def _audit(interaction, action, target=None, **details):
+        """管理操作を監査ログへ記録する"""
+        await bot.audit.record(interaction.guild.id, interaction.user, action, target, **details)
+
+    @bot.tree.command(name="audit", description="管理操作の監査ログを検索（管理者限定）")
+    @app_commands.describe(
+        user="実行者で絞り込み",
+        action="操作の種類で絞り込み",
+        days="直近何日分を対象にするか（省略時は全期間）",
+        page="ページ番号"
+    )
+    @app_commands.choices(action=[app_commands.Choice(name=label, value=key) for key, label in AUDIT_ACTIONS.items()])
+    @admin_required
+    async def audit(interaction: discord.Interaction, user: discord.Member = None, action: str = None, days: int = None, page: int = 1):
+        from config import AUDIT_PAGE_SIZE
+        page = max(1, page)
+        since = now_jst().timestamp() - days * 86400 if days else None
+        entries, total = await bot.audit.query(
+            interaction.guild.id, user.id if user else None, action, since,
+            None, (page - 1) * AUDIT_PAGE_SIZE, AUDIT_PAGE_SIZE
+        )
+        total_pages = max(1, -(-total // AUDIT_PAGE_SIZE))
+        embed = discord.Embed(title="🔎 監査ログ", color=0x0099ff)
+        if not entries:
+            embed.description = "該当する記録はありません"
+        else:
+            embed.description = "\n".join(_audit_line(interaction.guild, e) for e in entries)[:4000]
+        embed.set_footer(text=f"ページ {page}/{total_pages}（全 {total}件）")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    def _audit_line(guild, entry):
+        when = timestamp_to_jst(entry["ts"]).strftime('%Y/%m/%d %H:%M')
+        actor = entry.get("actor_name") or entry["actor"]
+        label = AUDIT_ACTIONS.get(entry["action"], entry["action"])
+        target = entry.get("target")
+        if target and target.isdigit():
+            member = guild.get_member(int(target))
+            target = member.display_name if member else bot.data.role_name(str(guild.id), target)
+        details = ", ".join(f"{k}={v}" for k, v in entry.get("details", {}).items() if v not in (None, ""))
+        return f"`{when}` **{actor}** {label}" + (f" [{target}]" if target else "") + (f"\n　{details[:200]}" if details else "")
 
 def setup_command_error_handler(bot):
     """コマンドエラーハンドラーを登録"""
@@ -4,30 +4,131 @@ from datetime import timezone, timedelta
 DEBUG = False
 
 # ファイルパス
-DATA_FILE = "roles_data.json"
 SETTINGS_FILE = "bot_settings_debug.json" if DEBUG else "bot_settings.json"
+BACKUP_DIR = "backup"
+
+# ギルド別データ（data/guilds/<guild_id>/*.json とマニフェスト）
+DATA_DIR = "data"
+GUILD_DATA_DIR = DATA_DIR + "/guilds"
+MANIFEST_FILE = DATA_DIR + "/manifest.json"
+
+# ロール保持者スナップショット（再起動時に差分のみ照合するためのもの）
+HOLDER_SNAPSHOT_DIR = DATA_DIR + "/holders"
+HOLDER_SNAPSHOT_INTERVAL = 300
+HOLDER_SNAPSHOT_MAX_AGE = 24 * 3600
+# 起動時に確認する監査ログ件数の上限（超えた場合は全体同期）
+WARM_START_MAX_AUDIT_ENTRIES = 2000
+
+# ギルド別ストアのファイル形式（"pretty" / "compact" / "orjson" / "binary"）。種別ごとに STORE_FORMATS で上書きできる。
+# "binary" は role_history のみ対応（手作業で編集する場合は JSON 形式にすること）。
+# 読み込み時は形式を自動判別するため、変更後も既存のファイルはそのまま読める
+STORE_FORMAT_DEFAULT = "compact"
+STORE_FORMATS = {}
+
+# 旧形式（全ギルド共通ファイル）のパス。マニフェストが無い場合に一度だけギルド別へ移行する
+DATA_FILE = "roles_data.json"
 ROLE_HISTORY_FILE = "role_add_history.json"
 LOG_CHANNEL_FILE = "log_channel_settings.json"
 TENURE_RULES_FILE = "tenure_role_rules.json"
-BACKUP_DIR = "backup"
 
 # バックアップ設定
 BACKUP_KEEP_GENERATIONS = 20
 
+# 履歴保持設定（直近 N ヶ月をメモリに保持し、それ以前はアーカイブへ移動）
+HISTORY_HOT_MONTHS = 6
+HISTORY_HOT_SECONDS = HISTORY_HOT_MONTHS * 30 * 86400
+HISTORY_ARCHIVE_DIR = "history_archive"
+HISTORY_ARCHIVE_CACHE_GUILDS = 4
+
+# ログ設定（LOG_ROTATE_WHEN を "midnight" 等にすると時間単位、None ならサイズ単位でローテーション）
+LOG_FILE = "bot.log"
+LOG_FORMAT = "text"  # "text" または "json"（JSON Lines）
+LOG_ROTATE_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = None
+LOG_BACKUP_COUNT = 10
+
 # タイムゾーン
 JST = timezone(timedelta(hours=9))
 
 # ポーリング間隔（秒）
 CHECK_INTERVAL = 10 if DEBUG else 600
+# 整合性チェックでギルド全体を一巡する周期（秒）。SWEEP_TICK_INTERVAL ごとに一部ずつ照合する
 SYNC_INTERVAL = 15 if DEBUG else 3600
+SWEEP_TICK_INTERVAL = 5 if DEBUG else 30
+# データファイルの外部変更を確認する間隔（秒）
+WATCH_INTERVAL = 2 if DEBUG else 5
 
-# バッチ処理設定
+# 省メモリモード（大規模ギルド向け）。メンバーキャッシュを対象ロールの保持者と記録済みユーザーに限定し、
+# 全体同期・一括付与はメンバーを HTTP で順に取得して処理する
+LOW_MEMORY_MODE = False
+
+# 整合性チェックの1回あたりの上限（照合人数・処理時間）と、
+# 記録が変わったユーザーを優先して照合する人数（変更記録はギルドごとに SWEEP_RECENT_MAX 人まで保持）
+SWEEP_MAX_MEMBERS_PER_TICK = 2000
+SWEEP_MAX_TICK_SECONDS = 0.25
+SWEEP_CHUNK_SIZE = 200
+SWEEP_RECENT_PER_TICK = 200
+SWEEP_RECENT_MAX = 10000
+
+# 管理操作の監査ログ（追記専用のセグメントファイル。サイズまたは期間を超えると次のセグメントへ切り替え）
+AUDIT_DIR = DATA_DIR + "/audit"
+AUDIT_SEGMENT_BYTES = 4 * 1024 * 1024
+AUDIT_SEGMENT_SECONDS = 30 * 86400
+AUDIT_PAGE_SIZE = 10
+
+# バックアップからの復元で、確認前に表示する変更箇所の件数
+RESTORE_PREVIEW_LINES = 15
+# 復元の確認ボタンの有効期間（秒）
+RESTORE_CONFIRM_TIMEOUT = 120
+
+# バッチ処理設定（一括付与の進捗表示・同時実行の単位）
 BATCH_SIZE = 20 if DEBUG else 50
-API_DELAY = 0.5 if DEBUG else 0.2
 
-# ロール設定
+# 一括処理ジョブ設定（data/jobs/<id>.json に進捗を記録し、再起動後に続きから再開する）
+JOB_DIR = DATA_DIR + "/jobs"
+JOB_BATCH_SIZE = BATCH_SIZE
+# 同じギルドで同時に実行するジョブ数（残りは待機）
+JOB_MAX_PER_GUILD = 1
+# 終了したジョブの記録を残す件数
+JOB_KEEP_FINISHED = 50
+
+# Discord API スケジューラ設定（ルートごとの送信間隔は観測したレート制限に応じて自動調整）
+API_WORKERS = 4
+API_MIN_INTERVAL = 0.05
+API_MAX_INTERVAL = 10.0
+API_SLOW_CALL_SECONDS = 1.0
+API_MAX_RETRIES = 3
+# 低優先度（ログ送信）が後から登録されたバックグラウンドの呼び出しに追い越される最大の時間（秒）
+API_LOW_PRIORITY_DELAY = 30.0
+
+# エクスポート設定（1ファイルあたりの上限サイズと、イベントループへ制御を返す間隔）
+EXPORT_MAX_PART_BYTES = 8 * 1024 * 1024
+EXPORT_YIELD_EVERY = 500
+
+# メンバー更新イベント（GUILD_MEMBER_UPDATE）の後続処理キュー設定
+EVENT_QUEUE_WORKERS = 4
+EVENT_QUEUE_MAX_PER_GUILD = 5000
+EVENT_QUEUE_BATCH_SIZE = 100
+
+# 読み取り専用コマンドの応答キャッシュ設定（残り時間・統計を含む応答の有効期限は秒）
+RESPONSE_CACHE_MAX_ENTRIES = 512
+RESPONSE_CACHE_STATUS_TTL = 5
+RESPONSE_CACHE_REMAIN_TTL = 5
+
+# 読み取り専用の管理用 HTTP API（ダッシュボード向け。既定では無効、有効時も localhost でのみ待ち受ける）
+ADMIN_API_ENABLED = False
+ADMIN_API_HOST = "127.0.0.1"
+ADMIN_API_PORT = 8765
+# 一覧の1ページあたりの件数（既定・上限）
+ADMIN_API_PAGE_SIZE = 100
+ADMIN_API_MAX_PAGE_SIZE = 1000
+
+# ロール設定（期限付きロールはギルドごとに /set_expiring_role でロールID 単位に登録する）
+# 新規の期限付きロールの既定の削除期間
+DEFAULT_EXPIRING_ROLE_SECONDS = 15 if DEBUG else 90 * 86400
+# ロール定義の無いギルドで初期登録するロール名と削除期間（ロール名で記録していた時期のデータの移行にも使用）
 ROLES_TO_AUTO_REMOVE = ["注意", "警告"]
-DEFAULT_REMOVE_SECONDS = {r: (15 if DEBUG else 90 * 86400) for r in ROLES_TO_AUTO_REMOVE}
+DEFAULT_REMOVE_SECONDS = {r: DEFAULT_EXPIRING_ROLE_SECONDS for r in ROLES_TO_AUTO_REMOVE}
 
 # メンション設定ファイル
 MENTION_CONFIG_FILE = "mention_config.json"
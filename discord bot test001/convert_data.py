@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""ギルド別データファイルの形式を一括で変換するスクリプト（Bot 停止中に実行すること）。
+
+形式の指定が無い場合は config.py の STORE_FORMAT_DEFAULT / STORE_FORMATS に合わせる。
+binary は role_history のみ対応のため、他の種別は compact で書き込む。
+古いスキーマのファイルは変換と同時に現在のスキーマへ移行する。
+
+    python convert_data.py [--format pretty|compact|orjson|binary] [--kind 種別 ...] [--backups] [--dry-run]
+"""
+import argparse
+import glob
+import os
+import sys
+
+def _targets(kinds, include_backups):
+    from config import BACKUP_DIR
+    from storage import GUILD_STORE_KINDS, guild_dir
+    kinds = kinds or list(GUILD_STORE_KINDS.values())
+    for kind in kinds:
+        for path in glob.glob(os.path.join(guild_dir("*"), f"{kind}.json")):
+            yield kind, path
+        if include_backups:
+            for path in glob.glob(os.path.join(BACKUP_DIR, "*", f"{kind}_*.json")):
+                yield kind, path
+
+def main(argv):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    from serializers import FORMATS, BINARY_KINDS, BINARY_MAGIC, detect, format_for
+    from storage import read_section, write_section
+    parser = argparse.ArgumentParser(description="データファイルの形式を変換する")
+    parser.add_argument("--format", choices=FORMATS, help="変換後の形式（省略時は config.py の設定）")
+    parser.add_argument("--kind", action="append", help="対象の種別（複数指定可。省略時はすべて）")
+    parser.add_argument("--backups", action="store_true", help="バックアップも変換する")
+    parser.add_argument("--dry-run", action="store_true", help="変換対象の表示のみ")
+    args = parser.parse_args(argv)
+
+    totals = {}
+    for kind, path in _targets(args.kind, args.backups):
+        fmt = args.format or format_for(kind)
+        if fmt == "binary" and kind not in BINARY_KINDS:
+            fmt = "compact"
+        with open(path, "rb") as f:
+            current = detect(f.read(len(BINARY_MAGIC)))
+        before = os.path.getsize(path)
+        stat = totals.setdefault(kind, [0, 0, 0, 0])
+        stat[0] += 1
+        stat[2] += before
+        # orjson の出力は compact と同じ見た目のため区別しない
+        if current == ("compact" if fmt == "orjson" else fmt) or args.dry_run:
+            stat[3] += before
+            if args.dry_run:
+                print(f"{path}: {current} -> {fmt}")
+            continue
+        data, _ = read_section(path, kind)
+        if data is None:
+            print(f"skip (unreadable): {path}", file=sys.stderr)
+            stat[3] += before
+            continue
+        write_section(path, kind, data, fmt)
+        stat[1] += 1
+        stat[3] += os.path.getsize(path)
+    print(f"{'kind':<18} {'files':>6} {'converted':>10} {'before':>12} {'after':>12}")
+    for kind, (files, converted, before, after) in sorted(totals.items()):
+        print(f"{kind:<18} {files:>6} {converted:>10} {before:>12,} {after:>12,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
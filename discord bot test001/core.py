@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import discord
-import asyncio
 import logging
-from config import DATA_FILE, ROLES_TO_AUTO_REMOVE
+from datetime import datetime, timezone
+from config import WARM_START_MAX_AUDIT_ENTRIES, LOW_MEMORY_MODE
 from helpers import now_jst, timestamp_to_jst, format_duration, is_valid_guild_data, validate_role_data
+from api_scheduler import BACKGROUND, LOW, role_route, message_route
+from log_setup import member_context
 
 logger = logging.getLogger(__name__)
 
@@ -14,37 +16,48 @@ async def log_message(bot, guild, message, level="info"):
         channel = next((ch for ch in guild.text_channels if ch.permissions_for(guild.me).send_messages), None)
     try:
         if channel:
+            # ログ送信は最低優先度でキューへ登録し、完了を待たない
             emoji = {"info": "ℹ️", "success": "✅", "warning": "⚠️", "error": "❌"}.get(level, "📝")
-            await channel.send(f"{emoji} {message}"[:2000])
+            future = bot.api.submit(message_route(channel), channel.send, f"{emoji} {message}"[:2000], priority=LOW)
+            future.add_done_callback(_log_send_error)
     except Exception as e:
         logger.error(f"Discord log error: {e}")
-    getattr(logger, level if level != "success" else "info")(f"[{guild.name}] {message}")
+    getattr(logger, level if level != "success" else "info")(f"[{guild.name}] {message}", extra={"guild": guild.id})
 
-async def add_role_with_timestamp(bot, member, role, reason=None):
+def _log_send_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Discord log error: {future.exception()}")
+
+async def add_role_with_timestamp(bot, member, role, reason=None, priority=BACKGROUND, save=True):
+    """ロールを付与し、期限付きロールであれば付与時刻と履歴を記録する。
+    save=False の場合は保存を呼び出し側に任せる（一括処理ジョブのバッチ保存用）"""
     try:
         guild_id, user_id = str(member.guild.id), str(member.id)
-        bot.data.role_data.setdefault(guild_id, {}).setdefault(user_id, {})
         if role in member.roles:
             return True
         now_ts = now_jst().timestamp()
-        if role.name in ROLES_TO_AUTO_REMOVE:
-            bot.data.remove_user_setting(guild_id, user_id, role.name)
-        if role.name in ROLES_TO_AUTO_REMOVE and role.name not in bot.data.role_data[guild_id][user_id]:
-            bot.data.role_data[guild_id][user_id][role.name] = now_ts
-            bot.data.add_role_history(guild_id, user_id, role.name, now_ts)
-        elif role.name not in bot.data.role_data[guild_id][user_id]:
-            bot.data.role_data[guild_id][user_id][role.name] = now_ts
-        await member.add_roles(role, reason=reason or "自動ロール付与")
-        await bot.data.save_all()
+        role_id = str(role.id)
+        recorded = False
+        if bot.data.is_expiring(guild_id, role_id):
+            bot.data.remove_user_setting(guild_id, user_id, role_id)
+            if role_id not in bot.data.role_data.get(guild_id, {}).get(user_id, {}):
+                bot.data.set_assignment(guild_id, user_id, role_id, now_ts)
+                bot.data.add_role_history(guild_id, user_id, role_id, now_ts)
+                recorded = True
+        await bot.api.run(role_route(member.guild), member.add_roles, role, reason=reason or "自動ロール付与", priority=priority)
+        if save:
+            await bot.data.save_guild(guild_id)
         
-        await check_and_apply_tenure_role(bot, member, role)
+        await check_and_apply_tenure_role(bot, member, role, priority)
+        if recorded:
+            await apply_escalation(bot, member, role_id, now_ts, priority)
         
         return True
     except Exception as e:
-        logger.error(f"Role add error for {member}: {e}")
+        logger.error(f"Role add error for {member}: {e}", extra=member_context(member))
         return False
 
-async def check_and_apply_tenure_role(bot, member, trigger_role):
+async def check_and_apply_tenure_role(bot, member, trigger_role, priority=BACKGROUND):
     """トリガーロール付与時に、メンバーの参加期間をチェックして対象ロールを付与し、トリガーロールを削除"""
     guild_id = str(member.guild.id)
     if guild_id not in bot.data.tenure_rules:
@@ -55,6 +68,7 @@ async def check_and_apply_tenure_role(bot, member, trigger_role):
 
     if trigger_role_name not in rules:
         return
+    bot.trigger_holders.add(guild_id, trigger_role_name, member.id)
 
     rule = rules[trigger_role_name]
     target_role_name = rule.get("target_role")
@@ -69,9 +83,11 @@ async def check_and_apply_tenure_role(bot, member, trigger_role):
         target_role = discord.utils.get(member.guild.roles, name=target_role_name)
         if target_role and target_role not in member.roles:
             try:
-                await member.add_roles(
+                await bot.api.run(
+                    role_route(member.guild), member.add_roles,
                     target_role,
-                    reason=f"テニュアルール: {trigger_role_name} 付与時、参加期間{tenure_days}日以上で自動付与"
+                    reason=f"テニュアルール: {trigger_role_name} 付与時、参加期間{tenure_days}日以上で自動付与",
+                    priority=priority
                 )
                 await log_message(
                     bot, member.guild,
@@ -79,109 +95,280 @@ async def check_and_apply_tenure_role(bot, member, trigger_role):
                     "success"
                 )
             except Exception as e:
-                logger.error(f"Tenure role assignment error for {member}: {e}")
+                logger.error(f"Tenure role assignment error for {member}: {e}", extra=member_context(member))
 
     try:
         if trigger_role in member.roles:
-            await member.remove_roles(trigger_role, reason="テニュアルール処理後に自動削除")
+            await bot.api.run(
+                role_route(member.guild), member.remove_roles,
+                trigger_role, reason="テニュアルール処理後に自動削除", priority=priority
+            )
             await log_message(
                 bot, member.guild,
                 f"{member.display_name} からトリガーロール '{trigger_role_name}' を自動削除",
                 "info"
             )
     except Exception as e:
-        logger.error(f"Trigger role removal error for {member}: {e}")
+        logger.error(f"Trigger role removal error for {member}: {e}", extra=member_context(member))
+
+async def apply_escalation(bot, member, role_id, timestamp, priority=BACKGROUND):
+    """期限付きロールの付与を履歴へ記録した直後に呼ぶ。
+    エスカレーションルールの規定回数に達した場合は対象ロールを付与し、期間の指定があれば個人設定として記録する"""
+    guild_id, user_id = str(member.guild.id), str(member.id)
+    rule = bot.escalation.observe(guild_id, user_id, role_id, timestamp)
+    if rule is None:
+        return False
+    target = member.guild.get_role(int(rule["target_role"]))
+    if target is None or member.get_role(target.id):
+        return False
+    source_name = bot.data.role_name(guild_id, role_id)
+    window_text = format_duration(rule["window_seconds"])
+    granted = await add_role_with_timestamp(
+        bot, member, target, f"エスカレーション: {window_text}以内に {source_name} {rule['count']}回", priority
+    )
+    if not granted:
+        return False
+    if rule.get("target_seconds") and bot.data.is_expiring(guild_id, rule["target_role"]):
+        bot.data.set_user_remove_seconds(guild_id, user_id, rule["target_role"], rule["target_seconds"])
+        await bot.data.save_guild(guild_id)
+    await log_message(
+        bot, member.guild,
+        f"{member.display_name} は {window_text}以内に {source_name} が{rule['count']}回に達したため {target.name} を付与"
+        + (f"（{format_duration(rule['target_seconds'])}後に自動削除）" if rule.get("target_seconds") else ""),
+        "warning"
+    )
+    return True
+
+async def resolve_members(guild, user_ids):
+    """user_ids のメンバーを {user_id(str): Member} で返す。
+    メンバー一覧を未取得のギルドでは、キャッシュに無いメンバーを 100 件ずつまとめて取得する"""
+    found, missing = {}, []
+    for user_id in user_ids:
+        member = guild.get_member(int(user_id))
+        if member is not None:
+            found[str(user_id)] = member
+        else:
+            missing.append(int(user_id))
+    if missing and not guild.chunked:
+        for i in range(0, len(missing), 100):
+            for member in await guild.query_members(user_ids=missing[i:i + 100], limit=100, cache=True):
+                found[str(member.id)] = member
+    return found
+
+def ensure_expiring_roles(bot, guild):
+    """ロール名で記録していたギルドのデータをロールID キーへ移行する（未移行のギルドのみ）。
+    移行した場合は True（保存は呼び出し側で行う）"""
+    guild_id = str(guild.id)
+    if bot.data.has_role_definitions(guild_id):
+        return False
+    name_to_id = {}
+    for role in guild.roles:
+        name_to_id.setdefault(role.name, str(role.id))
+    bot.data.migrate_role_keys(guild_id, name_to_id)
+    return True
+
+def relevant_role_ids(bot, guild):
+    """期限付きロールとテニュアのトリガーロールの ID"""
+    guild_id = str(guild.id)
+    ids = {int(r) for r in bot.data.expiring_role_defs(guild_id)}
+    trigger_names = set(bot.data.tenure_rules.get(guild_id, {}))
+    if trigger_names:
+        ids.update(r.id for r in guild.roles if r.name in trigger_names)
+    return ids
+
+async def iter_members(guild, after=0):
+    """ギルドのメンバーを ID の昇順に返す（after を指定した場合はそれより大きい ID のみ）。
+    省メモリモード・メンバー一覧を未取得のギルドではキャッシュへ載せず、HTTP で 1000 件ずつ取得しながら返す"""
+    if LOW_MEMORY_MODE or (after and not guild.chunked):
+        # API は 1000 件ごとのページを ID の降順で返すため、ページ単位で並べ替える
+        page = []
+        async for member in guild.fetch_members(limit=None, after=discord.Object(id=after)):
+            page.append(member)
+            if len(page) >= 1000:
+                page.sort(key=lambda m: m.id)
+                for m in page:
+                    yield m
+                page = []
+        page.sort(key=lambda m: m.id)
+        for m in page:
+            yield m
+        return
+    if not guild.chunked:
+        await guild.chunk()
+    for member in sorted((m for m in guild.members if m.id > after), key=lambda m: m.id):
+        yield member
+
+async def _fetch_relevant_members(bot, guild):
+    """省メモリモードの全体同期用。全メンバーを順に取得し、対象ロールの保持者のみをキャッシュへ追加して返す"""
+    role_ids = relevant_role_ids(bot, guild)
+    members = []
+    scanned = 0
+    async for member in guild.fetch_members(limit=None):
+        scanned += 1
+        if member.bot or not any(member.get_role(r) for r in role_ids):
+            continue
+        guild._add_member(member)
+        members.append(member)
+    logger.info(f"[{guild.name}] 省メモリ同期: {scanned}人を走査、対象 {len(members)}人")
+    return members
+
+def prune_member_cache(bot, guild):
+    """省メモリモード用。対象ロールを持たず記録にも無いメンバーをキャッシュから外す。
+    discord.py のキャッシュ設定ではロール単位の制限ができないため、定期的にこちらで間引く"""
+    keep = {int(u) for u in bot.data.role_data.get(str(guild.id), {})}
+    keep.add(bot.user.id)
+    role_ids = relevant_role_ids(bot, guild)
+    removed = 0
+    for member in list(guild.members):
+        if member.id in keep or any(member.get_role(r) for r in role_ids):
+            continue
+        guild._remove_member(member)
+        removed += 1
+    if removed:
+        logger.debug(f"[{guild.name}] メンバーキャッシュから {removed}人を除外（残り {len(guild.members)}人）")
+    return removed
 
 async def sync_data_with_reality(bot, guild, is_periodic=False):
     try:
-        if not guild.chunked or len(guild.members) == 0:
-            logger.warning(f"[{guild.name}] メンバー情報が不完全のため同期をスキップしました。")
-            return {"removed": 0, "added": 0}
+        if not LOW_MEMORY_MODE:
+            if not guild.chunked:
+                logger.info(f"[{guild.name}] メンバー情報をロード中...")
+                await guild.chunk()
+            if not guild.chunked or len(guild.members) == 0:
+                logger.warning(f"[{guild.name}] メンバー情報が不完全のため同期をスキップしました。")
+                return {"removed": 0, "added": 0}
         
         guild_id = str(guild.id)
         if not is_valid_guild_data(guild_id):
             logger.error(f"Invalid guild_id: {guild_id}")
             return {"removed": 0, "added": 0}
         
-        try:
-            current_role_data = bot.data._load_json(DATA_FILE, {})
-            if not validate_role_data(current_role_data):
-                logger.error(f"[{guild.name}] ロールデータの検証に失敗しました。同期をスキップします。")
-                return {"removed": 0, "added": 0}
-            bot.data.role_data = current_role_data
-        except Exception as e:
-            logger.error(f"[{guild.name}] ファイル再読み込み失敗: {e}。同期をスキップします。")
+        # メモリ上の記録と照合する（ファイルの外部変更はファイル監視で反映済み）
+        if not validate_role_data({guild_id: bot.data.snapshot(guild_id, "role_data")}):
+            logger.error(f"[{guild.name}] ロールデータの検証に失敗しました。同期をスキップします。")
             return {"removed": 0, "added": 0}
         
-        now = now_jst().timestamp()
-        bot.data.role_data.setdefault(guild_id, {})
-        current_holders = {}
-        auto_roles_set = set(ROLES_TO_AUTO_REMOVE)
-        
-        for member in guild.members:
-            if member.bot:
-                continue
-            user_id = str(member.id)
-            member_roles = set(r.name for r in member.roles)
-            target_roles = auto_roles_set & member_roles
-            if target_roles:
-                current_holders[user_id] = list(target_roles)
-        
-        changes = {"removed": 0, "added": 0}
-        users_to_remove = []
-        
-        for user_id, user_roles in list(bot.data.role_data[guild_id].items()):
-            if user_id not in current_holders:
-                users_to_remove.append(user_id)
-                changes["removed"] += len(user_roles)
-            else:
-                for role_name in list(user_roles.keys()):
-                    if role_name not in current_holders[user_id]:
-                        del bot.data.role_data[guild_id][user_id][role_name]
-                        changes["removed"] += 1
-                if not bot.data.role_data[guild_id][user_id]:
-                    users_to_remove.append(user_id)
-        
-        for user_id in users_to_remove:
-            del bot.data.role_data[guild_id][user_id]
-        
-        for user_id, roles in current_holders.items():
-            bot.data.role_data.setdefault(guild_id, {}).setdefault(user_id, {})
-            for role_name in roles:
-                if role_name not in bot.data.role_data[guild_id][user_id]:
-                    bot.data.role_data[guild_id][user_id][role_name] = now
-                    if role_name in ROLES_TO_AUTO_REMOVE:
-                        bot.data.add_role_history(guild_id, user_id, role_name, now)
-                    changes["added"] += 1
-
-        # 変更があれば保存とログ
-        if changes["removed"] or changes["added"]:
-            await bot.data.save_all()
-            sync_msg = f"{'定期' if is_periodic else '起動時'}同期: 削除{changes['removed']}件, 追加{changes['added']}件"
-            await log_message(guild, sync_msg, "info")
-
-        # --- 追加: テニュアルールのトリガーロールを持つメンバーを検知して処理 ---
-        # これで削除予定だったトリガーロールも正常に処理される
-        tenure_rules = bot.data.tenure_rules.get(guild_id, {})
-        if tenure_rules:
-            trigger_role_names = set(tenure_rules.keys())
-            for member in guild.members:
-                if member.bot:
-                    continue
-                member_role_names = set(r.name for r in member.roles)
-                for trigger_role_name in trigger_role_names & member_role_names:
-                    trigger_role_obj = discord.utils.get(guild.roles, name=trigger_role_name)
-                    if trigger_role_obj:
-                        try:
-                            await check_and_apply_tenure_role(bot, member, trigger_role_obj)
-                        except Exception as e:
-                            logger.error(f"Error processing trigger role for {member}: {e}")
-
-        return changes
+        if LOW_MEMORY_MODE:
+            members = await _fetch_relevant_members(bot, guild)
+        else:
+            members = guild.members
+        return await _apply_holders(
+            bot, guild, members, None, f"{'定期' if is_periodic else '起動時'}同期"
+        )
     except Exception as e:
         logger.error(f"Sync error for {guild.name}: {e}")
         return {"removed": 0, "added": 0}
 
+async def warm_sync_guild(bot, guild, snapshot):
+    """保持者スナップショット以降に状態が変わり得るメンバーのみを照合する（再起動時用）。
+    対象: 記録済みのユーザー・スナップショットの保持者・監査ログでロールが変更されたユーザー。
+    監査ログを参照できない・件数が多すぎる・ロールの削除やトリガーロールの名前変更があった場合は None を返す（全体同期が必要）"""
+    since = datetime.fromtimestamp(snapshot["saved_at"], tz=timezone.utc)
+    trigger_names = set(bot.data.tenure_rules.get(str(guild.id), {}))
+    changed_users = set()
+    try:
+        count = 0
+        async for entry in guild.audit_logs(limit=None, after=since):
+            count += 1
+            if count > WARM_START_MAX_AUDIT_ENTRIES:
+                logger.info(f"[{guild.name}] 監査ログが多いため全体同期を行います")
+                return None
+            if entry.action == discord.AuditLogAction.role_delete:
+                return None
+            if entry.action == discord.AuditLogAction.role_update and getattr(entry.after, "name", None):
+                # 期限付きロールは ID で記録しているため、名前の変更が影響するのはトリガーロールのみ
+                if trigger_names & {getattr(entry.before, "name", None), entry.after.name}:
+                    return None
+            if entry.action == discord.AuditLogAction.member_role_update and entry.target is not None:
+                changed_users.add(str(entry.target.id))
+    except (discord.Forbidden, discord.HTTPException) as e:
+        logger.info(f"[{guild.name}] 監査ログを取得できないため全体同期を行います: {e}")
+        return None
+
+    guild_id = str(guild.id)
+    candidates = set(bot.data.role_data.get(guild_id, {})) | changed_users
+    for ids in snapshot.get("holders", {}).values():
+        candidates.update(str(i) for i in ids)
+    members = await resolve_members(guild, candidates)
+    changes = await _apply_holders(bot, guild, members.values(), candidates, "起動時同期（差分）")
+    logger.info(f"[{guild.name}] 差分同期: 照合 {len(candidates)}人（監査ログ {len(changed_users)}人）")
+    return changes
+
+async def reconcile_members(bot, guild, members, user_ids, label):
+    """user_ids のユーザーのみ、members（その中で取得できたメンバー）の現在のロールと記録を照合する。
+    整合性チェックで一部ずつ照合する際に使用する。保存とログは呼び出し側でまとめて行う"""
+    return await _apply_holders(bot, guild, members, user_ids, label, report=False)
+
+async def _apply_holders(bot, guild, members, scope, label, report=True):
+    """members の現在のロールを記録へ反映する。
+    scope が None の場合は全ユーザー、それ以外は scope 内のユーザーのみ照合する。
+    report が真の場合は変更があれば保存し、ログチャンネルへ件数を送る"""
+    guild_id = str(guild.id)
+    now = now_jst().timestamp()
+    bot.data.role_data.setdefault(guild_id, {})
+    current_holders = {}
+    trigger_members = []
+    expiring_ids = [int(r) for r in bot.data.expiring_role_defs(guild_id)]
+    trigger_role_names = set(bot.data.tenure_rules.get(guild_id, {}))
+    observed = []
+    
+    for member in members:
+        if member.bot:
+            continue
+        observed.append(member)
+        user_id = str(member.id)
+        target_roles = [str(r) for r in expiring_ids if member.get_role(r)]
+        if target_roles:
+            current_holders[user_id] = target_roles
+        if trigger_role_names and trigger_role_names & {r.name for r in member.roles}:
+            trigger_members.append(member)
+    
+    bot.trigger_holders.observe(guild_id, trigger_role_names, observed, scope)
+    changes = {"removed": 0, "added": 0}
+    
+    records = bot.data.role_data[guild_id]
+    if scope is None:
+        recorded = list(records.items())
+    else:
+        # 一部ずつ照合する場合は、記録全体ではなく対象ユーザーのみを参照する
+        recorded = [(u, records[u]) for u in scope if u in records]
+    for user_id, user_roles in recorded:
+        if user_id not in current_holders:
+            changes["removed"] += len(user_roles)
+            bot.data.clear_assignment(guild_id, user_id)
+        else:
+            for role_id in list(user_roles.keys()):
+                if role_id not in current_holders[user_id]:
+                    bot.data.clear_assignment(guild_id, user_id, role_id)
+                    changes["removed"] += 1
+    
+    for user_id, roles in current_holders.items():
+        assigned = bot.data.role_data[guild_id].get(user_id, {})
+        for role_id in roles:
+            if role_id not in assigned:
+                bot.data.set_assignment(guild_id, user_id, role_id, now)
+                bot.data.add_role_history(guild_id, user_id, role_id, now)
+                changes["added"] += 1
+
+    # 変更があれば保存とログ
+    if report and (changes["removed"] or changes["added"]):
+        await bot.data.save_guild(guild_id)
+        sync_msg = f"{label}: 削除{changes['removed']}件, 追加{changes['added']}件"
+        await log_message(bot, guild, sync_msg, "info")
+
+    # --- 追加: テニュアルールのトリガーロールを持つメンバーを検知して処理 ---
+    # これで削除予定だったトリガーロールも正常に処理される
+    for member in trigger_members:
+        for trigger_role_name in trigger_role_names & set(r.name for r in member.roles):
+            trigger_role_obj = discord.utils.get(guild.roles, name=trigger_role_name)
+            if trigger_role_obj:
+                try:
+                    await check_and_apply_tenure_role(bot, member, trigger_role_obj)
+                except Exception as e:
+                    logger.error(f"Error processing trigger role for {member}: {e}", extra=member_context(member))
+
+    return changes
+
 async def process_role_removal(bot, guild):
     guild_id = str(guild.id)
     if guild_id not in bot.data.role_data:
@@ -189,63 +376,76 @@ async def process_role_removal(bot, guild):
     now = now_jst().timestamp()
     total_removed = 0
     changed = False
-    async with bot.removal_lock:
-        for user_id, user_roles in list(bot.data.role_data[guild_id].items()):
-            member = guild.get_member(int(user_id))
+    async with bot.get_removal_lock(guild_id):
+        user_ids = list(bot.data.role_data[guild_id])
+        if LOW_MEMORY_MODE:
+            # 期限を迎えたユーザーのみ取得する（離脱・ロール消失の整理は定期同期に任せる）
+            user_ids = list(dict.fromkeys(u for _, u, _ in bot.data.expiry_index(guild_id).range(float("-inf"), now)))
+        members = await resolve_members(guild, user_ids)
+        for user_id in user_ids:
+            user_roles = bot.data.role_data[guild_id].get(user_id)
+            if user_roles is None:
+                continue
+            member = members.get(user_id)
             if not member:
-                del bot.data.role_data[guild_id][user_id]
+                bot.data.clear_assignment(guild_id, user_id)
                 changed = True
                 continue
             roles_to_remove = []
-            for role_name, timestamp in list(user_roles.items()):
-                if role_name not in ROLES_TO_AUTO_REMOVE or not timestamp:
+            for role_id, timestamp in list(user_roles.items()):
+                if not timestamp or not bot.data.is_expiring(guild_id, role_id):
                     continue
-                role = discord.utils.get(guild.roles, name=role_name)
-                if not role or role not in member.roles:
-                    bot.data.role_data[guild_id][user_id].pop(role_name, None)
+                role = guild.get_role(int(role_id))
+                if not role or not member.get_role(role.id):
+                    bot.data.clear_assignment(guild_id, user_id, role_id)
                     changed = True
                     continue
-                remove_seconds = bot.data.get_remove_seconds(guild_id, user_id, role_name)
+                remove_seconds = bot.data.get_remove_seconds(guild_id, user_id, role_id)
                 if now - timestamp >= remove_seconds:
-                    roles_to_remove.append((role, role_name, remove_seconds, timestamp))
-            for role, role_name, remove_seconds, timestamp in roles_to_remove:
+                    roles_to_remove.append((role, role_id, remove_seconds, timestamp))
+            for role, role_id, remove_seconds, timestamp in roles_to_remove:
                 try:
                     if role not in member.roles:
                         continue
-                    await member.remove_roles(role, reason=f"自動削除（{format_duration(remove_seconds)}経過）")
+                    await bot.api.run(
+                        role_route(guild), member.remove_roles,
+                        role, reason=f"自動削除（{format_duration(remove_seconds)}経過）"
+                    )
                     assigned_time = timestamp_to_jst(timestamp)
                     sec_passed = int(now - timestamp)
                     await log_message(
                         bot, guild,
-                        f"{member.display_name} から '{role_name}' を自動削除 "
+                        f"{member.display_name} から '{role.name}' を自動削除 "
                         f"(付与: {assigned_time.strftime('%Y/%m/%d %H:%M:%S')}, 経過: {format_duration(sec_passed)})",
                         "success"
                     )
-                    bot.data.role_data[guild_id][user_id].pop(role_name, None)
+                    bot.data.clear_assignment(guild_id, user_id, role_id)
                     total_removed += 1
                     changed = True
-                    await asyncio.sleep(0.1)
                 except Exception as e:
-                    logger.error(f"Role removal error for {member}: {e}")
-            if not bot.data.role_data[guild_id][user_id]:
-                del bot.data.role_data[guild_id][user_id]
+                    logger.error(f"Role removal error for {member}: {e}", extra=member_context(member))
+            if bot.data.role_data[guild_id].get(user_id) == {}:
+                bot.data.clear_assignment(guild_id, user_id)
                 changed = True
     if changed:
-        await bot.data.save_all()
+        await bot.data.save_guild(guild_id)
     return total_removed
 
-async def register_external_role_add(bot, member: discord.Member, role: discord.Role):
-    """外部でロールが付与されたときに内部データを登録する（自動削除対象用）"""
+async def register_external_role_add(bot, member: discord.Member, role: discord.Role, save=True):
+    """外部でロールが付与されたときに内部データを登録する（自動削除対象用）。
+    save=False の場合は保存を呼び出し側に任せる（イベントキューのバッチ保存用）"""
     try:
         guild_id, user_id = str(member.guild.id), str(member.id)
         now_ts = now_jst().timestamp()
-        if role.name in ROLES_TO_AUTO_REMOVE:
-            bot.data.remove_user_setting(guild_id, user_id, role.name)
-            bot.data.role_data.setdefault(guild_id, {}).setdefault(user_id, {})
-            if role.name not in bot.data.role_data[guild_id][user_id]:
-                bot.data.role_data[guild_id][user_id][role.name] = now_ts
-                bot.data.add_role_history(guild_id, user_id, role.name, now_ts)
-                await bot.data.save_all()
-                logger.info(f"Registered external role add: {member.display_name} / {role.name}")
+        role_id = str(role.id)
+        if bot.data.is_expiring(guild_id, role_id):
+            bot.data.remove_user_setting(guild_id, user_id, role_id)
+            if role_id not in bot.data.role_data.get(guild_id, {}).get(user_id, {}):
+                bot.data.set_assignment(guild_id, user_id, role_id, now_ts)
+                bot.data.add_role_history(guild_id, user_id, role_id, now_ts)
+                if save:
+                    await bot.data.save_guild(guild_id)
+                logger.info(f"Registered external role add: {member.display_name} / {role.name}", extra=member_context(member))
+                await apply_escalation(bot, member, role_id, now_ts)
     except Exception as e:
-        logger.error(f"register_external_role_add error for {member}: {e}")
+        logger.error(f"register_external_role_add error for {member}: {e}", extra=member_context(member))
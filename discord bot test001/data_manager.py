@@ -4,41 +4,258 @@ import os
 import shutil
 import asyncio
 import logging
+import itertools
+from bisect import bisect_left, insort
 from config import (
     DATA_FILE, SETTINGS_FILE, ROLE_HISTORY_FILE, LOG_CHANNEL_FILE, TENURE_RULES_FILE,
-    BACKUP_DIR, BACKUP_KEEP_GENERATIONS, ROLES_TO_AUTO_REMOVE, DEFAULT_REMOVE_SECONDS, MENTION_CONFIG_FILE
+    BACKUP_DIR, BACKUP_KEEP_GENERATIONS, ROLES_TO_AUTO_REMOVE, DEFAULT_REMOVE_SECONDS, MENTION_CONFIG_FILE,
+    HISTORY_HOT_SECONDS, MANIFEST_FILE, DEFAULT_EXPIRING_ROLE_SECONDS, SWEEP_RECENT_MAX
 )
 from helpers import now_jst
+from history_archive import HistoryArchive
+from expiry_index import ExpiryIndex
+from storage import (
+    GuildStore, GUILD_STORE_KINDS, KIND_TO_STORE, shard_path, read_json, read_section,
+    write_section, load_manifest, save_manifest, file_stamp, diff_sections, clone, fingerprint
+)
+from migrations import SCHEMA_KEY, GLOBAL_SCHEMA_VERSION, migrate_section, migrate_settings
 
 logger = logging.getLogger(__name__)
 
+# 旧形式の全ギルド共通ファイル（ストア属性名 -> ファイル）
+LEGACY_FILES = {
+    "role_data": DATA_FILE,
+    "role_add_history": ROLE_HISTORY_FILE,
+    "guild_log_channels": LOG_CHANNEL_FILE,
+    "tenure_rules": TENURE_RULES_FILE,
+    "mention_config": MENTION_CONFIG_FILE,
+}
+
+def _entry_ts(entry):
+    return entry["timestamp"]
+
+def _iter_history(*sources):
+    for source in sources:
+        for user_id, roles in source.items():
+            for role_id, entries in roles.items():
+                for entry in entries:
+                    yield user_id, role_id, entry
+
+def _sort_history(section):
+    """時系列順になっていない履歴を並べ直す"""
+    for roles in section.values():
+        for hist in roles.values():
+            if any(hist[i]["timestamp"] > hist[i + 1]["timestamp"] for i in range(len(hist) - 1)):
+                hist.sort(key=_entry_ts)
+
+# 書き込み時コピーで管理するストア。ギルド内の dict・履歴のリストは書き換えずに新しいものへ差し替え、
+# 最上位の dict は snapshot() で共有中の場合のみ浅いコピーを作ってから書き込む
+COW_STORES = ("role_data", "user_remove_seconds", "role_add_history")
+
 class DataManager:
     def __init__(self):
-        self.role_data = {}
         self.settings = {}
-        self.role_add_history = {}
-        self.guild_log_channels = {}
-        self.tenure_rules = {}
-        self.mention_config = {}
-        self._lock = asyncio.Lock()
+        self.role_data = GuildStore(self, "role_data")
+        self.role_add_history = GuildStore(self, "role_add_history")
+        self.guild_log_channels = GuildStore(self, "guild_log_channels")
+        self.tenure_rules = GuildStore(self, "tenure_rules")
+        self.mention_config = GuildStore(self, "mention_config")
+        self.user_remove_seconds = GuildStore(self, "user_remove_seconds")
+        # 期限付きロールの定義 {guild_id: {role_id: {"name", "seconds"}}}。
+        # role_data・履歴・個人設定はこの role_id（文字列）をキーとする
+        self.expiring_roles = GuildStore(self, "expiring_roles")
+        # エスカレーションルール {guild_id: {元ロールID: {"count", "window_seconds", "target_role", "target_seconds"}}}
+        self.escalation_rules = GuildStore(self, "escalation_rules")
+        self._stores = {name: getattr(self, name) for name in GUILD_STORE_KINDS}
+        # ギルドごとのロック。別ギルドの保存・書き込みは互いに待たない
+        self._guild_locks = {}
+        self._global_lock = asyncio.Lock()
+        self._manifest_lock = asyncio.Lock()
+        self._manifest = {}
+        self._loaded = set()
+        # 最後に永続化した内容（ギルド単位、ストアごとの fingerprint）。変更検知に使用
+        self._persisted = {}
+        self._persisted_global = None
+        self.history_archive = HistoryArchive()
+        # アーカイブのメモリ上の変更とファイルへの書き込みを直列化する（書き込みはスレッドで行う）
+        self._archive_lock = asyncio.Lock()
+        # 読み込み時に開始したアーカイブ移動のタスク（完了まで参照を保持する）
+        self._background = set()
+        # ギルドごとの自動削除期限インデックス（初回参照時に構築）
+        self._expiry = {}
+        # 履歴の変更検知用バージョン（表示キャッシュの無効化に使用）
+        self._history_versions = {}
+        self._history_guild_versions = {}
+        self._history_counter = itertools.count(1)
+        # ストアごとの変更バージョン {(guild_id, 属性名): n}（応答キャッシュの無効化に使用）
+        self._store_versions = {}
+        self._store_counter = itertools.count(1)
+        # snapshot() で読み取り側と共有中の (属性名, guild_id)。次の書き込み時に最上位の dict をコピーする
+        self._shared = set()
+        # 記録が変わったユーザー {guild_id: {user_id: None}}（変更順）。整合性チェックで優先的に照合する
+        self._recent_users = {}
+        # 自分で読み書きした時点のファイル状態 {path: (mtime_ns, size)}。外部変更の検知に使用
+        self._file_stamps = {}
         self.load_all()
 
     def load_all(self):
-        self.role_data = self._load_json(DATA_FILE, {})
-        self.settings = self._load_json(SETTINGS_FILE, {"remove_seconds": DEFAULT_REMOVE_SECONDS.copy()})
-        self.role_add_history = self._load_json(ROLE_HISTORY_FILE, {})
-        self.guild_log_channels = self._load_json(LOG_CHANNEL_FILE, {})
-        self.tenure_rules = self._load_json(TENURE_RULES_FILE, {})
-        self.mention_config = self._load_json(MENTION_CONFIG_FILE, {})
-        # 履歴変換
-        for g, users in self.role_add_history.items():
-            for u, roles in users.items():
-                for r, hist in roles.items():
-                    if hist and isinstance(hist[0], float):
-                        self.role_add_history[g][u][r] = [{"timestamp": ts, "reason": ""} for ts in hist]
-        self.settings.setdefault("remove_seconds", DEFAULT_REMOVE_SECONDS.copy())
-        for r in ROLES_TO_AUTO_REMOVE:
-            self.settings["remove_seconds"].setdefault(r, DEFAULT_REMOVE_SECONDS[r])
+        """グローバル設定とマニフェストのみを読み込む。
+        ギルドのデータは ensure_guild で最初に参照された時点で読み込む。
+        スキーマが現在のバージョンであれば変換処理は行わない。"""
+        settings = self._load_json(SETTINGS_FILE, {"remove_seconds": DEFAULT_REMOVE_SECONDS.copy()})
+        self.settings, legacy_overrides, settings_migrated = migrate_settings(settings)
+        for store in self._stores.values():
+            store._data.clear()
+        self._shared.clear()
+        self._loaded.clear()
+        self._persisted.clear()
+        self._expiry.clear()
+        self._history_versions.clear()
+        self._history_guild_versions.clear()
+        self._history_epoch = next(self._history_counter)
+        self.history_archive.load_index()
+        manifest = load_manifest()
+        if manifest is None:
+            manifest = self._migrate_legacy_layout(legacy_overrides or {})
+        elif legacy_overrides:
+            logger.warning(f"{SETTINGS_FILE} の user_remove_seconds は無視されます（ギルド別ファイルを使用）")
+        self._manifest = manifest
+        self._persisted_global = self._global_snapshot()
+        self._file_stamps.clear()
+        if settings_migrated:
+            self._write_global(self._persisted_global)
+        self._record_stamp(SETTINGS_FILE)
+        self._record_stamp(MANIFEST_FILE)
+
+    def _migrate_legacy_layout(self, legacy_overrides):
+        """旧形式の共通ファイルをギルド別ファイルへ分割する（マニフェスト未作成時に一度だけ実行）"""
+        sources = {name: self._load_json(path, {}) for name, path in LEGACY_FILES.items() if os.path.exists(path)}
+        sources["user_remove_seconds"] = legacy_overrides
+        manifest = {}
+        for name, data in sources.items():
+            kind = GUILD_STORE_KINDS[name]
+            for guild_id, section in data.items():
+                section, _ = migrate_section(kind, section)
+                write_section(shard_path(guild_id, kind), kind, section)
+                manifest.setdefault(guild_id, []).append(kind)
+        save_manifest(manifest)
+        logger.info(f"Migrated legacy data files to per-guild layout: {len(manifest)} guilds")
+        return manifest
+
+    def ensure_guild(self, guild_id):
+        """ギルドのデータファイル群を読み込む（初回参照時のみ）。
+        古いスキーマのファイルはその場で移行し、移行結果を書き戻す（次回以降は変換しない）。
+        イベントループ上ではファイルの読み込みで処理が止まるため、Bot の稼働中は preload_guild で事前に読み込む"""
+        if guild_id in self._loaded:
+            return
+        self._install_guild(guild_id, self._read_guild(guild_id))
+
+    async def preload_guild(self, guild_id):
+        """ensure_guild の非同期版。ファイルの読み込みとスキーマ移行の書き戻しはスレッドで行う"""
+        if guild_id in self._loaded:
+            return
+        sections = await asyncio.to_thread(self._read_guild, guild_id)
+        # 読み込み中に ensure_guild で読み込まれた場合はそちらを使う
+        if guild_id not in self._loaded:
+            self._install_guild(guild_id, sections)
+
+    def _read_guild(self, guild_id):
+        """ギルドのファイルを読み込み {属性名: データ} で返す。古いスキーマのファイルは移行して書き戻す。
+        メモリ上のデータは変更しないため、スレッドから呼び出せる"""
+        kinds = self._manifest.get(guild_id, [])
+        sections = {}
+        migrated = {}
+        for name, kind in GUILD_STORE_KINDS.items():
+            path = shard_path(guild_id, kind)
+            self._record_stamp(path)
+            if kind not in kinds:
+                continue
+            data, was_migrated = read_section(path, kind)
+            if data is not None:
+                sections[name] = data
+                if was_migrated:
+                    migrated[name] = data
+        if migrated:
+            self._write_guild(guild_id, migrated)
+            logger.info(f"Migrated schema for guild {guild_id}: {', '.join(GUILD_STORE_KINDS[n] for n in migrated)}")
+        return sections
+
+    def _install_guild(self, guild_id, sections):
+        self._loaded.add(guild_id)
+        for name, data in sections.items():
+            self._stores[name]._data[guild_id] = data
+        self._persisted[guild_id] = self._guild_snapshot(guild_id)
+        self._prepare_history(guild_id)
+
+    def _prepare_history(self, guild_id):
+        """保持期間外の履歴のアーカイブ移動（形式の変換と並び替えはスキーマ移行時に一度だけ行う）。
+        イベントループ上では gzip の書き込みを待たないよう、移動はタスクとして後から行う"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            moved = self.compact_history(guild_id).get(guild_id, 0)
+            if moved:
+                logger.info(f"History compaction on load ({guild_id}): {moved} entries archived")
+            return
+        task = loop.create_task(self._archive_on_load(guild_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _archive_on_load(self, guild_id):
+        moved = await self.archive_history(guild_id)
+        if moved:
+            logger.info(f"History compaction on load ({guild_id}): {moved} entries archived")
+
+    def guild_ids_for(self, name):
+        """ストアにデータを持つギルドID一覧（未読み込みのギルドはマニフェストから判断）"""
+        kind = GUILD_STORE_KINDS[name]
+        ids = list(self._stores[name]._data)
+        ids.extend(g for g, kinds in self._manifest.items() if g not in self._loaded and kind in kinds)
+        return ids
+
+    def guild_lock(self, guild_id):
+        """ギルド単位のロック。別ギルドの処理は互いに待たない"""
+        lock = self._guild_locks.get(guild_id)
+        if lock is None:
+            lock = self._guild_locks[guild_id] = asyncio.Lock()
+        return lock
+
+    def _guild_snapshot(self, guild_id):
+        return {name: self._store_token(guild_id, name) for name in self._stores}
+
+    def _store_token(self, guild_id, name):
+        """保存済みかの判定用の値。書き込み時コピーのストアは変更バージョン（シリアライズ不要）、
+        それ以外は直接書き換えにも対応するため内容の fingerprint。データが無い場合は None"""
+        data = self._stores[name]._data.get(guild_id)
+        if name in COW_STORES:
+            return None if data is None else self._store_versions.get((guild_id, name), 0)
+        return fingerprint(data)
+
+    def snapshot(self, guild_id, name):
+        """ストアのギルド分の現時点の内容を返す（読み取り専用）。ロックは不要で、
+        await をまたいで参照しても、以降の書き込みで内容が変わることは無い（書き込み時コピーのストアのみ）"""
+        data = self._stores[name].get(guild_id)
+        if data is None:
+            return {}
+        if name in COW_STORES:
+            self._shared.add((name, guild_id))
+        return data
+
+    def _writable(self, name, guild_id):
+        """書き込み時コピーのストアの、書き込み用の最上位 dict を返す"""
+        store = self._stores[name]
+        data = store.get(guild_id)
+        if data is None:
+            data = store[guild_id] = {}
+        elif (name, guild_id) in self._shared:
+            data = store._data[guild_id] = dict(data)
+        self._shared.discard((name, guild_id))
+        return data
+
+    def _global_snapshot(self):
+        return clone(self.settings)
 
     def _load_json(self, file_path, default):
         if not os.path.exists(file_path):
@@ -58,98 +275,698 @@ class DataManager:
         except Exception as e:
             logger.error(f"Error saving {file_path}: {e}")
 
+    def _capture_guild(self, guild_id):
+        """ギルドの現在内容を前回保存分と比較し、変更のあったストアを {属性名: コピー} で返す"""
+        tokens = self._guild_snapshot(guild_id)
+        previous = self._persisted.get(guild_id, {})
+        changed = {}
+        for name, token in tokens.items():
+            if token == previous.get(name):
+                continue
+            if token is None:
+                changed[name] = None
+            elif name in COW_STORES:
+                # 共有した内容は以降書き換えられないため、コピーせずにそのまま別スレッドで書き込める
+                changed[name] = self.snapshot(guild_id, name)
+            else:
+                changed[name] = json.loads(token)
+                self.bump_store_version(guild_id, name)
+        if changed:
+            self._persisted[guild_id] = tokens
+        return changed
+
+    async def save_guild(self, guild_id):
+        """1ギルド分の変更のみを検知し、変更されたファイルだけを書き込む"""
+        if guild_id not in self._loaded:
+            return
+        async with self.guild_lock(guild_id):
+            changed = self._capture_guild(guild_id)
+            if not changed:
+                return
+            await asyncio.to_thread(self._write_guild, guild_id, changed)
+            await self._update_manifest(guild_id)
+
+    async def save_global(self):
+        """ギルドに属さない設定（デフォルト削除期間など）のみ保存する"""
+        async with self._global_lock:
+            snapshot = self._global_snapshot()
+            if snapshot == self._persisted_global:
+                return
+            self._persisted_global = snapshot
+            self.bump_store_version(None, "settings")
+            await asyncio.to_thread(self._write_global, snapshot)
+
     async def save_all(self):
-        async with self._lock:
-            changed = False
-            old_data = self._load_json(DATA_FILE, {})
-            old_settings = self._load_json(SETTINGS_FILE, {})
-            old_history = self._load_json(ROLE_HISTORY_FILE, {})
-            old_log = self._load_json(LOG_CHANNEL_FILE, {})
-            old_tenure = self._load_json(TENURE_RULES_FILE, {})
-            old_mention = self._load_json(MENTION_CONFIG_FILE, {})
-            if old_data != self.role_data or old_settings != self.settings or old_history != self.role_add_history or old_log != self.guild_log_channels or old_tenure != self.tenure_rules or old_mention != self.mention_config:
-                self._backup_data()
-                changed = True
-            self._save_json(DATA_FILE, self.role_data)
-            self._save_json(SETTINGS_FILE, self.settings)
-            self._save_json(ROLE_HISTORY_FILE, self.role_add_history)
-            self._save_json(LOG_CHANNEL_FILE, self.guild_log_channels)
-            self._save_json(TENURE_RULES_FILE, self.tenure_rules)
-            self._save_json(MENTION_CONFIG_FILE, self.mention_config)
-
-    def _backup_data(self):
-        os.makedirs(BACKUP_DIR, exist_ok=True)
-        ts = now_jst().strftime("%Y%m%d_%H%M%S")
-        backup_targets = [
-            (DATA_FILE, f"roles_data_{ts}.json"),
-            (SETTINGS_FILE, f"settings_{ts}.json"),
-            (ROLE_HISTORY_FILE, f"role_history_{ts}.json"),
-            (LOG_CHANNEL_FILE, f"log_channel_{ts}.json"),
-            (TENURE_RULES_FILE, f"tenure_rules_{ts}.json"),
-        ]
-        for src, dst in backup_targets:
-            if os.path.exists(src):
-                shutil.copy2(src, os.path.join(BACKUP_DIR, dst))
-        self._cleanup_old_backups()
-
-    def _cleanup_old_backups(self):
+        for guild_id in list(self._loaded):
+            await self.save_guild(guild_id)
+        await self.save_global()
+
+    def _write_guild(self, guild_id, changed):
+        """変更されたストアのファイルのみ、既存ファイルをバックアップしてから書き込む"""
+        backups = []
+        for name, section in changed.items():
+            kind = GUILD_STORE_KINDS[name]
+            path = shard_path(guild_id, kind)
+            backup = self._backup_file(path, guild_id, kind)
+            if backup:
+                backups.append(backup)
+            try:
+                if section is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    write_section(path, kind, section)
+            except Exception as e:
+                logger.error(f"Error saving {path}: {e}")
+            self._record_stamp(path)
+        return backups
+
+    def _write_global(self, snapshot):
+        self._backup_file(SETTINGS_FILE, None, "settings")
+        self._save_json(SETTINGS_FILE, {SCHEMA_KEY: GLOBAL_SCHEMA_VERSION, **snapshot})
+        self._record_stamp(SETTINGS_FILE)
+
+    async def _update_manifest(self, guild_id):
+        kinds = [GUILD_STORE_KINDS[name] for name, section in self._persisted[guild_id].items() if section is not None]
+        if sorted(kinds) == sorted(self._manifest.get(guild_id, [])):
+            return
+        async with self._manifest_lock:
+            if kinds:
+                self._manifest[guild_id] = kinds
+            else:
+                self._manifest.pop(guild_id, None)
+            await asyncio.to_thread(save_manifest, dict(self._manifest))
+            self._record_stamp(MANIFEST_FILE)
+
+    def _backup_file(self, src, guild_id, kind):
+        """src をバックアップディレクトリ（ギルド別）へコピーする。コピー先のパスを返す。
+        ファイル名は形式によらず .json（binary 形式かどうかは読み込み時に先頭のバイト列で判別する）"""
+        if not os.path.exists(src):
+            return None
+        backup_dir = os.path.join(BACKUP_DIR, guild_id) if guild_id else BACKUP_DIR
         try:
-            patterns = [
-                "roles_data_",
-                "settings_",
-                "role_history_",
-                "log_channel_",
-                "tenure_rules_",
-            ]
-            for pat in patterns:
-                backups = sorted(
-                    [f for f in os.listdir(BACKUP_DIR) if f.startswith(pat)],
-                    reverse=True
-                )
-                for old_backup in backups[BACKUP_KEEP_GENERATIONS:]:
-                    os.remove(os.path.join(BACKUP_DIR, old_backup))
+            os.makedirs(backup_dir, exist_ok=True)
+            ts = now_jst().strftime("%Y%m%d_%H%M%S")
+            dst = os.path.join(backup_dir, f"{kind}_{ts}.json")
+            shutil.copy2(src, dst)
+            self._cleanup_old_backups(backup_dir, f"{kind}_")
+            return dst
+        except Exception as e:
+            logger.error(f"Backup error for {src}: {e}")
+            return None
+
+    def _cleanup_old_backups(self, backup_dir, prefix):
+        try:
+            backups = sorted(
+                [f for f in os.listdir(backup_dir) if f.startswith(prefix)],
+                reverse=True
+            )
+            for old_backup in backups[BACKUP_KEEP_GENERATIONS:]:
+                os.remove(os.path.join(backup_dir, old_backup))
         except Exception as e:
             logger.error(f"Backup cleanup error: {e}")
 
-    def get_remove_seconds(self, guild_id, user_id, role_name):
-        user_setting = (
-            self.settings.get("user_remove_seconds", {}).get(guild_id, {})
-            .get(user_id, {}).get(role_name)
+    def backup_path(self, guild_id, kind, timestamp):
+        return os.path.join(BACKUP_DIR, guild_id, f"{kind}_{timestamp}.json")
+
+    def preview_restore(self, guild_id, plan):
+        """restore.RestorePlan を適用した場合の変更箇所を返す（内容は変更しない）"""
+        self.ensure_guild(guild_id)
+        return plan.changes(self._stores[KIND_TO_STORE[plan.kind]]._data.get(guild_id))
+
+    async def restore_guild_store(self, guild_id, plan):
+        """restore.RestorePlan の範囲をバックアップの内容で上書きし、そのギルドのストアのみ書き込む。
+        変更箇所は適用時点の内容で求め直す。(変更箇所, 復元前の内容のバックアップパス) を返す"""
+        name = KIND_TO_STORE[plan.kind]
+        self.ensure_guild(guild_id)
+        async with self.guild_lock(guild_id):
+            store = self._stores[name]._data
+            live = store.get(guild_id)
+            changes = plan.changes(live)
+            if not changes:
+                return changes, None
+            if name == "role_add_history" and isinstance(plan.part, dict):
+                _sort_history(plan.part)
+            store[guild_id] = plan.merge(live, changes)
+            self._shared.discard((name, guild_id))
+            self.bump_store_version(guild_id, name)
+            self._apply_diff(guild_id, name, [(key, sub) for key, sub, _, _ in changes])
+            changed = self._capture_guild(guild_id)
+            backups = await asyncio.to_thread(self._write_guild, guild_id, changed) if changed else []
+            await self._update_manifest(guild_id)
+        pre_backup = next((b for b in backups if os.path.basename(b).startswith(f"{plan.kind}_")), None)
+        return changes, pre_backup
+
+    def _record_stamp(self, path):
+        self._file_stamps[path] = file_stamp(path)
+
+    def watched_files(self):
+        """外部変更を監視するファイル一覧 [(path, guild_id, 属性名)]。
+        ギルドファイルは読み込み済みのギルド分のみ（未読み込みのギルドは参照時に最新を読む）"""
+        files = [(SETTINGS_FILE, None, "settings"), (MANIFEST_FILE, None, "manifest")]
+        for guild_id in list(self._loaded):
+            for name, kind in GUILD_STORE_KINDS.items():
+                files.append((shard_path(guild_id, kind), guild_id, name))
+        return files
+
+    def is_externally_changed(self, path, stamp=None):
+        """最後に自分で読み書きした時点からファイルが変わっていれば True"""
+        if stamp is None:
+            stamp = file_stamp(path)
+        return self._file_stamps.get(path) != stamp
+
+    def reload_guild_store(self, guild_id, name):
+        """外部で編集されたギルドファイルを1つだけ読み込み直し、差分のみを反映する。
+        変更箇所の一覧（diff_sections の形式）を返す。"""
+        kind = GUILD_STORE_KINDS[name]
+        path = shard_path(guild_id, kind)
+        if guild_id not in self._loaded or not self.is_externally_changed(path):
+            return []
+        self._record_stamp(path)
+        new, migrated = read_section(path, kind)
+        if new is None and os.path.exists(path):
+            return []  # 書きかけ・構文エラーのファイルは無視し、現在の内容を維持
+        if name == "role_add_history" and new and not migrated:
+            # 手作業の編集で順序が崩れていても二分探索が使えるようにする
+            _sort_history(new)
+        store = self._stores[name]._data
+        diff = diff_sections(store.get(guild_id), new)
+        if not diff:
+            return diff
+        if new is None:
+            store.pop(guild_id, None)
+        else:
+            store[guild_id] = new
+        self.bump_store_version(guild_id, name)
+        # ディスクと一致しているので、次回の save_guild で書き戻さない（旧スキーマの場合は書き戻す）
+        if not migrated:
+            self._persisted.setdefault(guild_id, {})[name] = self._store_token(guild_id, name)
+        self._apply_diff(guild_id, name, diff)
+        return diff
+
+    def _apply_diff(self, guild_id, name, diff):
+        """ストアのギルド分を差し替えた後、変更箇所（diff_sections の形式）に応じて索引・照合対象を更新する"""
+        if name == "role_data":
+            for user_id in {u for u, _ in diff if u is not None}:
+                self.note_user_change(guild_id, user_id)
+        if name in ("role_data", "user_remove_seconds"):
+            for user_id, role_id in diff:
+                if user_id is None or role_id is None:
+                    self.invalidate_expiry(guild_id)
+                    break
+                self._update_expiry(guild_id, user_id, role_id)
+        elif name == "expiring_roles":
+            self.invalidate_expiry(guild_id)
+        elif name == "role_add_history":
+            self._prepare_history(guild_id)
+            for user_id in {u for u, _ in diff}:
+                if user_id is None:
+                    self._history_epoch = next(self._history_counter)
+                else:
+                    self._bump_history_version(guild_id, user_id)
+
+    def reload_settings(self):
+        """外部で編集されたグローバル設定を読み込み直す。変更箇所の一覧を返す"""
+        if not self.is_externally_changed(SETTINGS_FILE):
+            return []
+        self._record_stamp(SETTINGS_FILE)
+        new = read_json(SETTINGS_FILE)
+        if not isinstance(new, dict):
+            return []
+        new, _, migrated = migrate_settings(new)
+        diff = diff_sections(self.settings, new)
+        if diff:
+            self.settings = new
+            self.bump_store_version(None, "settings")
+            if not migrated:
+                self._persisted_global = self._global_snapshot()
+        return diff
+
+    def reload_manifest(self):
+        """外部で編集されたマニフェストを読み込み直す。
+        読み込み済みのギルドはメモリ上の内容が正なので、未読み込みのギルド分のみ反映する"""
+        if not self.is_externally_changed(MANIFEST_FILE):
+            return []
+        self._record_stamp(MANIFEST_FILE)
+        manifest = load_manifest()
+        if manifest is None:
+            return []
+        current = {g: kinds for g, kinds in self._manifest.items() if g not in self._loaded}
+        incoming = {g: kinds for g, kinds in manifest.items() if g not in self._loaded}
+        diff = diff_sections(current, incoming)
+        for guild_id in {g for g, _ in diff}:
+            if guild_id in incoming:
+                self._manifest[guild_id] = incoming[guild_id]
+            else:
+                self._manifest.pop(guild_id, None)
+        return diff
+
+    async def reload_file(self, guild_id, name):
+        """watched_files の1件を、保存処理と競合しないよう対応するロックを取得して読み込み直す"""
+        if name == "settings":
+            async with self._global_lock:
+                return self.reload_settings()
+        if name == "manifest":
+            async with self._manifest_lock:
+                return self.reload_manifest()
+        async with self.guild_lock(guild_id):
+            return self.reload_guild_store(guild_id, name)
+
+    def bump_store_version(self, guild_id, name):
+        """ストアの変更を記録する。保存時の差分検知でも呼ばれるため、
+        直接書き換えた場合も save_guild / save_global の時点で反映される"""
+        self._store_versions[(guild_id, name)] = next(self._store_counter)
+
+    def store_version(self, guild_id, names):
+        """names の各ストアのバージョンの組。"settings" はグローバル設定を表す"""
+        return tuple(
+            self._store_versions.get((None if name == "settings" else guild_id, name), 0) for name in names
         )
+
+    def expiring_role_defs(self, guild_id):
+        """ギルドの期限付きロール定義 {role_id: {"name", "seconds"}}（定義順）"""
+        return self.expiring_roles.get(guild_id, {})
+
+    def is_expiring(self, guild_id, role_id):
+        return role_id in self.expiring_roles.get(guild_id, {})
+
+    def role_name(self, guild_id, role_id):
+        """表示用のロール名（定義に無い場合はキーをそのまま返す）"""
+        definition = self.expiring_roles.get(guild_id, {}).get(role_id)
+        return definition["name"] if definition else role_id
+
+    def set_expiring_role(self, guild_id, role_id, name, seconds=None):
+        """期限付きロールを追加・更新する。seconds 省略時は既存の値（新規は既定値）を使う"""
+        defs = self.expiring_roles.setdefault(guild_id, {})
+        current = defs.get(role_id, {})
+        if seconds is None:
+            seconds = current.get("seconds", DEFAULT_EXPIRING_ROLE_SECONDS)
+        defs[role_id] = {"name": name, "seconds": seconds}
+        self.bump_store_version(guild_id, "expiring_roles")
+        if current.get("seconds") != seconds:
+            self.invalidate_expiry(guild_id)
+
+    def remove_expiring_role(self, guild_id, role_id):
+        """定義を削除し、そのロールの付与記録・個人設定も削除する（履歴は残す）。削除した付与記録の件数を返す"""
+        defs = self.expiring_roles.get(guild_id, {})
+        if defs.pop(role_id, None) is None:
+            return 0
+        self.bump_store_version(guild_id, "expiring_roles")
+        cleared = 0
+        for user_id, roles in list(self.role_data.get(guild_id, {}).items()):
+            if role_id in roles:
+                self.clear_assignment(guild_id, user_id, role_id)
+                cleared += 1
+        for user_id in list(self.user_remove_seconds.get(guild_id, {})):
+            self.remove_user_setting(guild_id, user_id, role_id)
+        self.invalidate_expiry(guild_id)
+        return cleared
+
+    def has_role_definitions(self, guild_id):
+        """ロールID 形式へ移行済み（定義ストアを持つ）か"""
+        return guild_id in self.expiring_roles
+
+    def migrate_role_keys(self, guild_id, name_to_id):
+        """ロール名をキーとしていたギルドのデータをロールID キーへ移行する（定義ストアが無いギルドで一度だけ）。
+        name_to_id はギルドの {ロール名: role_id}。ROLES_TO_AUTO_REMOVE のうち存在するロールを
+        グローバル設定の削除期間で定義する。付与記録・個人設定のうち解決できないロールは破棄し、
+        履歴は元のキーのまま残す。移行した件数を返す"""
+        defs = {}
+        for name in ROLES_TO_AUTO_REMOVE:
+            role_id = name_to_id.get(name)
+            if role_id is not None:
+                seconds = self.settings.get("remove_seconds", {}).get(name, DEFAULT_REMOVE_SECONDS[name])
+                defs[role_id] = {"name": name, "seconds": seconds}
+        mapping = {d["name"]: role_id for role_id, d in defs.items()}
+        moved = 0
+        for store in (self.role_data, self.user_remove_seconds, self.role_add_history):
+            if not store.get(guild_id):
+                continue
+            users = self._writable(store.name, guild_id)
+            for user_id, roles in list(users.items()):
+                renamed = {}
+                for key, value in roles.items():
+                    if key in mapping:
+                        renamed[mapping[key]] = value
+                        moved += 1
+                    elif store is self.role_add_history:
+                        renamed[key] = value
+                if renamed:
+                    users[user_id] = renamed
+                else:
+                    del users[user_id]
+            self.bump_store_version(guild_id, store.name)
+        if mapping and self.history_archive.counts.get(guild_id):
+            self._rename_archive_roles(guild_id, mapping)
+        self.expiring_roles[guild_id] = defs
+        self.bump_store_version(guild_id, "expiring_roles")
+        self.invalidate_expiry(guild_id)
+        self._history_epoch = next(self._history_counter)
+        logger.info(f"Migrated role keys to role IDs for guild {guild_id}: {len(defs)} roles, {moved} entries")
+        return moved
+
+    def set_assignment(self, guild_id, user_id, role_id, timestamp):
+        """ロール付与時刻を記録し、期限インデックスを更新する"""
+        users = self._writable("role_data", guild_id)
+        users[user_id] = {**users.get(user_id, {}), role_id: timestamp}
+        self.bump_store_version(guild_id, "role_data")
+        self._update_expiry(guild_id, user_id, role_id)
+        self.note_user_change(guild_id, user_id)
+
+    def clear_assignment(self, guild_id, user_id, role_id=None):
+        """ロール付与記録を削除する（role_id 省略時はユーザー分すべて）。空になったユーザーは削除"""
+        user_roles = self.role_data.get(guild_id, {}).get(user_id)
+        if user_roles is None:
+            return
+        remaining = {r: ts for r, ts in user_roles.items() if role_id and r != role_id}
+        users = self._writable("role_data", guild_id)
+        if remaining:
+            users[user_id] = remaining
+        else:
+            del users[user_id]
+        for r in user_roles.keys() - remaining.keys():
+            self._update_expiry(guild_id, user_id, r)
+        self.bump_store_version(guild_id, "role_data")
+        self.note_user_change(guild_id, user_id)
+
+    def note_user_change(self, guild_id, user_id):
+        """記録・ロールが変わったユーザーを整合性チェックの優先対象にする（古いものから上限を超えた分を捨てる）"""
+        recent = self._recent_users.setdefault(guild_id, {})
+        recent.pop(user_id, None)
+        recent[user_id] = None
+        if len(recent) > SWEEP_RECENT_MAX:
+            del recent[next(iter(recent))]
+
+    def pop_recent_users(self, guild_id, limit):
+        """優先照合の対象を変更の古い順に最大 limit 人取り出す"""
+        recent = self._recent_users.get(guild_id)
+        if not recent:
+            return []
+        users = list(itertools.islice(recent, limit))
+        for user_id in users:
+            del recent[user_id]
+        return users
+
+    def discard_recent_users(self, guild_id, user_ids):
+        """照合済みのユーザーを優先対象から外す（照合による修正で再登録された分）"""
+        recent = self._recent_users.get(guild_id)
+        if recent:
+            for user_id in user_ids:
+                recent.pop(user_id, None)
+
+    def expiry_index(self, guild_id):
+        """ギルドの削除期限インデックスを返す（未構築なら role_data から構築）"""
+        index = self._expiry.get(guild_id)
+        if index is None:
+            index = self._expiry[guild_id] = ExpiryIndex(
+                (ts + self.get_remove_seconds(guild_id, u, r), u, r)
+                for u, roles in self.role_data.get(guild_id, {}).items()
+                for r, ts in roles.items()
+                if ts and self.is_expiring(guild_id, r)
+            )
+        return index
+
+    def invalidate_expiry(self, guild_id=None):
+        """一括変更後にインデックスを破棄する（次回参照時に再構築）"""
+        if guild_id is None:
+            self._expiry.clear()
+        else:
+            self._expiry.pop(guild_id, None)
+
+    def _update_expiry(self, guild_id, user_id, role_id):
+        index = self._expiry.get(guild_id)
+        if index is None:
+            return
+        ts = self.role_data.get(guild_id, {}).get(user_id, {}).get(role_id)
+        deadline = None
+        if ts and self.is_expiring(guild_id, role_id):
+            deadline = ts + self.get_remove_seconds(guild_id, user_id, role_id)
+        index.update(user_id, role_id, deadline)
+
+    def get_remove_seconds(self, guild_id, user_id, role_id):
+        user_setting = self.user_remove_seconds.get(guild_id, {}).get(user_id, {}).get(role_id)
         if user_setting is not None:
             return user_setting
-        return self.settings["remove_seconds"].get(role_name, DEFAULT_REMOVE_SECONDS.get(role_name, 90 * 86400))
+        definition = self.expiring_roles.get(guild_id, {}).get(role_id)
+        return definition["seconds"] if definition else DEFAULT_EXPIRING_ROLE_SECONDS
+
+    def set_user_remove_seconds(self, guild_id, user_id, role_id, seconds):
+        users = self._writable("user_remove_seconds", guild_id)
+        users[user_id] = {**users.get(user_id, {}), role_id: seconds}
+        self.bump_store_version(guild_id, "user_remove_seconds")
+        self._update_expiry(guild_id, user_id, role_id)
+
+    def remove_user_setting(self, guild_id, user_id, role_id):
+        user_roles = self.user_remove_seconds.get(guild_id, {}).get(user_id, {})
+        if role_id not in user_roles:
+            return False
+        users = self._writable("user_remove_seconds", guild_id)
+        remaining = {r: v for r, v in user_roles.items() if r != role_id}
+        if remaining:
+            users[user_id] = remaining
+        else:
+            del users[user_id]
+        if not users:
+            del self.user_remove_seconds[guild_id]
+        self.bump_store_version(guild_id, "user_remove_seconds")
+        self._update_expiry(guild_id, user_id, role_id)
+        return True
+
+    def add_role_history(self, guild_id, user_id, role_id, timestamp):
+        if not self.is_expiring(guild_id, role_id):
+            return
+        # 時系列順を保ったまま挿入（通常は末尾への追加になる）。リストは複製して差し替える
+        users = self._writable("role_add_history", guild_id)
+        roles = dict(users.get(user_id, {}))
+        history = list(roles.get(role_id, []))
+        insort(history, {"timestamp": timestamp, "reason": ""}, key=_entry_ts)
+        roles[role_id] = history
+        users[user_id] = roles
+        self.bump_store_version(guild_id, "role_add_history")
+        self._bump_history_version(guild_id, user_id)
 
-    def set_user_remove_seconds(self, guild_id, user_id, role_name, seconds):
-        self.settings.setdefault("user_remove_seconds", {}).setdefault(guild_id, {}).setdefault(user_id, {})[role_name] = seconds
+    def _bump_history_version(self, guild_id, user_id):
+        version = next(self._history_counter)
+        self._history_versions[(guild_id, user_id)] = version
+        self._history_guild_versions[guild_id] = version
 
-    def remove_user_setting(self, guild_id, user_id, role_name):
+    def history_version(self, guild_id, user_id):
+        """ユーザー履歴のバージョン。内容が変わるたびに値が変化する"""
+        return (self._history_epoch, self._history_versions.get((guild_id, user_id), 0))
+
+    def history_guild_version(self, guild_id):
+        """ギルド全体の履歴バージョン（集計結果キャッシュの無効化に使用）"""
+        return (self._history_epoch, self._history_guild_versions.get(guild_id, 0))
+
+    async def scan_full_history(self, guild_id, func):
+        """アーカイブ分を含むギルドの全履歴を (user_id, role_id, entry) で返すイテレータを
+        func に渡してスレッドで実行し、結果を返す。メモリ上の履歴はスナップショットを走査し、
+        アーカイブは走査中に書き換えられないよう _archive_lock を保持する"""
+        async with self._archive_lock:
+            await self.load_history_archive(guild_id)
+            hot = self.snapshot(guild_id, "role_add_history")
+            archived = self.history_archive.load_guild(guild_id) if self.history_archive.counts.get(guild_id) else {}
+            return await asyncio.to_thread(func, _iter_history(archived, hot))
+
+    async def edit_role_history_reason(self, guild_id, user_id, role_id, index, reason):
+        """index はアーカイブ分を含めた通し番号（古い順、0 始まり）"""
+        archived = self.history_archive.count(guild_id, user_id, role_id)
+        if index < archived:
+            try:
+                edited = await self._update_archive(
+                    guild_id, lambda: self.history_archive.edit_reason(guild_id, user_id, role_id, index, reason)
+                )
+            except Exception as e:
+                logger.error(f"Archive reason edit error: {e}")
+                return False
+            if edited:
+                self._bump_history_version(guild_id, user_id)
+            return edited
+        return self.edit_role_history_reasons(guild_id, user_id, role_id, {index - archived: reason}) == 1
+
+    def edit_role_history_reasons(self, guild_id, user_id, role_id, edits):
+        """保持期間内の履歴の理由をまとめて書き換え、書き換えた件数を返す。
+        edits は {メモリ上の履歴の位置（アーカイブ分を含まない）: 理由}。範囲外の位置は無視する"""
+        history = self.role_add_history.get(guild_id, {}).get(user_id, {}).get(role_id, [])
+        edits = {i: reason for i, reason in edits.items() if 0 <= i < len(history)}
+        if not edits:
+            return 0
+        history = list(history)
+        for i, reason in edits.items():
+            history[i] = {**history[i], "reason": reason}
+        users = self._writable("role_add_history", guild_id)
+        users[user_id] = {**users[user_id], role_id: history}
+        self.bump_store_version(guild_id, "role_add_history")
+        self._bump_history_version(guild_id, user_id)
+        return len(edits)
+
+    def get_history_counts(self, guild_id, user_id):
+        """ロールごとの (アーカイブ件数, メモリ上の件数) を返す"""
+        hot = self.role_add_history.get(guild_id, {}).get(user_id, {})
+        archived = self.history_archive.user_counts(guild_id, user_id)
+        roles = list(hot) + [r for r in archived if r not in hot]
+        return {r: (archived.get(r, 0), len(hot.get(r, []))) for r in roles}
+
+    def get_role_history(self, guild_id, user_id, role_id, include_archive=False):
+        """ロール履歴を古い順で返す。include_archive=True の場合はアーカイブ分を先頭に結合する"""
+        hot = self.role_add_history.get(guild_id, {}).get(user_id, {}).get(role_id, [])
+        if not include_archive or not self.history_archive.count(guild_id, user_id, role_id):
+            return hot
+        return self.history_archive.get_entries(guild_id, user_id, role_id) + hot
+
+    def get_role_history_range(self, guild_id, user_id, role_id, start, end):
+        """通し番号 [start, end) の履歴を (index, entry) の組で返す。
+        アーカイブは範囲が保持期間外にかかる場合のみ参照する。"""
+        archived = self.history_archive.count(guild_id, user_id, role_id)
+        hot = self.role_add_history.get(guild_id, {}).get(user_id, {}).get(role_id, [])
+        end = min(end, archived + len(hot))
+        result = []
+        if start < archived:
+            cold = self.history_archive.get_entries(guild_id, user_id, role_id)
+            result.extend((i, cold[i]) for i in range(start, min(end, archived, len(cold))))
+        result.extend((i, hot[i - archived]) for i in range(max(start, archived), end))
+        return result
+
+    async def load_history_archive(self, guild_id):
+        """アーカイブをスレッドで読み込んでキャッシュへ登録する。
+        登録はイベントループ上で行うため、この関数から戻った直後は必ず読み込み済みになっている"""
+        if not self.history_archive.is_loaded(guild_id):
+            data = await asyncio.to_thread(self.history_archive.read_guild, guild_id)
+            self.history_archive.remember(guild_id, data)
+
+    def _rename_archive_roles(self, guild_id, mapping):
+        """アーカイブ側のロールキーを付け替える。イベントループ上では _update_archive を使うタスクとして後から行う"""
         try:
-            user_roles = self.settings.get("user_remove_seconds", {}).get(guild_id, {}).get(user_id, {})
-            if role_name in user_roles:
-                del user_roles[role_name]
-                if not user_roles:
-                    del self.settings["user_remove_seconds"][guild_id][user_id]
-                if not self.settings["user_remove_seconds"][guild_id]:
-                    del self.settings["user_remove_seconds"][guild_id]
-                if not self.settings["user_remove_seconds"]:
-                    del self.settings["user_remove_seconds"]
-                return True
-        except KeyError:
-            pass
-        return False
-
-    def add_role_history(self, guild_id, user_id, role_name, timestamp):
-        if role_name not in ROLES_TO_AUTO_REMOVE:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            try:
+                if self.history_archive.rename_roles(guild_id, mapping):
+                    self.history_archive.save(guild_id)
+            except Exception as e:
+                self.history_archive.load_index()
+                logger.error(f"History archive role migration failed for {guild_id}: {e}")
             return
-        self.role_add_history.setdefault(guild_id, {}).setdefault(user_id, {}).setdefault(role_name, []).append({
-            "timestamp": timestamp,
-            "reason": ""
-        })
+        task = loop.create_task(self._rename_archive_roles_async(guild_id, mapping))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
 
-    def edit_role_history_reason(self, guild_id, user_id, role_name, index, reason):
+    async def _rename_archive_roles_async(self, guild_id, mapping):
         try:
-            self.role_add_history[guild_id][user_id][role_name][index]["reason"] = reason
-            return True
-        except Exception:
-            return False
+            await self._update_archive(guild_id, lambda: self.history_archive.rename_roles(guild_id, mapping))
+        except Exception as e:
+            logger.error(f"History archive role migration failed for {guild_id}: {e}")
+            return
+        self._history_epoch = next(self._history_counter)
+
+    async def _update_archive(self, guild_id, update):
+        """update() でアーカイブのギルド分をメモリ上で変更し、結果が真ならファイルをスレッドで書き込む。
+        書き込みに失敗した場合はメモリ上の内容をディスク上の状態へ戻して例外を送出する"""
+        async with self._archive_lock:
+            await self.load_history_archive(guild_id)
+            data = self.history_archive.load_guild(guild_id)
+            result = update()
+            if not result:
+                return result
+            try:
+                await asyncio.to_thread(self.history_archive.save, guild_id, data)
+            except Exception:
+                self.history_archive.load_index()
+                raise
+            return result
+
+    def _take_history(self, guild_id, cutoff):
+        """cutoff より古い履歴をメモリ上の履歴から取り除き、{user_id: {role_id: [entry, ...]}} で返す"""
+        moved = {}
+        kept = {}
+        for u, roles in self.role_add_history.get(guild_id, {}).items():
+            for r, hist in roles.items():
+                split = bisect_left(hist, cutoff, key=_entry_ts)
+                if split:
+                    moved.setdefault(u, {})[r] = hist[:split]
+                    kept[u] = {k: v for k, v in kept.get(u, roles).items() if k != r}
+                    if split < len(hist):
+                        kept[u][r] = hist[split:]
+        if not moved:
+            return moved
+        users = self._writable("role_add_history", guild_id)
+        for u, roles in kept.items():
+            if roles:
+                users[u] = roles
+            else:
+                del users[u]
+            self._bump_history_version(guild_id, u)
+        self.bump_store_version(guild_id, "role_add_history")
+        if not users:
+            self.role_add_history.pop(guild_id, None)
+        return moved
+
+    def _restore_history(self, guild_id, moved):
+        """アーカイブへの書き込みに失敗した履歴をメモリ上に戻す"""
+        users = self._writable("role_add_history", guild_id)
+        for u, roles in moved.items():
+            current = users.get(u, {})
+            users[u] = {**current, **{r: entries + current.get(r, []) for r, entries in roles.items()}}
+            self._bump_history_version(guild_id, u)
+        self.bump_store_version(guild_id, "role_add_history")
+
+    def compact_history(self, guild_id=None, now=None):
+        """保持期間 (HISTORY_HOT_SECONDS) より古い履歴をアーカイブへ移動し、ギルドごとの移動件数を返す。
+        アーカイブはこのスレッドで書き込む（Bot の稼働中は archive_history を使用する）"""
+        cutoff = (now or now_jst().timestamp()) - HISTORY_HOT_SECONDS
+        guild_ids = [guild_id] if guild_id else list(self.role_add_history.keys())
+        result = {}
+        for g in guild_ids:
+            moved = self._take_history(g, cutoff)
+            if not moved:
+                continue
+            try:
+                self.history_archive.append(g, moved)
+                self.history_archive.save(g)
+            except Exception as e:
+                logger.error(f"History archive write failed for {g}: {e}")
+                self.history_archive.load_index()
+                self._restore_history(g, moved)
+                continue
+            result[g] = sum(len(v) for roles in moved.values() for v in roles.values())
+        return result
+
+    async def archive_history(self, guild_id, now=None):
+        """compact_history のギルド単位・非同期版。アーカイブの書き込みはスレッドで行い、移動件数を返す"""
+        cutoff = (now or now_jst().timestamp()) - HISTORY_HOT_SECONDS
+        hot = self.role_add_history.get(guild_id, {})
+        # 移動対象が無ければアーカイブは読み込まない
+        if not any(h and h[0]["timestamp"] < cutoff for roles in hot.values() for h in roles.values()):
+            return 0
+        moved = {}
+
+        def take():
+            moved.update(self._take_history(guild_id, cutoff))
+            if moved:
+                self.history_archive.append(guild_id, moved)
+            return bool(moved)
+        try:
+            await self._update_archive(guild_id, take)
+        except Exception as e:
+            logger.error(f"History archive write failed for {guild_id}: {e}")
+            self._restore_history(guild_id, moved)
+            return 0
+        return sum(len(v) for roles in moved.values() for v in roles.values())
+
+    def get_history_stats(self, guild_id):
+        hot_users = self.role_add_history.get(guild_id, {})
+        hot_entries = sum(len(h) for roles in hot_users.values() for h in roles.values())
+        archive = self.history_archive.stats(guild_id)
+        cutoff = now_jst().timestamp() - HISTORY_HOT_SECONDS
+        pending = sum(
+            bisect_left(h, cutoff, key=_entry_ts) for roles in hot_users.values() for h in roles.values()
+        )
+        return {
+            "hot_entries": hot_entries,
+            "hot_users": len(hot_users),
+            "archived_entries": archive["entries"],
+            "archived_users": archive["users"],
+            "archive_size": archive["size"],
+            "pending": pending,
+        }
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import logging
+from bisect import bisect_left
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+def _entry_ts(entry):
+    return entry["timestamp"]
+
+class EscalationEngine:
+    """エスカレーションルール（例: 30日以内に 注意 3回で 警告 を付与）の判定。
+    ルールは DataManager の escalation_rules {guild_id: {元ロールID: ルール}} に保存する。
+
+    (ギルド, ユーザー, 元ロール) ごとに期間内の付与時刻を deque で保持し、付与のたびに
+    末尾へ追加・期間外を先頭から除くだけで件数を求める（履歴を毎回走査しない）。
+    deque は初回参照時と、履歴が追記以外で変わった場合（圧縮・復元・外部編集）のみ履歴から作り直す。
+    期間は履歴の保持期間以内に制限しているため、アーカイブ分を参照する必要は無い。
+    一度発火すると、その時刻が期間外になるまでは同じ (ユーザー, 元ロール) で再び発火しない。"""
+
+    def __init__(self, data):
+        self.data = data
+        # (guild_id, user_id, role_id) -> [期間内の付与時刻の deque, 対応する履歴の件数, 期間（秒）, 最後に発火した時刻]
+        self._windows = {}
+        self.rebuilds = 0
+        self.fired = 0
+
+    def rule(self, guild_id, role_id):
+        return self.data.escalation_rules.get(guild_id, {}).get(role_id)
+
+    def observe(self, guild_id, user_id, role_id, timestamp):
+        """role_id の付与（履歴へ追加済み）を反映し、期間内の件数がちょうど規定回数に達した場合はルールを返す。
+        規定回数を超えた分や、前回の発火時刻が期間内の場合は発火しないため、
+        古い付与が期間外になって件数が再び規定回数に戻っても繰り返し付与されることは無い"""
+        rule = self.rule(guild_id, role_id)
+        if rule is None:
+            return None
+        window = rule["window_seconds"]
+        hot = self.data.role_add_history.get(guild_id, {}).get(user_id, {}).get(role_id, [])
+        key = (guild_id, user_id, role_id)
+        state = self._windows.get(key)
+        if (state is not None and state[2] == window and state[1] + 1 == len(hot)
+                and hot[-1]["timestamp"] == timestamp):
+            times = state[0]
+            times.append(timestamp)
+            state[1] = len(hot)
+        else:
+            start = bisect_left(hot, timestamp - window, key=_entry_ts)
+            times = deque(e["timestamp"] for e in hot[start:] if e["timestamp"] <= timestamp)
+            earlier = hot[:bisect_left(hot, timestamp, key=_entry_ts)]
+            state = self._windows[key] = [times, len(hot), window, self._last_fire(earlier, rule["count"], window)]
+            self.rebuilds += 1
+        while times and times[0] < timestamp - window:
+            times.popleft()
+        if len(times) == rule["count"] and (state[3] is None or state[3] < timestamp - window):
+            state[3] = timestamp
+            self.fired += 1
+            return rule
+        return None
+
+    @staticmethod
+    def _last_fire(entries, count, window):
+        """entries（古い順の履歴）を順に判定した場合に最後に発火した時刻（発火しない場合は None）。
+        deque を作り直した場合（再起動後など）に前回の発火時刻を求めるために使用する"""
+        times = deque()
+        last = None
+        for entry in entries:
+            ts = entry["timestamp"]
+            times.append(ts)
+            while times[0] < ts - window:
+                times.popleft()
+            if len(times) == count and (last is None or last < ts - window):
+                last = ts
+        return last
+
+    def count(self, guild_id, user_id, role_id):
+        """直近の判定時点の期間内件数（未判定の場合は None）"""
+        state = self._windows.get((guild_id, user_id, role_id))
+        return len(state[0]) if state else None
+
+    def forget(self, guild_id=None):
+        """保持している deque を破棄する（ルール変更時など。次回の判定で履歴から作り直す）"""
+        if guild_id is None:
+            self._windows.clear()
+        else:
+            for key in [k for k in self._windows if k[0] == guild_id]:
+                del self._windows[key]
+
+    def stats(self):
+        return {"windows": len(self._windows), "rebuilds": self.rebuilds, "fired": self.fired}
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from config import EVENT_QUEUE_WORKERS, EVENT_QUEUE_MAX_PER_GUILD, EVENT_QUEUE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+class MemberEventQueue:
+    """メンバー更新イベントの後続処理キュー。
+    ギルドごとに保留中のメンバーを1件にまとめ（同一メンバーの重複更新は統合）、
+    固定数のワーカーがバッチ単位で handler を実行し、バッチごとに1回だけ保存する。"""
+
+    def __init__(self, bot, handler, workers=EVENT_QUEUE_WORKERS,
+                 max_pending=EVENT_QUEUE_MAX_PER_GUILD, batch_size=EVENT_QUEUE_BATCH_SIZE):
+        self.bot = bot
+        self.handler = handler
+        self.worker_count = workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        # guild_id -> OrderedDict(member_id -> [member, role_ids, enqueued_at])
+        self._pending = {}
+        self._ready = asyncio.Queue()
+        self._scheduled = set()
+        self._workers = []
+        self.processed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.batches = 0
+        self._latencies = deque(maxlen=1000)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, member, roles):
+        """追加されたロールを登録する。キューが上限に達している場合は False（定期同期で補完される）"""
+        guild_id = str(member.guild.id)
+        pending = self._pending.setdefault(guild_id, OrderedDict())
+        entry = pending.get(member.id)
+        if entry is not None:
+            entry[0] = member
+            entry[1].update(r.id for r in roles)
+            self.coalesced += 1
+        else:
+            if len(pending) >= self.max_pending:
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logger.warning(f"Member event queue full for guild {guild_id} (dropped: {self.dropped})")
+                return False
+            pending[member.id] = [member, {r.id for r in roles}, time.monotonic()]
+        if guild_id not in self._scheduled:
+            self._scheduled.add(guild_id)
+            self._ready.put_nowait(guild_id)
+        return True
+
+    def depth(self, guild_id=None):
+        if guild_id is not None:
+            return len(self._pending.get(guild_id, ()))
+        return sum(len(p) for p in self._pending.values())
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self.depth(),
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+    async def _worker(self):
+        while True:
+            guild_id = await self._ready.get()
+            try:
+                await self._process_batch(guild_id)
+            except Exception as e:
+                logger.error(f"Member event queue error for guild {guild_id}: {e}")
+            finally:
+                # 同じギルドは同時に1ワーカーのみが処理する。残りがあれば再度キューへ
+                if self._pending.get(guild_id):
+                    self._ready.put_nowait(guild_id)
+                else:
+                    self._pending.pop(guild_id, None)
+                    self._scheduled.discard(guild_id)
+
+    async def _process_batch(self, guild_id):
+        pending = self._pending.get(guild_id)
+        if not pending:
+            return
+        batch = [pending.popitem(last=False) for _ in range(min(self.batch_size, len(pending)))]
+        for member_id, (member, role_ids, enqueued_at) in batch:
+            try:
+                await self.handler(member, role_ids)
+            except Exception as e:
+                logger.error(f"Member event handler error for {member}: {e}")
+            self.processed += 1
+            self._latencies.append(time.monotonic() - enqueued_at)
+        self.batches += 1
+        await self.bot.data.save_guild(guild_id)
@@ -1,46 +1,119 @@
 # -*- coding: utf-8 -*-
 import discord
-import asyncio
+import json
 import logging
-from config import ROLES_TO_AUTO_REMOVE
-from helpers import now_jst
-from core import register_external_role_add, check_and_apply_tenure_role
+from core import register_external_role_add, check_and_apply_tenure_role, relevant_role_ids, ensure_expiring_roles
+from event_queue import MemberEventQueue
+from log_setup import member_context
 
 logger = logging.getLogger(__name__)
 
 def setup_events(bot):
     """すべてのイベントハンドラを登録"""
-    
+
+    async def handle_added_roles(member, role_ids):
+        await _process_added_roles(bot, member, role_ids)
+
+    bot.event_queue = MemberEventQueue(bot, handle_added_roles)
+
     @bot.event
-    async def on_member_update(before: discord.Member, after: discord.Member):
+    async def on_socket_raw_receive(msg):
         """外部でロールが付与/削除された際の検知処理。
-        付与されたロールに対して即時処理（テニュアルール判定 / 自動削除ロール登録）を行う。"""
+        ギルドは chunk しないため、未キャッシュのメンバーの更新には on_member_update が呼ばれない。
+        そのため GUILD_MEMBER_UPDATE を直接読み、未登録の期限付きロール・未処理のトリガーロールのみ後続処理キューへ登録する。
+        このハンドラはライブラリの解析後に実行されるので、該当メンバーはキャッシュ済み"""
+        if not isinstance(msg, str) or '"GUILD_MEMBER_UPDATE"' not in msg:
+            return
         try:
-            before_roles = {r.id: r for r in before.roles}
-            added = [r for r in after.roles if r.id not in before_roles]
-            if not added:
+            payload = json.loads(msg)
+            if payload.get("t") != "GUILD_MEMBER_UPDATE":
+                return
+            data = payload["d"]
+            guild = bot.get_guild(int(data["guild_id"]))
+            member = guild.get_member(int(data["user"]["id"])) if guild else None
+            if member is None or member.bot:
                 return
-
-            guild = after.guild
             guild_id = str(guild.id)
+            current = {int(r) for r in data.get("roles", [])}
+            recorded = bot.data.role_data.get(guild_id, {}).get(str(member.id), {})
+            if any(int(r) not in current for r in recorded):
+                # 外部で外された期限付きロールは整合性チェックで優先して記録から外す
+                bot.data.note_user_change(guild_id, str(member.id))
             tenure_rules = bot.data.tenure_rules.get(guild_id, {})
+            targets = []
+            for role in map(guild.get_role, relevant_role_ids(bot, guild)):
+                if role is None:
+                    continue
+                if role.id not in current:
+                    if role.name in tenure_rules:
+                        # 外されたトリガーロールは、再び付与された時に処理する
+                        bot.trigger_holders.discard(guild_id, member.id, role.name)
+                    continue
+                if bot.data.is_expiring(guild_id, str(role.id)):
+                    if str(role.id) not in recorded:
+                        targets.append(role)
+                elif member.id not in bot.trigger_holders.holders(guild_id, role.name):
+                    targets.append(role)
+            if targets:
+                bot.event_queue.submit(member, targets)
+        except Exception as e:
+            logger.error(f"on_socket_raw_receive member update error: {e}")
 
-            for role in added:
-                # 1) もし追加ロールが自動削除対象なら内部登録（timestamp / 履歴）
-                if role.name in ROLES_TO_AUTO_REMOVE:
-                    asyncio.create_task(register_external_role_add(bot, after, role))
+    @bot.event
+    async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+        """記録のあるメンバーが退出した場合は整合性チェックで優先して記録から外す"""
+        guild_id, user_id = str(payload.guild_id), str(payload.user.id)
+        bot.trigger_holders.discard(guild_id, user_id)
+        if user_id in bot.data.role_data.get(guild_id, {}):
+            bot.data.note_user_change(guild_id, user_id)
 
-                # 2) もし追加ロールがテニュアのトリガーなら即時処理
-                if role.name in tenure_rules:
-                    asyncio.create_task(_handle_trigger_role_immediate(bot, after, role))
+    @bot.event
+    async def on_guild_join(guild: discord.Guild):
+        """新しく参加したギルドの期限付きロール定義を用意する"""
+        try:
+            if ensure_expiring_roles(bot, guild):
+                await bot.data.save_guild(str(guild.id))
         except Exception as e:
-            logger.error(f"on_member_update error for {after}: {e}")
+            logger.error(f"on_guild_join error for {guild}: {e}")
+
+    @bot.event
+    async def on_guild_role_update(before: discord.Role, after: discord.Role):
+        """期限付きロールの名前が変わった場合は表示用の名前のみ更新する（記録はロールID で保持）"""
+        guild_id, role_id = str(after.guild.id), str(after.id)
+        if before.name != after.name and bot.data.is_expiring(guild_id, role_id):
+            bot.data.set_expiring_role(guild_id, role_id, after.name)
+            await bot.data.save_guild(guild_id)
+
+    @bot.event
+    async def on_guild_role_delete(role: discord.Role):
+        """削除された期限付きロールの定義と付与記録を削除する（履歴は残す）"""
+        guild_id, role_id = str(role.guild.id), str(role.id)
+        if bot.data.is_expiring(guild_id, role_id):
+            cleared = bot.data.remove_expiring_role(guild_id, role_id)
+            await bot.data.save_guild(guild_id)
+            logger.info(f"Expiring role deleted: {role.name} ({role_id}) in {role.guild.name}, {cleared} assignments cleared")
+
+async def _process_added_roles(bot, member: discord.Member, role_ids):
+    """キューから取り出した1メンバー分の付与ロールを処理する（保存はキュー側でまとめて実行）"""
+    guild_id = str(member.guild.id)
+    tenure_rules = bot.data.tenure_rules.get(guild_id, {})
+    for role_id in role_ids:
+        role = member.guild.get_role(role_id)
+        if role is None:
+            continue
+        # 1) もし追加ロールが自動削除対象なら内部登録（timestamp / 履歴）
+        if bot.data.is_expiring(guild_id, str(role_id)):
+            await register_external_role_add(bot, member, role, save=False)
+
+        # 2) もし追加ロールがテニュアのトリガーなら即時処理
+        if role.name in tenure_rules:
+            await _handle_trigger_role_immediate(bot, member, role)
 
 async def _handle_trigger_role_immediate(bot, member: discord.Member, trigger_role: discord.Role):
     """トリガーロール付与検知時の即時処理ラッパー。
     check_and_apply_tenure_role を呼んでから、処理結果に応じてログ等を出す。"""
     try:
         await check_and_apply_tenure_role(bot, member, trigger_role)
-        logger.info(f"Handled trigger role immediately: {member.display_name} / {trigger_role.name}")
+        logger.info(f"Handled trigger role immediately: {member.display_name} / {trigger_role.name}", extra=member_context(member))
     except Exception as e:
-        logger.error(f"_handle_trigger_role_immediate error for {member}: {e}")
+        logger.error(f"_handle_trigger_role_immediate error for {member}: {e}", extra=member_context(member))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, insort
+
+class ExpiryIndex:
+    """ギルド内の自動削除期限を (期限, user_id, ロール名) の昇順で保持するインデックス。
+    範囲検索は bisect で行い、付与・個人設定の変更時に1件単位で更新する。"""
+
+    def __init__(self, entries=()):
+        self._entries = sorted(entries)
+        self._deadlines = {(u, r): d for d, u, r in self._entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def deadline(self, user_id, role_name):
+        return self._deadlines.get((user_id, role_name))
+
+    def update(self, user_id, role_name, deadline):
+        """期限を更新する。deadline が None の場合は削除"""
+        key = (user_id, role_name)
+        old = self._deadlines.pop(key, None)
+        if old is not None:
+            item = (old, user_id, role_name)
+            i = bisect_left(self._entries, item)
+            if i < len(self._entries) and self._entries[i] == item:
+                del self._entries[i]
+        if deadline is not None:
+            insort(self._entries, (deadline, user_id, role_name))
+            self._deadlines[key] = deadline
+
+    def range(self, start, end, role_name=None):
+        """start <= 期限 < end のエントリを期限順で返す"""
+        lo = bisect_left(self._entries, (start,))
+        hi = bisect_left(self._entries, (end,))
+        if role_name is None:
+            return self._entries[lo:hi]
+        return [e for e in self._entries[lo:hi] if e[2] == role_name]
+
+    def page(self, start, end, offset, limit):
+        """start <= 期限 < end のエントリのうち、期限順で offset 件目から limit 件を返す"""
+        lo = bisect_left(self._entries, (start,)) + offset
+        hi = min(bisect_left(self._entries, (end,)), lo + limit)
+        return self._entries[lo:hi]
+
+    def count_range(self, start, end, role_name=None):
+        if role_name is None:
+            return bisect_left(self._entries, (end,)) - bisect_left(self._entries, (start,))
+        return len(self.range(start, end, role_name))
+
+    def next(self, count, after, role_name=None):
+        """after 以降で期限が近い順に count 件を返す"""
+        result = []
+        for i in range(bisect_left(self._entries, (after,)), len(self._entries)):
+            entry = self._entries[i]
+            if role_name is None or entry[2] == role_name:
+                result.append(entry)
+                if len(result) >= count:
+                    break
+        return result
+
+    def histogram(self, start, bucket_seconds, buckets, role_name=None):
+        """start から bucket_seconds 刻みで buckets 個の区間ごとの件数を返す"""
+        return [
+            self.count_range(start + i * bucket_seconds, start + (i + 1) * bucket_seconds, role_name)
+            for i in range(buckets)
+        ]
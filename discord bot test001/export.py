@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import tempfile
+import zlib
+from config import EXPORT_MAX_PART_BYTES, EXPORT_YIELD_EVERY
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ["type", "user_id", "role", "timestamp", "value", "reason", "archived"]
+# 圧縮データを書き出して残りサイズを確認する間隔（レコード数）
+FLUSH_EVERY = 200
+# 確認間隔内に増えうるサイズの余裕分
+PART_MARGIN = 256 * 1024
+
+def iter_export_records(data, guild_id):
+    """ギルドのロール付与状況・個人設定・履歴を1件ずつ返す。
+    開始時点のスナップショットを走査するため、途中でイベントループに制御を返しても
+    書き込みの影響を受けず、3種のデータは同じ時点の内容になる。"""
+    assignments = data.snapshot(guild_id, "role_data")
+    overrides = data.snapshot(guild_id, "user_remove_seconds")
+    hot = data.snapshot(guild_id, "role_add_history")
+    for user_id, roles in assignments.items():
+        for role_name, ts in roles.items():
+            yield {"type": "assignment", "user_id": user_id, "role": role_name, "timestamp": ts}
+    for user_id, roles in overrides.items():
+        for role_name, seconds in roles.items():
+            yield {"type": "override", "user_id": user_id, "role": role_name, "value": seconds}
+    archived = data.history_archive.load_guild(guild_id) if data.history_archive.counts.get(guild_id) else {}
+    for source, is_archived in ((archived, True), (hot, False)):
+        for user_id in list(source):
+            for role_name, entries in list(source.get(user_id, {}).items()):
+                for entry in list(entries):
+                    yield {
+                        "type": "history", "user_id": user_id, "role": role_name,
+                        "timestamp": entry["timestamp"], "reason": entry.get("reason", ""),
+                        "archived": is_archived,
+                    }
+
+class _PartWriter:
+    """gzip 圧縮した一時ファイルへ書き込み、上限サイズに近づいたら次のファイルへ切り替える"""
+
+    def __init__(self, fmt, base_name, limit):
+        self.fmt = fmt
+        self.base_name = base_name
+        self.limit = max(limit - PART_MARGIN, PART_MARGIN)
+        self.parts = []
+        self._raw = None
+        self._gz = None
+        self._text = None
+        self._csv = None
+        self._count = 0
+
+    def _open(self):
+        self._raw = tempfile.TemporaryFile()
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self._text = io.TextIOWrapper(self._gz, encoding="utf-8", newline="")
+        if self.fmt == "csv":
+            self._csv = csv.DictWriter(self._text, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            self._csv.writeheader()
+        self._count = 0
+
+    def write(self, record):
+        if self._raw is None:
+            self._open()
+        if self.fmt == "csv":
+            self._csv.writerow(record)
+        else:
+            self._text.write(json.dumps(record, ensure_ascii=False))
+            self._text.write("\n")
+        self._count += 1
+        if self._count % FLUSH_EVERY == 0:
+            self._text.flush()
+            self._gz.flush(zlib.Z_SYNC_FLUSH)
+            if self._raw.tell() >= self.limit:
+                self._close_part()
+
+    def _close_part(self):
+        if self._raw is None:
+            return
+        self._text.flush()
+        self._text.detach()
+        self._gz.close()
+        self._raw.seek(0)
+        ext = "csv" if self.fmt == "csv" else "ndjson"
+        self.parts.append((self._raw, f"{self.base_name}_part{len(self.parts) + 1}.{ext}.gz"))
+        self._raw = None
+
+    def close(self):
+        self._close_part()
+        return self.parts
+
+async def export_guild(data, guild_id, fmt="ndjson", part_limit=EXPORT_MAX_PART_BYTES):
+    """ギルドのデータを gzip 圧縮した NDJSON / CSV の一時ファイル群として書き出す。
+    ([(一時ファイル, 添付ファイル名), ...], 総件数) を返す。一時ファイルは呼び出し側で閉じること。"""
+    await data.load_history_archive(guild_id)
+    writer = _PartWriter(fmt, f"export_{guild_id}", min(part_limit, EXPORT_MAX_PART_BYTES))
+    total = 0
+    try:
+        for record in iter_export_records(data, guild_id):
+            writer.write(record)
+            total += 1
+            if total % EXPORT_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        return writer.close(), total
+    except Exception:
+        for f, _ in writer.close():
+            f.close()
+        raise
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+from storage import file_stamp
+
+logger = logging.getLogger(__name__)
+
+class DataFileWatcher:
+    """DataManager が扱うファイルの mtime / サイズを定期的に確認し、
+    外部で編集されたファイルのストアだけを読み込み直して差分を反映する。"""
+
+    def __init__(self, data):
+        self.data = data
+        self.reloads = 0
+
+    def _scan(self, files):
+        """(path, guild_id, 属性名, 現在の状態) の一覧を返す（スレッドで実行）"""
+        return [(path, guild_id, name, file_stamp(path)) for path, guild_id, name in files]
+
+    async def poll(self):
+        """変更されたファイルを読み込み直し、反映した差分を [(path, diff)] で返す"""
+        stamps = await asyncio.to_thread(self._scan, self.data.watched_files())
+        results = []
+        for path, guild_id, name, stamp in stamps:
+            if not self.data.is_externally_changed(path, stamp):
+                continue
+            try:
+                diff = await self.data.reload_file(guild_id, name)
+            except Exception as e:
+                logger.error(f"Reload error for {path}: {e}")
+                continue
+            if diff:
+                self.reloads += 1
+                results.append((path, diff))
+                logger.info(f"外部変更を反映: {path} ({len(diff)} 件の変更)")
+        return results
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import logging
+from collections import Counter, OrderedDict
+from config import HISTORY_ARCHIVE_DIR, HISTORY_ARCHIVE_CACHE_GUILDS
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+class HistoryArchive:
+    """保持期間を過ぎたロール付与履歴をギルドごとの gzip ファイルに保存する。
+    件数インデックスのみ常駐させ、本体は必要になった時点で読み込む。
+    append / edit_reason はメモリ上の内容のみ変更し、ファイルへは save で書き込む。"""
+
+    def __init__(self, base_dir=HISTORY_ARCHIVE_DIR):
+        self.base_dir = base_dir
+        self.counts = {}
+        self._cache = OrderedDict()
+        self.load_index()
+
+    def load_index(self):
+        path = os.path.join(self.base_dir, INDEX_FILE)
+        self._cache.clear()
+        if not os.path.exists(path):
+            self.counts = {}
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.counts = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading archive index {path}: {e}")
+            self.counts = {}
+
+    def _save_index(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        path = os.path.join(self.base_dir, INDEX_FILE)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.counts, f, ensure_ascii=False, indent=2)
+
+    def _guild_path(self, guild_id):
+        return os.path.join(self.base_dir, f"{guild_id}.json.gz")
+
+    def count(self, guild_id, user_id, role_name):
+        return self.counts.get(guild_id, {}).get(user_id, {}).get(role_name, 0)
+
+    def user_counts(self, guild_id, user_id):
+        return self.counts.get(guild_id, {}).get(user_id, {})
+
+    def is_loaded(self, guild_id):
+        return guild_id in self._cache
+
+    def read_guild(self, guild_id):
+        """ギルドのアーカイブをファイルから読み込む（キャッシュには触れないためスレッドから呼び出せる）"""
+        path = self._guild_path(guild_id)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading history archive {path}: {e}")
+            return {}
+
+    def remember(self, guild_id, data):
+        """読み込んだアーカイブを LRU キャッシュへ登録する。既に読み込まれていればそちらを優先する"""
+        if guild_id in self._cache:
+            self._cache.move_to_end(guild_id)
+            return self._cache[guild_id]
+        self._cache[guild_id] = data
+        while len(self._cache) > HISTORY_ARCHIVE_CACHE_GUILDS:
+            self._cache.popitem(last=False)
+        return data
+
+    def load_guild(self, guild_id):
+        """ギルドのアーカイブを読み込む（LRU キャッシュ付き）"""
+        if guild_id in self._cache:
+            self._cache.move_to_end(guild_id)
+            return self._cache[guild_id]
+        return self.remember(guild_id, self.read_guild(guild_id))
+
+    def _write_guild(self, guild_id, data):
+        os.makedirs(self.base_dir, exist_ok=True)
+        path = self._guild_path(guild_id)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def get_entries(self, guild_id, user_id, role_name):
+        return self.load_guild(guild_id).get(user_id, {}).get(role_name, [])
+
+    def save(self, guild_id, data=None):
+        """ギルドのアーカイブと件数インデックスを書き込む"""
+        self._write_guild(guild_id, self.load_guild(guild_id) if data is None else data)
+        self._save_index()
+
+    def append(self, guild_id, moved):
+        """moved: {user_id: {role_name: [entry, ...]}} をアーカイブへ追記し、追加件数を返す。
+        同じ時刻の履歴は常に一緒に移動されるため、(タイムスタンプ, 理由) が同じエントリは
+        アーカイブ済みの件数を超える分のみ追加する（移動をやり直した場合に二重に追加しない）。"""
+        data = self.load_guild(guild_id)
+        added = 0
+        for user_id, roles in moved.items():
+            for role_name, entries in roles.items():
+                current = data.setdefault(user_id, {}).setdefault(role_name, [])
+                known = Counter((e["timestamp"], e.get("reason", "")) for e in current)
+                for entry in entries:
+                    key = (entry["timestamp"], entry.get("reason", ""))
+                    if known[key]:
+                        known[key] -= 1
+                        continue
+                    current.append(entry)
+                    added += 1
+                current.sort(key=lambda e: e["timestamp"])
+                self.counts.setdefault(guild_id, {}).setdefault(user_id, {})[role_name] = len(current)
+        return added
+
+    def edit_reason(self, guild_id, user_id, role_name, index, reason):
+        data = self.load_guild(guild_id)
+        try:
+            data[user_id][role_name][index]["reason"] = reason
+        except (KeyError, IndexError):
+            return False
+        return True
+
+    def rename_roles(self, guild_id, mapping):
+        """ロールのキーを mapping {旧キー: 新キー} に従ってメモリ上で付け替え、対象件数を返す（ロールID への移行用）"""
+        if not self.counts.get(guild_id):
+            return 0
+        data = self.load_guild(guild_id)
+        renamed = 0
+        for roles in data.values():
+            for old, new in mapping.items():
+                if old in roles:
+                    roles[new] = roles.pop(old)
+                    renamed += len(roles[new])
+        for roles in self.counts[guild_id].values():
+            for old, new in mapping.items():
+                if old in roles:
+                    roles[new] = roles.pop(old)
+        return renamed
+
+    def stats(self, guild_id):
+        entries = sum(
+            n for roles in self.counts.get(guild_id, {}).values() for n in roles.values()
+        )
+        path = self._guild_path(guild_id)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        return {"entries": entries, "users": len(self.counts.get(guild_id, {})), "size": size}
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import logging
+from config import HOLDER_SNAPSHOT_DIR, HOLDER_SNAPSHOT_MAX_AGE
+from storage import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+def snapshot_path(guild_id):
+    return os.path.join(HOLDER_SNAPSHOT_DIR, f"{guild_id}.json")
+
+class TriggerHolders:
+    """テニュアのトリガーロール（キーはロール名）の保持者。
+    ギルドは chunk しないためメンバーキャッシュ（role.members）は一部のメンバーしか含まない。
+    そのため照合したメンバー（起動時の同期・整合性チェック）とトリガーロールの付与から求め、
+    照合していないユーザーは以前の状態を引き継ぐ"""
+
+    def __init__(self):
+        # guild_id -> {ロール名: {user_id(int), ...}}
+        self._holders = {}
+
+    def observe(self, guild_id, names, members, scope=None):
+        """members（照合したメンバー）の保持状況を反映する。
+        scope が None の場合はギルド全体を members で置き換え、それ以外は scope 内のユーザーを照合結果で更新する
+        （scope 内で members に含まれないユーザーは退出済みとして外す）"""
+        holders = self._holders.setdefault(guild_id, {})
+        if scope is None:
+            holders.clear()
+        elif holders:
+            user_ids = {int(u) for u in scope}
+            for ids in holders.values():
+                ids.difference_update(user_ids)
+        if not names:
+            return
+        for member in members:
+            for role in member.roles:
+                if role.name in names:
+                    holders.setdefault(role.name, set()).add(member.id)
+
+    def add(self, guild_id, name, user_id):
+        self._holders.setdefault(guild_id, {}).setdefault(name, set()).add(int(user_id))
+
+    def discard(self, guild_id, user_id, name=None):
+        """ユーザーを保持者から外す（name を指定した場合はそのロールのみ）"""
+        holders = self._holders.get(guild_id, {})
+        for ids in (holders.values() if name is None else [holders.get(name, set())]):
+            ids.discard(int(user_id))
+
+    def holders(self, guild_id, name):
+        return self._holders.get(guild_id, {}).get(name, set())
+
+def build_holder_snapshot(bot, guild):
+    """期限付きロール（キーはロールID）とテニュアのトリガーロール（キーはロール名）の保持者を記録する。
+    期限付きロールはボット自身の記録（role_data）、トリガーロールは照合済みの保持者（bot.trigger_holders）から求める"""
+    guild_id = str(guild.id)
+    holders = {r: [] for r in bot.data.expiring_role_defs(guild_id)}
+    for user_id, roles in bot.data.snapshot(guild_id, "role_data").items():
+        for role_id in roles:
+            if role_id in holders:
+                holders[role_id].append(int(user_id))
+    for trigger_name in bot.data.tenure_rules.get(guild_id, {}):
+        holders[trigger_name] = list(bot.trigger_holders.holders(guild_id, trigger_name))
+    return {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "holders": {name: sorted(ids) for name, ids in holders.items()},
+    }
+
+def save_holder_snapshot(guild_id, snapshot):
+    try:
+        write_json(snapshot_path(guild_id), snapshot, compact=True)
+    except Exception as e:
+        logger.error(f"Holder snapshot save error for {guild_id}: {e}")
+
+def load_holder_snapshot(guild_id, max_age=HOLDER_SNAPSHOT_MAX_AGE):
+    """有効なスナップショットを返す。無い・形式が古い・max_age 秒より古い場合は None"""
+    snapshot = read_json(snapshot_path(guild_id))
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    if time.time() - snapshot.get("saved_at", 0) > max_age:
+        logger.info(f"Holder snapshot for {guild_id} is stale; full sync required")
+        return None
+    return snapshot
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import glob
+import logging
+import os
+import time
+import uuid
+from config import JOB_DIR, JOB_MAX_PER_GUILD, JOB_BATCH_SIZE, JOB_KEEP_FINISHED
+from storage import read_json, write_json
+from api_scheduler import BACKGROUND, LOW, role_route, message_route
+
+logger = logging.getLogger(__name__)
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (CANCELLED, DONE, FAILED)
+
+KIND_LABELS = {"grant": "一括付与", "revoke": "一括削除", "reason": "理由一括編集"}
+STATUS_LABELS = {
+    QUEUED: "待機中", RUNNING: "実行中", PAUSED: "一時停止", CANCELLED: "キャンセル", DONE: "完了", FAILED: "失敗",
+}
+
+def job_path(job_id):
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+class JobManager:
+    """一括付与・一括削除・理由の一括編集などの大量処理をジョブとして実行する。
+
+    対象は ID 順に処理し、バッチごとに「処理中の ID」を記録してから API を呼び、
+    完了後に再開位置（最後に処理した ID）と件数を data/jobs/<id>.json へ書き込む。
+    再起動時は未完了のジョブを再開し、記録済みの処理中 ID は現在の状態（ロールの有無など）を
+    確認してから必要なものだけ実行するため、完了済みの API 呼び出しを繰り返さない。
+    同じギルドで同時に実行するジョブは JOB_MAX_PER_GUILD 件まで（残りは待機）。"""
+
+    def __init__(self, bot, per_guild=JOB_MAX_PER_GUILD, batch_size=JOB_BATCH_SIZE):
+        self.bot = bot
+        self.per_guild = per_guild
+        self.batch_size = batch_size
+        self.jobs = {}
+        self._tasks = {}
+        self._started = False
+
+    def load(self):
+        """保存済みのジョブを読み込む。実行中のまま終了したジョブは待機状態に戻して再開対象にする"""
+        self.jobs.clear()
+        for path in glob.glob(os.path.join(JOB_DIR, "*.json")):
+            job = read_json(path)
+            if not isinstance(job, dict) or "id" not in job:
+                continue
+            if job["status"] == RUNNING:
+                job["status"] = QUEUED
+                job["resumed"] = job.get("resumed", 0) + 1
+            self.jobs[job["id"]] = job
+        pending = sum(1 for j in self.jobs.values() if j["status"] == QUEUED)
+        if pending:
+            logger.info(f"Loaded {len(self.jobs)} jobs ({pending} to resume)")
+
+    def start(self):
+        """起動処理（ギルド情報の取得後に呼ぶ）。待機中のジョブの実行を開始する"""
+        if self._started:
+            return
+        self._started = True
+        self.load()
+        self._dispatch()
+
+    async def stop(self):
+        """実行中のジョブを止める（状態は running のまま残り、次回起動時に再開される）"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def create(self, guild_id, kind, params, created_by, message=None):
+        """ジョブを登録して ID を返す。message は進捗を表示するメッセージ [channel_id, message_id]"""
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "guild_id": guild_id,
+            "kind": kind,
+            "params": params,
+            "status": QUEUED,
+            "created_by": created_by,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+            "message": message,
+            "cursor": 0,
+            "in_flight": [],
+            "processed": 0,
+            "succeeded": 0,
+            "total": None,
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        self._save(job)
+        self._dispatch()
+        return job["id"]
+
+    def set_message(self, job_id, message):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job["message"] = message
+            self._save(job)
+
+    def list(self, guild_id, limit=10):
+        """ギルドのジョブを新しい順に返す（未完了のジョブを優先）"""
+        jobs = [j for j in self.jobs.values() if j["guild_id"] == guild_id]
+        jobs.sort(key=lambda j: (j["status"] in FINISHED, -j["created_at"]))
+        return jobs[:limit]
+
+    def get(self, guild_id, job_id):
+        job = self.jobs.get(job_id)
+        return job if job is not None and job["guild_id"] == guild_id else None
+
+    def pause(self, job):
+        """待機中・実行中のジョブを一時停止する（実行中の場合は処理中のバッチの完了後に止まる）"""
+        if job["status"] not in (QUEUED, RUNNING):
+            return False
+        self._set_status(job, PAUSED)
+        return True
+
+    def resume(self, job):
+        if job["status"] != PAUSED:
+            return False
+        self._set_status(job, QUEUED)
+        self._dispatch()
+        return True
+
+    def cancel(self, job):
+        if job["status"] in FINISHED:
+            return False
+        self._set_status(job, CANCELLED)
+        self._dispatch()
+        return True
+
+    def depth(self):
+        return sum(1 for j in self.jobs.values() if j["status"] in (QUEUED, RUNNING))
+
+    def _set_status(self, job, status):
+        job["status"] = status
+        job["updated_at"] = time.time()
+        self._save(job)
+
+    def _save(self, job):
+        try:
+            write_json(job_path(job["id"]), job, compact=True)
+        except Exception as e:
+            logger.error(f"Job save error ({job['id']}): {e}")
+
+    def _prune(self):
+        """終了したジョブのファイルを新しい JOB_KEEP_FINISHED 件だけ残す"""
+        finished = sorted(
+            (j for j in self.jobs.values() if j["status"] in FINISHED),
+            key=lambda j: j["updated_at"], reverse=True
+        )
+        for job in finished[JOB_KEEP_FINISHED:]:
+            self.jobs.pop(job["id"], None)
+            try:
+                os.remove(job_path(job["id"]))
+            except OSError:
+                pass
+
+    def _dispatch(self):
+        """ギルドごとの同時実行数の範囲で、待機中のジョブを古い順に開始する"""
+        if not self._started:
+            return
+        running = {}
+        for job_id in self._tasks:
+            guild_id = self.jobs[job_id]["guild_id"]
+            running[guild_id] = running.get(guild_id, 0) + 1
+        for job in sorted(self.jobs.values(), key=lambda j: j["created_at"]):
+            if job["status"] != QUEUED or job["id"] in self._tasks:
+                continue
+            if running.get(job["guild_id"], 0) >= self.per_guild:
+                continue
+            running[job["guild_id"]] = running.get(job["guild_id"], 0) + 1
+            self._tasks[job["id"]] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job):
+        try:
+            guild = self.bot.get_guild(int(job["guild_id"]))
+            if guild is None:
+                raise RuntimeError("ギルドが見つかりません")
+            runner = {"grant": self._run_members, "revoke": self._run_members, "reason": self._run_reason}[job["kind"]]
+            # 開始前に一時停止・キャンセルされた場合は何もしない
+            if job["status"] == QUEUED:
+                self._set_status(job, RUNNING)
+                await runner(guild, job)
+            if job["status"] == RUNNING:
+                job["in_flight"] = []
+                self._set_status(job, DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}")
+            job["error"] = str(e)[:200]
+            self._set_status(job, FAILED)
+        finally:
+            self._tasks.pop(job["id"], None)
+        await self._report(job)
+        self._prune()
+        self._dispatch()
+
+    async def _checkpoint(self, job, batch_ids, succeeded):
+        """バッチ完了後の再開位置を記録し、進捗表示を更新する"""
+        job["cursor"] = max(job["cursor"], *batch_ids) if batch_ids else job["cursor"]
+        job["in_flight"] = []
+        job["processed"] += len(batch_ids)
+        job["succeeded"] += succeeded
+        job["updated_at"] = time.time()
+        await asyncio.to_thread(self._save, job)
+        await self._report(job)
+
+    async def _begin_batch(self, job, batch_ids):
+        """API を呼ぶ前に処理中の ID を記録する（中断時に再開後の確認対象にする）"""
+        job["in_flight"] = batch_ids
+        await asyncio.to_thread(self._save, job)
+
+    async def _run_members(self, guild, job):
+        """ロールの一括付与・一括削除。メンバーを ID 順に処理する"""
+        from core import iter_members, resolve_members
+        role = guild.get_role(int(job["params"]["role_id"]))
+        if role is None:
+            raise RuntimeError("対象ロールが見つかりません")
+        job["total"] = guild.member_count
+        apply = self._grant if job["kind"] == "grant" else self._revoke
+        if job["in_flight"]:
+            # 前回中断したバッチ: 現在のロールの状態を確認し、未処理のメンバーのみ実行する
+            members = await resolve_members(guild, job["in_flight"])
+            ids = [int(i) for i in job["in_flight"]]
+            succeeded = await apply(guild, job, role, list(members.values()))
+            await self._checkpoint(job, ids, succeeded)
+        batch = []
+        async for member in iter_members(guild, job["cursor"]):
+            if job["status"] != RUNNING:
+                return
+            if member.bot:
+                continue
+            batch.append(member)
+            if len(batch) >= self.batch_size:
+                await self._process_member_batch(guild, job, role, apply, batch)
+                batch = []
+        if batch and job["status"] == RUNNING:
+            await self._process_member_batch(guild, job, role, apply, batch)
+
+    async def _process_member_batch(self, guild, job, role, apply, batch):
+        ids = [m.id for m in batch]
+        await self._begin_batch(job, [str(i) for i in ids])
+        succeeded = await apply(guild, job, role, batch)
+        await self._checkpoint(job, ids, succeeded)
+
+    async def _grant(self, guild, job, role, members):
+        from core import add_role_with_timestamp
+        targets = [m for m in members if not m.get_role(role.id)]
+        reason = job["params"].get("reason")
+        results = await asyncio.gather(
+            *(add_role_with_timestamp(self.bot, m, role, reason, save=False) for m in targets)
+        )
+        # バッチ分の記録はチェックポイントの前に1回で保存する
+        await self.bot.data.save_guild(job["guild_id"])
+        return sum(1 for r in results if r)
+
+    async def _revoke(self, guild, job, role, members):
+        guild_id, role_id = job["guild_id"], str(role.id)
+        reason = job["params"].get("reason")
+
+        async def revoke(member):
+            try:
+                await self.bot.api.run(role_route(guild), member.remove_roles, role, reason=reason, priority=BACKGROUND)
+                self.bot.data.clear_assignment(guild_id, str(member.id), role_id)
+                return True
+            except Exception as e:
+                logger.error(f"Job {job['id']} revoke error for {member}: {e}")
+                return False
+
+        results = await asyncio.gather(*(revoke(m) for m in members if m.get_role(role.id)))
+        await self.bot.data.save_guild(guild_id)
+        return sum(1 for r in results if r)
+
+    async def _run_reason(self, guild, job):
+        """保持期間内の履歴の理由を一括で書き換える（API 呼び出しは無く、やり直しても結果は同じ）"""
+        data = self.bot.data
+        guild_id = job["guild_id"]
+        params = job["params"]
+        role_id = params["role_id"]
+        users = sorted(
+            int(u) for u, roles in data.role_add_history.get(guild_id, {}).items()
+            if role_id in roles and int(u) > job["cursor"]
+        )
+        job["total"] = job["processed"] + len(users)
+        for start in range(0, len(users), self.batch_size):
+            if job["status"] != RUNNING:
+                return
+            batch = users[start:start + self.batch_size]
+            edited = 0
+            async with data.guild_lock(guild_id):
+                for user_id in map(str, batch):
+                    entries = data.role_add_history.get(guild_id, {}).get(user_id, {}).get(role_id, [])
+                    # ユーザーごとに対象をまとめ、履歴のコピーと変更の通知を1回で済ませる
+                    edits = {
+                        i: params["reason"] for i, entry in enumerate(entries)
+                        if params["since"] <= entry["timestamp"] < params["until"]
+                        and (not entry["reason"] or params.get("overwrite"))
+                    }
+                    edited += data.edit_role_history_reasons(guild_id, user_id, role_id, edits)
+            await data.save_guild(guild_id)
+            await self._checkpoint(job, batch, edited)
+            await asyncio.sleep(0)
+
+    def describe(self, job):
+        label = KIND_LABELS.get(job["kind"], job["kind"])
+        role_id = job["params"].get("role_id")
+        target = self.bot.data.role_name(job["guild_id"], role_id) if role_id else ""
+        if target == role_id:
+            target = f"<@&{role_id}>"
+        total = f"/{job['total']}" if job.get("total") else ""
+        text = f"`{job['id']}` {label} {target} — {STATUS_LABELS.get(job['status'], job['status'])} {job['processed']}{total}（成功 {job['succeeded']}）"
+        if job.get("error"):
+            text += f"\n　エラー: {job['error']}"
+        return text
+
+    async def _report(self, job):
+        """ジョブに紐づくメッセージの進捗表示を更新する（失敗しても処理は継続）"""
+        if not job.get("message"):
+            return
+        channel_id, message_id = job["message"]
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        icon = {DONE: "✅", FAILED: "❌", CANCELLED: "⏹️", PAUSED: "⏸️"}.get(job["status"], "🔄")
+        content = f"{icon} {self.describe(job)}"
+        try:
+            await self.bot.api.run(
+                message_route(channel), channel.get_partial_message(message_id).edit,
+                content=content, priority=LOW
+            )
+        except Exception as e:
+            logger.debug(f"Job progress update failed ({job['id']}): {e}")
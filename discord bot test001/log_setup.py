@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import atexit
+import contextvars
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from datetime import datetime
+from config import LOG_FILE, LOG_FORMAT, LOG_ROTATE_BYTES, LOG_ROTATE_WHEN, LOG_BACKUP_COUNT, JST
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+CONTEXT_FIELDS = ("guild", "user", "command")
+
+# 現在処理中のギルド・ユーザー・コマンド。タスク単位で引き継がれる
+_log_context = contextvars.ContextVar("log_context", default={})
+
+def set_log_context(**fields):
+    """以降のログ（同じタスクと、そこから作られたタスク）に guild / user / command を付与する"""
+    _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+def member_context(member):
+    """logger の extra に渡す、メンバーのギルド・ユーザー"""
+    return {"guild": member.guild.id, "user": member.id}
+
+class ContextFilter(logging.Filter):
+    """extra で指定されていない文脈項目をコンテキスト変数から補う（ログを出したスレッドで実行される）"""
+
+    def filter(self, record):
+        context = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードの JSON 形式（JSON Lines）"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, JST).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = str(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """メッセージの組み立てのみ呼び出し元で行い、例外情報は JSON で別項目にできるよう分けて渡す"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def _file_handler():
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_ROTATE_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    # ローテーションしたファイルは gzip 圧縮する（bot.log.1.gz, ...）
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    return handler
+
+def setup_logging(level=logging.INFO, fmt=LOG_FORMAT):
+    """ルートロガーをキュー経由にし、ファイル・コンソールへの書き込みは別スレッドで行う。
+    起動したリスナーを返す（終了時に自動で停止する）"""
+    file_handler = _file_handler()
+    file_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(
+        queue_handler.queue, file_handler, console, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+def _stop_listener(listener):
+    """残っているログを書き出してからリスナーを止める（停止済みの場合は何もしない）"""
+    try:
+        listener.stop()
+    except AttributeError:
+        pass
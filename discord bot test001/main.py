@@ -6,28 +6,73 @@ import logging
 import os
 import asyncio
 
-from config import CHECK_INTERVAL, SYNC_INTERVAL, API_DELAY
+from config import CHECK_INTERVAL, SWEEP_TICK_INTERVAL, WATCH_INTERVAL, HOLDER_SNAPSHOT_INTERVAL, LOW_MEMORY_MODE, ADMIN_API_ENABLED
 from data_manager import DataManager
+from analytics import HistoryAnalytics
+from escalation import EscalationEngine
+from job_queue import JobManager
+from sweeper import ConsistencySweeper
+from audit_log import AuditLog
+from file_watcher import DataFileWatcher
+from api_scheduler import ApiScheduler
+from response_cache import ResponseCache
+from admin_api import AdminApi
+from holder_snapshot import TriggerHolders, build_holder_snapshot, save_holder_snapshot, load_holder_snapshot
 from helpers import now_jst
+from log_setup import setup_logging, set_log_context
 
-# ログ設定
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("bot.log", encoding="utf-8"), logging.StreamHandler()],
-)
+# ログ設定（書き込みはキュー経由で別スレッドが行う）
+setup_logging()
 logger = logging.getLogger(__name__)
 
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
+class RoleCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # コマンド処理中のログにギルド・ユーザー・コマンド名を付与する
+        set_log_context(
+            guild=interaction.guild_id,
+            user=interaction.user.id if interaction.user else None,
+            command=interaction.command.qualified_name if interaction.command else None,
+        )
+        return True
+
 class RoleBot(discord.Client):
     def __init__(self):
-        super().__init__(intents=intents)
-        self.tree = app_commands.CommandTree(self)
+        # メンバー一覧の取得は起動時の同期処理で必要なギルドのみ行う。
+        # 未キャッシュのメンバーの更新は on_member_update が呼ばれないため、生の GUILD_MEMBER_UPDATE から検知する（events.py）
+        options = {"enable_debug_events": True}
+        if LOW_MEMORY_MODE:
+            # 更新イベントを受けたメンバーのみキャッシュし、不要になったものは check_roles で間引く
+            cache_flags = discord.MemberCacheFlags.none()
+            cache_flags.joined = True
+            options["member_cache_flags"] = cache_flags
+        super().__init__(intents=intents, chunk_guilds_at_startup=False, **options)
+        self.tree = RoleCommandTree(self)
         self.data = DataManager()
-        self.removal_lock = asyncio.Lock()
+        self.analytics = HistoryAnalytics(self.data)
+        self.escalation = EscalationEngine(self.data)
+        self.jobs = JobManager(self)
+        self.sweeper = ConsistencySweeper(self)
+        self.audit = AuditLog()
+        self.data_watcher = DataFileWatcher(self.data)
+        self.api = ApiScheduler()
+        self.response_cache = ResponseCache(self.data)
+        self.admin_api = AdminApi(self) if ADMIN_API_ENABLED else None
+        self.removal_locks = {}
+        # 起動後に同期済みのギルド（保持者スナップショットはこれらのみ保存する）
+        self.synced_guilds = set()
+        # トリガーロールの保持者（照合したメンバーから求める。保持者スナップショットに使用）
+        self.trigger_holders = TriggerHolders()
+
+    def get_removal_lock(self, guild_id):
+        """ギルドごとの削除処理ロック（他ギルドの削除処理を待たない）"""
+        lock = self.removal_locks.get(guild_id)
+        if lock is None:
+            lock = self.removal_locks[guild_id] = asyncio.Lock()
+        return lock
 
     async def setup_hook(self):
         # コマンドツリーをクリア（重複防止）
@@ -35,8 +80,33 @@ class RoleBot(discord.Client):
     #    for guild in self.guilds:
     #        self.tree.clear_commands(guild=guild)
         
+        self.event_queue.start()
+        self.api.start()
+        if self.admin_api is not None:
+            try:
+                await self.admin_api.start()
+            except OSError as e:
+                logger.error(f"Admin API start failed: {e}")
         await self._sync_commands()
 
+    async def save_holder_snapshots(self):
+        for guild in self.guilds:
+            if guild.id in self.synced_guilds:
+                snapshot = build_holder_snapshot(self, guild)
+                await asyncio.to_thread(save_holder_snapshot, str(guild.id), snapshot)
+
+    async def close(self):
+        try:
+            # 実行中のジョブは中断した位置から次回起動時に再開する
+            await self.jobs.stop()
+            await self.save_holder_snapshots()
+            await self.data.save_all()
+            if self.admin_api is not None:
+                await self.admin_api.stop()
+        except Exception as e:
+            logger.error(f"Shutdown save error: {e}")
+        await super().close()
+
     async def _sync_commands(self):
         try:
             # グローバルコマンド同期
@@ -69,55 +139,46 @@ setup_command_error_handler(bot)
 @tasks.loop(seconds=CHECK_INTERVAL)
 async def check_roles():
     try:
-        from core import process_role_removal
+        from core import process_role_removal, prune_member_cache
         total_removed = 0
         for guild in bot.guilds:
             removed = await process_role_removal(bot, guild)
             total_removed += removed
-            await asyncio.sleep(API_DELAY)
-        await bot.data.save_all()
+            await bot.data.save_guild(str(guild.id))
+            if LOW_MEMORY_MODE:
+                prune_member_cache(bot, guild)
         if total_removed:
             logger.info(f"Role check completed - Removed: {total_removed}")
     except Exception as e:
         logger.error(f"Role check error: {e}")
 
-@tasks.loop(seconds=SYNC_INTERVAL)
-async def sync_data_periodically():
+@tasks.loop(seconds=SWEEP_TICK_INTERVAL)
+async def sweep_consistency():
+    """記録と実際のロールを一部ずつ照合する（SYNC_INTERVAL でギルド全体を一巡）"""
     try:
-        from core import sync_data_with_reality
-        from helpers import validate_role_data
-        from config import DATA_FILE
-        for guild in bot.guilds:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    test_data = bot.data._load_json(DATA_FILE, {})
-                    if not validate_role_data(test_data):
-                        logger.warning(f"定期同期: ロールデータ検証失敗（試行 {attempt + 1}/{max_retries}）")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(2 ** attempt)
-                            continue
-                        else:
-                            logger.error(f"定期同期: {guild.name} のデータ読み込みに失敗。このギルドをスキップします。")
-                            break
-                    
-                    await sync_data_with_reality(bot, guild, True)
-                    break
-                except Exception as e:
-                    logger.warning(f"定期同期: ファイル読み込み失敗（試行 {attempt + 1}/{max_retries}）: {e}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 ** attempt)
-                    else:
-                        logger.error(f"定期同期: {guild.name} のデータ読み込みが {max_retries} 回失敗。スキップします。")
-            
-            await asyncio.sleep(1)
-        
-        await bot.data.save_all()
+        await bot.sweeper.tick()
+    except Exception as e:
+        logger.error(f"Consistency sweep error: {e}")
+
+@tasks.loop(seconds=WATCH_INTERVAL)
+async def watch_data_files():
+    """手動編集されたデータファイルを再起動なしで反映する"""
+    try:
+        await bot.data_watcher.poll()
+    except Exception as e:
+        logger.error(f"Data file watch error: {e}")
+
+@tasks.loop(seconds=HOLDER_SNAPSHOT_INTERVAL)
+async def save_holder_snapshots_periodically():
+    try:
+        await bot.save_holder_snapshots()
     except Exception as e:
-        logger.error(f"Periodic sync error: {e}")
+        logger.error(f"Holder snapshot error: {e}")
 
 @check_roles.before_loop
-@sync_data_periodically.before_loop
+@sweep_consistency.before_loop
+@watch_data_files.before_loop
+@save_holder_snapshots_periodically.before_loop
 async def wait_until_ready():
     await bot.wait_until_ready()
 
@@ -139,24 +200,41 @@ async def on_ready():
     
     await bot.wait_until_ready()
     
-    from core import sync_data_with_reality, log_message
+    from core import sync_data_with_reality, warm_sync_guild, log_message, ensure_expiring_roles
+    # ギルドのデータは参照時の読み込みでイベントループを止めないよう、スレッドで先に読み込む
+    await asyncio.gather(*(bot.data.preload_guild(str(guild.id)) for guild in bot.guilds))
     for guild in bot.guilds:
         try:
-            if not guild.chunked:
-                logger.info(f"[{guild.name}] メンバー情報をロード中...")
-                await guild.chunk()
-            
             await log_message(bot, guild, f"Bot起動完了 ({now_jst().strftime('%Y/%m/%d %H:%M:%S')} JST)", "success")
-            await sync_data_with_reality(bot, guild)
+            # ロール名で記録していたギルドはロールID キーへ移行してから照合する
+            if ensure_expiring_roles(bot, guild):
+                await bot.data.save_guild(str(guild.id))
+            # 有効な保持者スナップショットがあれば差分のみ照合し、無ければ全体同期
+            changes = None
+            snapshot = load_holder_snapshot(str(guild.id))
+            if snapshot is not None:
+                try:
+                    changes = await warm_sync_guild(bot, guild, snapshot)
+                except Exception as e:
+                    logger.warning(f"[{guild.name}] 差分同期に失敗したため全体同期を行います: {e}")
+            if changes is None:
+                await sync_data_with_reality(bot, guild)
+            bot.synced_guilds.add(guild.id)
         except Exception as e:
             logger.error(f"[{guild.name}] 同期中にエラー: {e}")
     
     await bot.data.save_all()
+    # 同期後に、前回中断した一括処理ジョブを再開する
+    bot.jobs.start()
     
     if not check_roles.is_running():
         check_roles.start()
-    if not sync_data_periodically.is_running():
-        sync_data_periodically.start()
+    if not sweep_consistency.is_running():
+        sweep_consistency.start()
+    if not watch_data_files.is_running():
+        watch_data_files.start()
+    if not save_holder_snapshots_periodically.is_running():
+        save_holder_snapshots_periodically.start()
     
     await asyncio.create_task(check_roles.coro())
 
@@ -171,7 +249,8 @@ if __name__ == "__main__":
         exit(1)
     try:
         logger.info("Starting bot...")
-        bot.run(TOKEN)
+        # discord.py 独自のログハンドラは追加せず、上記のキュー経由の設定を使う
+        bot.run(TOKEN, log_handler=None)
     except discord.LoginFailure:
         logger.error("Invalid bot token")
         exit(1)
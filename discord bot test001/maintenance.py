@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""データファイルの保守用コマンド（discord.py・トークン不要。書き込みを伴う操作は Bot 停止中に実行すること）。
+
+    python maintenance.py validate [--guild ID ...] [--jobs N]
+        ギルド別ファイルの形式・スキーマ・マニフェストとの対応を検査する（問題があれば終了コード 1）
+    python maintenance.py stats [--guild ID ...] [--jobs N]
+        ギルドごとの記録人数・履歴件数・ファイルサイズを表示する
+    python maintenance.py compact [--guild ID ...]
+        保持期間を過ぎた履歴をアーカイブへ移動する
+    python maintenance.py migrate [--format 形式] [--jobs N]
+        旧形式の共通ファイルの分割・スキーマ移行・ファイル形式の変換をまとめて行う
+    python maintenance.py diff-backups ギルドID 種別 変更前 [変更後]
+        2つのバックアップ（タイムスタンプまたはパス。変更後の省略時は現在のファイル）を比較する
+    python maintenance.py prune [--guild ID] [--members ファイル] [--dry-run]
+        期限付きロールでないロールの記録・空のユーザーを削除する。
+        --members（1行1ユーザーID、または JSON の配列）を指定した場合は一覧に無いユーザーの記録・個別設定も削除する
+
+validate / stats / migrate はギルド単位で --jobs 個のプロセスに分けて処理する（既定は CPU 数）。
+大きなファイルはユーザー単位で1件ずつ読み、全体をメモリ上に展開しない。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+KIND_CHECKS = {}
+
+def _check(kind):
+    def register(func):
+        KIND_CHECKS[kind] = func
+        return func
+    return register
+
+def _is_id(value):
+    return isinstance(value, str) and value.isdigit()
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+@_check("roles_data")
+def _check_roles_data(user_id, roles, defs):
+    if not _is_id(user_id):
+        return ["ユーザーIDが数字ではありません"]
+    if not isinstance(roles, dict):
+        return ["ロールの記録が dict ではありません"]
+    problems = []
+    for role_id, ts in roles.items():
+        if not _is_number(ts):
+            problems.append(f"{role_id}: 付与時刻が数値ではありません")
+        elif defs is not None and role_id not in defs:
+            problems.append(f"{role_id}: 期限付きロールではありません")
+    return problems
+
+@_check("role_history")
+def _check_role_history(user_id, roles, defs):
+    if not _is_id(user_id):
+        return ["ユーザーIDが数字ではありません"]
+    if not isinstance(roles, dict):
+        return ["履歴が dict ではありません"]
+    problems = []
+    for role_id, hist in roles.items():
+        if not isinstance(hist, list):
+            problems.append(f"{role_id}: 履歴がリストではありません")
+            continue
+        if not all(isinstance(e, dict) and _is_number(e.get("timestamp")) and isinstance(e.get("reason"), str) for e in hist):
+            problems.append(f"{role_id}: 履歴の形式が不正です")
+        elif any(hist[i]["timestamp"] > hist[i + 1]["timestamp"] for i in range(len(hist) - 1)):
+            problems.append(f"{role_id}: 履歴が時系列順ではありません")
+    return problems
+
+@_check("settings")
+def _check_settings(user_id, roles, defs):
+    if not _is_id(user_id):
+        return ["ユーザーIDが数字ではありません"]
+    if not isinstance(roles, dict):
+        return ["個別設定が dict ではありません"]
+    problems = []
+    for role_id, seconds in roles.items():
+        if not _is_number(seconds) or seconds <= 0:
+            problems.append(f"{role_id}: 削除期間が正の数ではありません")
+        elif defs is not None and role_id not in defs:
+            problems.append(f"{role_id}: 期限付きロールではありません")
+    return problems
+
+@_check("expiring_roles")
+def _check_expiring_roles(role_id, definition, defs):
+    if not isinstance(definition, dict) or not isinstance(definition.get("name"), str):
+        return ["定義に name がありません"]
+    if not _is_number(definition.get("seconds")) or definition["seconds"] <= 0:
+        return ["seconds が正の数ではありません"]
+    return []
+
+@_check("escalation_rules")
+def _check_escalation_rules(role_id, rule, defs):
+    if not isinstance(rule, dict) or not all(k in rule for k in ("count", "window_seconds", "target_role")):
+        return ["count / window_seconds / target_role のいずれかがありません"]
+    return []
+
+@_check("tenure_rules")
+def _check_tenure_rules(role_name, rule, defs):
+    if not isinstance(rule, dict) or not all(k in rule for k in ("target_role", "tenure_days")):
+        return ["target_role / tenure_days のいずれかがありません"]
+    return []
+
+@_check("log_channel")
+def _check_log_channel(key, channel_id, defs):
+    return [] if isinstance(channel_id, int) else ["チャンネルIDが整数ではありません"]
+
+@_check("mention_config")
+def _check_mention_config(key, value, defs):
+    return [] if key is not None else ["設定が dict ではありません"]
+
+def _guild_ids(selected=None):
+    from config import GUILD_DATA_DIR
+    from storage import load_manifest
+    if selected:
+        return list(selected)
+    ids = set(load_manifest() or {})
+    if os.path.isdir(GUILD_DATA_DIR):
+        ids.update(d for d in os.listdir(GUILD_DATA_DIR) if os.path.isdir(os.path.join(GUILD_DATA_DIR, d)))
+    return sorted(ids)
+
+def _run_parallel(func, items, jobs):
+    """items をプロセスに分けて func で処理し、結果を items の順に返す"""
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(items))) as pool:
+        return list(pool.map(func, items, chunksize=max(1, len(items) // (jobs * 4))))
+
+def validate_guild(guild_id):
+    """ギルドのファイルを検査し、(ギルドID, 問題の一覧) を返す"""
+    from restore import iter_section
+    from storage import GUILD_STORE_KINDS, load_manifest, shard_path
+    listed = set((load_manifest() or {}).get(guild_id, []))
+    problems = []
+    defs = None
+    # 期限付きロールの定義を先に読み、記録のロールが定義済みかも確認する
+    kinds = sorted(GUILD_STORE_KINDS.values(), key=lambda k: k != "expiring_roles")
+    for kind in kinds:
+        path = shard_path(guild_id, kind)
+        exists = os.path.exists(path)
+        if exists != (kind in listed):
+            problems.append(f"{kind}: マニフェストとファイルの有無が一致しません")
+        if not exists:
+            continue
+        check = KIND_CHECKS[kind]
+        try:
+            for key, value in iter_section(path, kind):
+                if kind == "expiring_roles":
+                    defs = defs if defs is not None else set()
+                    defs.add(key)
+                problems.extend(f"{kind} {key}: {p}" for p in check(key, value, defs))
+        except (ValueError, OSError) as e:
+            problems.append(f"{kind}: 読み込めません ({e})")
+    return guild_id, problems
+
+def cmd_validate(args):
+    total = 0
+    for guild_id, problems in _run_parallel(validate_guild, _guild_ids(args.guild), args.jobs):
+        total += len(problems)
+        for problem in problems[:args.limit]:
+            print(f"[{guild_id}] {problem}")
+        if len(problems) > args.limit:
+            print(f"[{guild_id}] …ほか {len(problems) - args.limit}件")
+    print(f"problems: {total}")
+    return 1 if total else 0
+
+def stats_guild(guild_id):
+    """ギルドの件数・サイズを返す"""
+    from restore import iter_section
+    from storage import GUILD_STORE_KINDS, shard_path
+    stats = {"users": 0, "assignments": 0, "history_users": 0, "history": 0, "overrides": 0, "bytes": 0}
+    for kind in GUILD_STORE_KINDS.values():
+        path = shard_path(guild_id, kind)
+        if not os.path.exists(path):
+            continue
+        stats["bytes"] += os.path.getsize(path)
+        if kind not in ("roles_data", "role_history", "settings"):
+            continue
+        try:
+            for _, roles in iter_section(path, kind):
+                if kind == "roles_data":
+                    stats["users"] += 1
+                    stats["assignments"] += len(roles)
+                elif kind == "role_history":
+                    stats["history_users"] += 1
+                    stats["history"] += sum(len(hist) for hist in roles.values())
+                else:
+                    stats["overrides"] += len(roles)
+        except (ValueError, OSError) as e:
+            print(f"[{guild_id}] {kind}: 読み込めません ({e})", file=sys.stderr)
+    return guild_id, stats
+
+def cmd_stats(args):
+    from history_archive import HistoryArchive
+    archive = HistoryArchive()
+    columns = ("users", "assignments", "overrides", "history_users", "history", "archived", "bytes")
+    print(f"{'guild':<20} " + " ".join(f"{c:>13}" for c in columns))
+    totals = dict.fromkeys(columns, 0)
+    for guild_id, stats in _run_parallel(stats_guild, _guild_ids(args.guild), args.jobs):
+        stats["archived"] = sum(
+            sum(roles.values()) for roles in archive.counts.get(guild_id, {}).values()
+        )
+        for c in columns:
+            totals[c] += stats[c]
+        print(f"{guild_id:<20} " + " ".join(f"{stats[c]:>13,}" for c in columns))
+    print(f"{'total':<20} " + " ".join(f"{totals[c]:>13,}" for c in columns))
+    return 0
+
+def _load_manager():
+    from data_manager import DataManager
+    return DataManager()
+
+def cmd_compact(args):
+    data = _load_manager()
+    before = sum(sum(sum(r.values()) for r in users.values()) for users in data.history_archive.counts.values())
+
+    async def run():
+        for guild_id in _guild_ids(args.guild):
+            data.ensure_guild(guild_id)
+            await data.archive_history(guild_id)
+            await data.save_guild(guild_id)
+    asyncio.run(run())
+    after = sum(sum(sum(r.values()) for r in users.values()) for users in data.history_archive.counts.values())
+    print(f"archived: {after - before} entries")
+    return 0
+
+def migrate_guild(task):
+    """ギルドのファイルを現在のスキーマ・指定形式で書き直し、(ギルドID, 書き直した件数) を返す"""
+    from serializers import BINARY_KINDS, BINARY_MAGIC, detect, format_for
+    from storage import GUILD_STORE_KINDS, read_section, shard_path, write_section
+    guild_id, fmt = task
+    rewritten = 0
+    for kind in GUILD_STORE_KINDS.values():
+        path = shard_path(guild_id, kind)
+        if not os.path.exists(path):
+            continue
+        target = fmt or format_for(kind)
+        if target == "binary" and kind not in BINARY_KINDS:
+            target = "compact"
+        with open(path, "rb") as f:
+            current = detect(f.read(len(BINARY_MAGIC)))
+        data, migrated = read_section(path, kind)
+        if data is None:
+            print(f"[{guild_id}] {kind}: 読み込めません", file=sys.stderr)
+            continue
+        if migrated or current != ("compact" if target == "orjson" else target):
+            write_section(path, kind, data, target)
+            rewritten += 1
+    return guild_id, rewritten
+
+def cmd_migrate(args):
+    # マニフェストが無い場合は旧形式の共通ファイルをギルド別へ分割する
+    _load_manager()
+    results = _run_parallel(migrate_guild, [(g, args.format) for g in _guild_ids()], args.jobs)
+    print(f"rewritten: {sum(n for _, n in results)} files in {len(results)} guilds")
+    return 0
+
+def _resolve_backup(guild_id, kind, ref):
+    """ref（ファイルのパス・バックアップの日時・None は現在のファイル）のパス。
+    バックアップは形式によらず .json の名前で保存される（形式は内容から判別する）"""
+    from config import BACKUP_DIR
+    from storage import shard_path
+    if ref is None:
+        return shard_path(guild_id, kind)
+    if os.path.exists(ref):
+        return ref
+    return os.path.join(BACKUP_DIR, guild_id, f"{kind}_{ref}.json")
+
+def cmd_diff_backups(args):
+    """変更前のファイルを2回（キーごとの要約・変更箇所の取り出し）、変更後のファイルを1回、それぞれ1件ずつ読んで比較する"""
+    from restore import iter_section
+    from storage import diff_sections, fingerprint
+    old_path = _resolve_backup(args.guild_id, args.kind, args.old)
+    new_path = _resolve_backup(args.guild_id, args.kind, args.new)
+    for path in (old_path, new_path):
+        if not os.path.exists(path):
+            print(f"not found: {path}", file=sys.stderr)
+            return 2
+    old_hashes = {key: hash(fingerprint(value)) for key, value in iter_section(old_path, args.kind)}
+    added, changed = set(), {}
+    for key, value in iter_section(new_path, args.kind):
+        digest = old_hashes.pop(key, None)
+        if digest is None:
+            added.add(key)
+        elif digest != hash(fingerprint(value)):
+            changed[key] = value
+    removed = set(old_hashes)
+    old_values = dict(iter_section(old_path, args.kind, changed.__contains__)) if changed else {}
+    for key in sorted(added, key=str):
+        print(f"+ {key}")
+    for key in sorted(removed, key=str):
+        print(f"- {key}")
+    for key in sorted(changed, key=str):
+        old, new = old_values.get(key), changed[key]
+        subs = sorted({str(sub) for sub, _ in diff_sections(old, new) if sub is not None})
+        print(f"~ {key}" + (f": {', '.join(subs)}" if subs else ""))
+    print(f"added: {len(added)}, removed: {len(removed)}, changed: {len(changed)}")
+    return 0
+
+def _read_members(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return {str(m) for m in json.loads(text)}
+    return {line.strip() for line in text.splitlines() if line.strip()}
+
+def cmd_prune(args):
+    if args.members and not args.guild:
+        print("--members には --guild の指定が必要です", file=sys.stderr)
+        return 2
+    members = _read_members(args.members) if args.members else None
+    data = _load_manager()
+    results = {}
+
+    async def run():
+        for guild_id in _guild_ids(args.guild):
+            data.ensure_guild(guild_id)
+            # 期限付きロールの定義が無いギルド（起動時の定義作成・ロールID への移行前）は定義による削除を行わない
+            defs = data.expiring_role_defs(guild_id) or None
+            removed = results[guild_id] = {"assignments": 0, "overrides": 0}
+            for user_id, roles in list(data.snapshot(guild_id, "role_data").items()):
+                departed = members is not None and user_id not in members
+                targets = list(roles) if departed else [r for r in roles if defs is not None and r not in defs]
+                removed["assignments"] += len(targets)
+                if args.dry_run:
+                    continue
+                if departed or not roles:
+                    data.clear_assignment(guild_id, user_id)
+                for role_id in [] if departed or not roles else targets:
+                    data.clear_assignment(guild_id, user_id, role_id)
+            for user_id, roles in list(data.snapshot(guild_id, "user_remove_seconds").items()):
+                departed = members is not None and user_id not in members
+                for role_id in [r for r in roles if departed or (defs is not None and r not in defs)]:
+                    removed["overrides"] += 1
+                    if not args.dry_run:
+                        data.remove_user_setting(guild_id, user_id, role_id)
+            if not args.dry_run:
+                await data.save_guild(guild_id)
+    asyncio.run(run())
+    for guild_id, removed in results.items():
+        if any(removed.values()):
+            print(f"[{guild_id}] assignments: {removed['assignments']}, overrides: {removed['overrides']}")
+    print(f"{'would remove' if args.dry_run else 'removed'}: "
+          f"{sum(r['assignments'] for r in results.values())} assignments, "
+          f"{sum(r['overrides'] for r in results.values())} overrides")
+    return 0
+
+def main(argv):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+    from serializers import FORMATS
+    from storage import GUILD_STORE_KINDS
+
+    parser = argparse.ArgumentParser(description="Bot のデータファイルの保守")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add(name, func, help_text, guilds=True, jobs=False):
+        p = sub.add_parser(name, help=help_text)
+        p.set_defaults(func=func)
+        if guilds:
+            p.add_argument("--guild", action="append", help="対象のギルドID（複数指定可。省略時はすべて）")
+        if jobs:
+            p.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="並列に処理するプロセス数")
+        return p
+
+    add("validate", cmd_validate, "ファイルの検査", jobs=True).add_argument(
+        "--limit", type=int, default=20, help="ギルドごとに表示する問題の件数")
+    add("stats", cmd_stats, "件数・サイズの集計", jobs=True)
+    add("compact", cmd_compact, "保持期間外の履歴をアーカイブへ移動")
+    add("migrate", cmd_migrate, "スキーマ移行・形式変換", guilds=False, jobs=True).add_argument(
+        "--format", choices=FORMATS, help="変換後の形式（省略時は config.py の設定）")
+    p = add("diff-backups", cmd_diff_backups, "バックアップの比較", guilds=False)
+    p.add_argument("guild_id")
+    p.add_argument("kind", choices=sorted(GUILD_STORE_KINDS.values()))
+    p.add_argument("old", help="変更前（タイムスタンプ YYYYMMDD_HHMMSS またはパス）")
+    p.add_argument("new", nargs="?", help="変更後（省略時は現在のファイル）")
+    p = add("prune", cmd_prune, "不要な記録の削除")
+    p.add_argument("--members", help="現在のメンバーのユーザーID一覧（1行1件または JSON の配列）")
+    p.add_argument("--dry-run", action="store_true", help="削除せず件数のみ表示")
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
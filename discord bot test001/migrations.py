@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import logging
+from config import ROLES_TO_AUTO_REMOVE, DEFAULT_REMOVE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_KEY = "schema_version"
+
+# ギルド別ファイルの種別 -> 現在のスキーマバージョン（バージョンの無いファイルは 0 とみなす）
+SCHEMA_VERSIONS = {
+    "roles_data": 1,
+    "role_history": 1,
+    "log_channel": 1,
+    "tenure_rules": 1,
+    "mention_config": 1,
+    "settings": 1,
+    "expiring_roles": 1,
+    "escalation_rules": 1,
+}
+# グローバル設定ファイル（bot_settings.json）のスキーマバージョン。
+# remove_seconds はロール名で記録していた時期のギルドを移行する際の初期値として残している
+GLOBAL_SCHEMA_VERSION = 1
+
+def _history_v1(section):
+    """旧形式（タイムスタンプのみのリスト）を {"timestamp", "reason"} 形式に変換し、時系列順に並べる"""
+    for roles in section.values():
+        for r, hist in roles.items():
+            if hist and isinstance(hist[0], (int, float)):
+                hist = roles[r] = [{"timestamp": ts, "reason": ""} for ts in hist]
+            hist.sort(key=lambda e: e["timestamp"])
+    return section
+
+# (種別, 移行元バージョン) -> 1つ上のバージョンへ変換する関数。登録の無い段階は内容を変更しない
+MIGRATIONS = {
+    ("role_history", 0): _history_v1,
+}
+
+def unwrap(raw):
+    """ファイル内容を (バージョン, データ) に分ける。バージョンの無い旧形式はそのまま 0 として返す"""
+    if isinstance(raw, dict) and SCHEMA_KEY in raw and "data" in raw:
+        return raw[SCHEMA_KEY], raw["data"]
+    return 0, raw
+
+def wrap(kind, data):
+    return {SCHEMA_KEY: SCHEMA_VERSIONS[kind], "data": data}
+
+def migrate_section(kind, raw):
+    """ファイル内容を現在のスキーマへ移行し (データ, 移行したか) を返す。
+    現在のバージョンであれば変換処理は一切行わない。"""
+    version, data = unwrap(raw)
+    current = SCHEMA_VERSIONS[kind]
+    if version == current:
+        return data, False
+    if version > current:
+        raise ValueError(f"{kind} のスキーマバージョン {version} には対応していません（対応: {current}）")
+    while version < current:
+        step = MIGRATIONS.get((kind, version))
+        if step is not None and data is not None:
+            data = step(data)
+        version += 1
+    return data, True
+
+def migrate_settings(settings):
+    """グローバル設定を現在のスキーマへ移行する。
+    (設定, 旧形式の user_remove_seconds, 移行したか) を返す。"""
+    version = settings.pop(SCHEMA_KEY, 0)
+    if version == GLOBAL_SCHEMA_VERSION:
+        return settings, None, False
+    if version > GLOBAL_SCHEMA_VERSION:
+        raise ValueError(f"設定ファイルのスキーマバージョン {version} には対応していません")
+    legacy_overrides = settings.pop("user_remove_seconds", None)
+    remove_seconds = settings.setdefault("remove_seconds", {})
+    for r in ROLES_TO_AUTO_REMOVE:
+        remove_seconds.setdefault(r, DEFAULT_REMOVE_SECONDS[r])
+    logger.info(f"Migrated global settings schema {version} -> {GLOBAL_SCHEMA_VERSION}")
+    return settings, legacy_overrides, True
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from collections import OrderedDict
+from config import RESPONSE_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """読み取り専用コマンドの応答（Embed）キャッシュ。
+    キーは (guild_id, command, 引数...)。応答が依存するストアのバージョンが変わるか、
+    有効期限を過ぎた場合のみ作り直す。"""
+
+    def __init__(self, data, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.data = data
+        self.max_entries = max_entries
+        # key -> (バージョン, 期限（monotonic, None は無期限）, 値)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, stores, build):
+        """キャッシュ済みの値を返す。無い・古い場合は await build() -> (値, 有効秒数 or None) で作成する。
+        stores: 依存するストア名の一覧（"settings" はグローバル設定）"""
+        version = self.data.store_version(key[0], stores)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version and (entry[1] is None or now < entry[1]):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+        self.misses += 1
+        value, ttl = await build()
+        self._entries[key] = (version, None if ttl is None else now + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import re
+from migrations import SCHEMA_KEY, SCHEMA_VERSIONS
+from serializers import BINARY_MAGIC
+from storage import read_section
+
+# 第1キーがユーザーID・第2キーがロールIDのストア
+USER_KEYED_KINDS = ("roles_data", "role_history", "settings")
+# 第1キーがロールIDのストア
+ROLE_KEYED_KINDS = ("expiring_roles", "escalation_rules")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+# バックアップを読み込む単位（文字数）
+_CHUNK = 1 << 16
+
+def scope_supported(kind, user_id=None, role_id=None):
+    """種別がユーザー・ロール単位の復元に対応しているか"""
+    if user_id is None and role_id is None:
+        return True
+    if kind in USER_KEYED_KINDS:
+        return True
+    return kind in ROLE_KEYED_KINDS and user_id is None
+
+class _Reader:
+    """テキストファイルを _CHUNK ずつ読み込みながら JSON を先頭から順に読む。
+    読み終えた部分は破棄するため、保持するのは読み込み途中の値の分のみ"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def _fill(self, size=_CHUNK):
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """空白を読み飛ばして次の1文字を返す（終端では空文字）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"'{char}' expected at {self.tell()}")
+        self.pos += 1
+
+    def value(self):
+        """次の JSON 値を読む。値が読み込み済みの範囲に収まらない場合は続きを読んでから読み直す
+        （読み足す量を未処理分と同じだけにして、大きな値でも読み直しの合計が線形になるようにする）"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(max(_CHUNK, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # 数値は途中で切れていても読めてしまうため、末尾で終わった場合は続きを確かめる
+            if end == len(self.buf) and self._fill(max(_CHUNK, len(self.buf) - self.pos)):
+                continue
+            self.pos = end
+            return value
+
+def _members(reader):
+    """現在位置の JSON オブジェクトのメンバーのキーを順に返す。
+    呼び出し側はキーを受け取るたびに値を読み進めてから次のキーを要求する"""
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key
+        if reader.peek() == "}":
+            reader.pos += 1
+            return
+        reader.expect(",")
+
+def _stream_data(reader, kind, wanted):
+    """{"schema_version", "data"} 形式の JSON から data のメンバーを1件ずつ読み、
+    wanted(キー) が真のものだけ (キー, 値) で返す。現在のスキーマでなければ None"""
+    version = 0
+    for key in _members(reader):
+        if key == "data":
+            if version != SCHEMA_VERSIONS[kind] or reader.peek() != "{":
+                return None
+            return _iter_selected(reader, wanted)
+        value = reader.value()
+        if key == SCHEMA_KEY:
+            version = value
+    return None
+
+def _iter_selected(reader, wanted):
+    for key in _members(reader):
+        # 対象外のメンバーも読み飛ばす必要はあるが、値は保持しない
+        value = reader.value()
+        if wanted(key):
+            yield key, value
+
+def iter_section(file_path, kind, wanted=None):
+    """ストアのファイル（バックアップを含む）のデータ部を (第1キー, 値) で1件ずつ返す。
+    wanted を指定した場合は wanted(キー) が真のもののみ。
+    現在のスキーマの JSON はファイルを少しずつ読みながら1件ずつ返し、
+    binary 形式・旧スキーマ・dict 以外のデータは全体を読み込む。読めない場合は ValueError"""
+    with open(file_path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            f.seek(0)
+            text = io.TextIOWrapper(f, encoding="utf-8")
+            try:
+                selected = _stream_data(_Reader(text), kind, wanted or (lambda key: True))
+                if selected is not None:
+                    yield from selected
+                    return
+            finally:
+                text.detach()
+    data, _ = read_section(file_path, kind)
+    if data is None:
+        raise ValueError(f"読み込めません: {file_path}")
+    if not isinstance(data, dict):
+        yield None, data
+        return
+    for key, value in data.items():
+        if wanted is None or wanted(key):
+            yield key, value
+
+def _first_keys(kind, user_id, role_id):
+    """バックアップから取り出す第1キーの集合（None はすべて）"""
+    if kind in USER_KEYED_KINDS and user_id is not None:
+        return {user_id}
+    if kind in ROLE_KEYED_KINDS and role_id is not None:
+        return {role_id}
+    return None
+
+class RestorePlan:
+    """バックアップから取り出した復元対象の範囲。
+    ユーザー・ロールの指定が無い場合はギルド全体、指定がある場合はその部分のみを現在の内容に上書きする
+    （バックアップに存在しない項目は削除される）"""
+
+    def __init__(self, kind, backup_file, user_id=None, role_id=None):
+        self.kind = kind
+        self.backup_file = backup_file
+        self.user_id = user_id
+        self.role_id = role_id
+        self.part = None
+
+    @property
+    def whole(self):
+        return self.user_id is None and self.role_id is None
+
+    def load(self):
+        """バックアップを読み込む（スレッドで実行）。対象外のユーザー・ロールの内容は保持しない"""
+        if not scope_supported(self.kind, self.user_id, self.role_id):
+            raise ValueError(f"{self.kind} はユーザー・ロール単位の復元に対応していません")
+        keys = _first_keys(self.kind, self.user_id, self.role_id)
+        selected = dict(iter_section(self.backup_file, self.kind, None if keys is None else keys.__contains__))
+        # dict 以外のデータ（ギルド全体の復元のみ）はキー None で返る
+        self.part = selected[None] if None in selected else self._select(selected)
+        return self
+
+    def _select(self, data):
+        """読み込んだ内容から対象範囲のみを残す"""
+        if self.whole:
+            return data
+        if self.kind in ROLE_KEYED_KINDS:
+            return {k: v for k, v in data.items() if k == self.role_id}
+        if self.user_id is not None:
+            data = {k: v for k, v in data.items() if k == self.user_id}
+        if self.role_id is None:
+            return data
+        return {
+            user_id: {self.role_id: roles[self.role_id]}
+            for user_id, roles in data.items() if self.role_id in roles
+        }
+
+    def _paths(self, live):
+        """上書きする箇所 (第1キー, 第2キー または None) の一覧"""
+        if self.kind in ROLE_KEYED_KINDS or self.role_id is None:
+            return [(key, None) for key in sorted(set(self.part) | ({self.user_id or self.role_id} & set(live)))]
+        users = {self.user_id} if self.user_id is not None else set(self.part) | {
+            user_id for user_id, roles in live.items() if self.role_id in roles
+        }
+        return [(user_id, self.role_id) for user_id in sorted(users)]
+
+    def changes(self, live):
+        """現在の内容 live に適用した場合の変更箇所 [(第1キー, 第2キー, 現在の値, 復元後の値)]。値が無い場合は None"""
+        if self.whole:
+            if not isinstance(live, dict) or not isinstance(self.part, dict):
+                return [] if live == self.part else [(None, None, live, self.part)]
+            paths = sorted({(key, None) for key in live.keys() | self.part.keys()})
+            return [
+                (key, None, live.get(key), self.part.get(key))
+                for key, _ in paths if live.get(key) != self.part.get(key)
+            ]
+        live = live or {}
+        result = []
+        for key, sub in self._paths(live):
+            old, new = live.get(key), self.part.get(key)
+            if sub is not None:
+                old = (old or {}).get(sub)
+                new = (new or {}).get(sub)
+            if old != new:
+                result.append((key, sub, old, new))
+        return result
+
+    def merge(self, live, changes):
+        """changes を live に適用した新しい内容を返す。live とその内側の dict は書き換えない"""
+        if self.whole:
+            return self.part
+        merged = dict(live or {})
+        for key, sub, _, new in changes:
+            if sub is None:
+                if new is None:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = new
+                continue
+            inner = dict(merged.get(key) or {})
+            if new is None:
+                inner.pop(sub, None)
+            else:
+                inner[sub] = new
+            if inner:
+                merged[key] = inner
+            else:
+                merged.pop(key, None)
+        return merged
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""ギルド別ストアのファイル形式。
+
+- pretty: インデント付き JSON（手作業での編集向け）
+- compact: 空白を含まない JSON
+- orjson: orjson による JSON（未インストールの場合は compact）
+- binary: 履歴（role_history）専用。ユーザー・ロールごとに時刻と理由を長さ付きの列として格納する
+
+読み込み時は先頭のバイト列から形式を判別するため、設定を変えても既存のファイルはそのまま読める
+（次回の書き込みから新しい形式になる。一括変換は convert_data.py）。
+ファイル名は形式によらず <種別>.json のまま（バックアップも同じ）で、形式の判別には拡張子を使わない。
+binary 形式の数値はすべてリトルエンディアンで格納する。
+"""
+import json
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from config import STORE_FORMAT_DEFAULT, STORE_FORMATS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATS = ("pretty", "compact", "orjson", "binary")
+# binary 形式に対応する種別
+BINARY_KINDS = ("role_history",)
+
+BINARY_MAGIC = b"RBH1"
+_HEADER = struct.Struct("<HIII")   # スキーマバージョン, ユーザー数, ロール種類数, 履歴件数
+_COUNT = struct.Struct("<Q")       # 連結した文字列のバイト数
+_NONE_VERSION = 0xFFFF             # データが None（ファイル内容が null）の場合
+_MAX_ROLES_PER_USER = 0xFFFF       # ユーザーごとのロール数は u16 で格納する
+_SWAP = sys.byteorder == "big"     # array はネイティブのバイト順のため、ビッグエンディアン環境では入れ替える
+_ENTRY_KEYS = {"timestamp", "reason"}
+# 文字列は UTF-8 で格納する。JSON と同様に対になっていないサロゲートもそのまま保存する
+_TEXT_ERRORS = "surrogatepass"
+
+class _NotRepresentable(ValueError):
+    """binary 形式で表せない内容（compact で書き込む）"""
+
+def format_for(kind):
+    """種別の書き込み形式（対応していない指定は compact として扱う）"""
+    fmt = STORE_FORMATS.get(kind, STORE_FORMAT_DEFAULT)
+    if fmt == "binary" and kind not in BINARY_KINDS:
+        fmt = "compact"
+    if fmt == "orjson" and orjson is None:
+        fmt = "compact"
+    return fmt if fmt in FORMATS else "compact"
+
+def detect(raw):
+    """ファイル内容の形式を返す（JSON はインデントの有無のみ判別）"""
+    if raw.startswith(BINARY_MAGIC):
+        return "binary"
+    return "pretty" if raw[:2] == b"{\n" else "compact"
+
+def dumps(obj, fmt):
+    """obj（{"schema_version", "data"} 形式）をバイト列にする"""
+    if fmt == "binary":
+        try:
+            return _dump_history(obj)
+        except _NotRepresentable:
+            # binary 形式で表せない内容は compact で書き込む（読み込み時は内容から判別する）
+            fmt = "compact"
+    if fmt == "orjson" and orjson is not None:
+        return orjson.dumps(obj)
+    if fmt == "pretty":
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(raw):
+    """形式を判別して読み込む"""
+    if raw.startswith(BINARY_MAGIC):
+        return _load_history(raw)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _pack(typecode, values):
+    """数値の列をリトルエンディアンのバイト列にする"""
+    values = array(typecode, values)
+    if _SWAP:
+        values.byteswap()
+    return values.tobytes()
+
+def _put_strings(out, texts):
+    """文字列の列を 文字数(u32 × n) と UTF-8 の連結 で書き込む"""
+    joined = "".join(texts).encode("utf-8", _TEXT_ERRORS)
+    out += _pack("I", [len(t) for t in texts])
+    out += _COUNT.pack(len(joined))
+    out += joined
+
+def _get_strings(view, pos, n):
+    lengths = _get_array(view, pos, "I", n)
+    pos += 4 * n
+    (size,) = _COUNT.unpack_from(view, pos)
+    pos += _COUNT.size
+    text = str(view[pos:pos + size], "utf-8", _TEXT_ERRORS)
+    bounds = list(accumulate(lengths, initial=0))
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])], pos + size
+
+def _get_array(view, pos, typecode, n):
+    values = array(typecode)
+    values.frombytes(view[pos:pos + values.itemsize * n])
+    if _SWAP:
+        values.byteswap()
+    return values.tolist()
+
+def _dump_history(obj):
+    """履歴の binary 形式（要素ごとではなく列ごとにまとめて格納する）。
+    ヘッダ: マジック, スキーマバージョン(u16), ユーザー数 U(u32), ロール種類数 R(u32), 履歴件数 N(u32)
+    本体: ユーザーID(文字列 × U), ユーザーごとのロール数(u16 × U), ロールID(文字列 × R),
+          ユーザー・ロールの組ごとのロール番号(u32) と件数(u32), 時刻(f64 × N), 理由(文字列 × N)
+    文字列の列は 文字数(u32 × n), バイト数(u64), UTF-8 の連結。
+    ユーザーごとのロール数が u16 を超える場合や、timestamp / reason 以外のキーを持つ（または欠けた）履歴がある場合は
+    _NotRepresentable（内容を落とさないよう compact で書き込む）"""
+    version, data = obj.get("schema_version", 0), obj.get("data")
+    out = bytearray(BINARY_MAGIC)
+    if data is None:
+        out += _HEADER.pack(_NONE_VERSION, 0, 0, 0)
+        return bytes(out)
+    role_ids = {}
+    role_counts, pairs, counts, times, reasons = [], [], [], [], []
+    for user_id, roles in data.items():
+        if len(roles) > _MAX_ROLES_PER_USER:
+            raise _NotRepresentable(f"too many roles for user {user_id}: {len(roles)}")
+        role_counts.append(len(roles))
+        for role_id, entries in roles.items():
+            if any(e.keys() != _ENTRY_KEYS for e in entries):
+                raise _NotRepresentable(f"unsupported history entry keys for user {user_id}")
+            pairs.append(role_ids.setdefault(role_id, len(role_ids)))
+            counts.append(len(entries))
+            times.extend(e["timestamp"] for e in entries)
+            reasons.extend(e["reason"] for e in entries)
+    out += _HEADER.pack(version, len(data), len(role_ids), len(times))
+    _put_strings(out, list(data))
+    out += _pack("H", role_counts)
+    _put_strings(out, list(role_ids))
+    out += _pack("I", pairs)
+    out += _pack("I", counts)
+    out += _pack("d", times)
+    _put_strings(out, reasons)
+    return bytes(out)
+
+def _load_history(raw):
+    view = memoryview(raw)
+    pos = len(BINARY_MAGIC)
+    version, users, role_kinds, total = _HEADER.unpack_from(view, pos)
+    pos += _HEADER.size
+    if version == _NONE_VERSION:
+        return None
+    user_ids, pos = _get_strings(view, pos, users)
+    role_counts = _get_array(view, pos, "H", users)
+    pos += 2 * users
+    role_ids, pos = _get_strings(view, pos, role_kinds)
+    pair_count = sum(role_counts)
+    pairs = _get_array(view, pos, "I", pair_count)
+    pos += 4 * pair_count
+    counts = _get_array(view, pos, "I", pair_count)
+    pos += 4 * pair_count
+    times = _get_array(view, pos, "d", total)
+    pos += 8 * total
+    reasons, pos = _get_strings(view, pos, total)
+
+    data = {}
+    pair = entry = 0
+    for user_id, role_count in zip(user_ids, role_counts):
+        roles = data[user_id] = {}
+        for _ in range(role_count):
+            n = counts[pair]
+            roles[role_ids[pairs[pair]]] = [
+                {"timestamp": ts, "reason": reason}
+                for ts, reason in zip(times[entry:entry + n], reasons[entry:entry + n])
+            ]
+            entry += n
+            pair += 1
+    return {"schema_version": version, "data": data}
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import logging
+from collections.abc import MutableMapping
+from config import GUILD_DATA_DIR, MANIFEST_FILE
+from migrations import migrate_section, wrap
+from serializers import dumps, loads, format_for
+
+logger = logging.getLogger(__name__)
+
+# DataManager の属性名 -> ギルドディレクトリ内のファイル名（バックアップ名・復元種別にも使用）
+GUILD_STORE_KINDS = {
+    "role_data": "roles_data",
+    "role_add_history": "role_history",
+    "guild_log_channels": "log_channel",
+    "tenure_rules": "tenure_rules",
+    "mention_config": "mention_config",
+    "user_remove_seconds": "settings",
+    "expiring_roles": "expiring_roles",
+    "escalation_rules": "escalation_rules",
+}
+KIND_TO_STORE = {kind: name for name, kind in GUILD_STORE_KINDS.items()}
+
+MANIFEST_VERSION = 1
+
+class GuildStore(MutableMapping):
+    """ギルドIDをキーとするストア。
+    各ギルドのデータは、そのギルドが初めて参照された時点で DataManager が読み込む。
+    ギルド分の差し替え・削除はストアの変更バージョンを更新する（保存・応答キャッシュの判定に使用）"""
+
+    def __init__(self, manager, name):
+        self._manager = manager
+        self.name = name
+        self._data = {}
+
+    def __getitem__(self, guild_id):
+        self._manager.ensure_guild(guild_id)
+        return self._data[guild_id]
+
+    def __setitem__(self, guild_id, value):
+        self._manager.ensure_guild(guild_id)
+        self._data[guild_id] = value
+        self._manager.bump_store_version(guild_id, self.name)
+
+    def __delitem__(self, guild_id):
+        self._manager.ensure_guild(guild_id)
+        del self._data[guild_id]
+        self._manager.bump_store_version(guild_id, self.name)
+
+    def __iter__(self):
+        return iter(self._manager.guild_ids_for(self.name))
+
+    def __len__(self):
+        return len(self._manager.guild_ids_for(self.name))
+
+    def __repr__(self):
+        return f"<GuildStore {self.name} loaded={len(self._data)}>"
+
+def guild_dir(guild_id):
+    return os.path.join(GUILD_DATA_DIR, guild_id)
+
+def shard_path(guild_id, kind):
+    return os.path.join(guild_dir(guild_id), f"{kind}.json")
+
+def read_json(file_path, default=None):
+    if not os.path.exists(file_path):
+        return default
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {e}")
+        return default
+
+def write_json(file_path, data, compact=False):
+    """一時ファイルに書き込んでから置き換える（書き込み途中の破損を防ぐ）"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if compact:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        else:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, file_path)
+
+def clone(data):
+    """JSON で表現できるデータの複製。copy.deepcopy より大幅に速い"""
+    return json.loads(json.dumps(data, ensure_ascii=False))
+
+def fingerprint(data):
+    """変更検知用にデータを正規化した JSON 文字列へ変換する（None はそのまま）。
+    複製を保持して比較するより速く、メモリも少ない"""
+    if data is None:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def read_section(file_path, kind):
+    """ギルド別ファイル（またはそのバックアップ）を読み込み、現在のスキーマへ移行して
+    (データ, 移行したか) を返す。ファイル形式は内容から判別する。ファイルが無い・読めない場合は (None, False)"""
+    raw = read_raw(file_path)
+    if raw is None:
+        return None, False
+    return migrate_section(kind, raw)
+
+def read_raw(file_path):
+    """ストアのファイルを形式を問わず読み込む（スキーマの移行はしない）。無い・読めない場合は None"""
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            return loads(f.read())
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {e}")
+        return None
+
+def write_section(file_path, kind, data, fmt=None):
+    """種別ごとの形式（serializers.format_for）で書き込む"""
+    write_bytes(file_path, dumps(wrap(kind, data), fmt or format_for(kind)))
+
+def write_bytes(file_path, payload):
+    """一時ファイルに書き込んでから置き換える"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, file_path)
+
+def file_stamp(file_path):
+    """変更検知用の (mtime_ns, サイズ)。ファイルが無い場合は None"""
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def diff_sections(old, new):
+    """2つのストア内容を比較し、変更箇所を (第1キー, 第2キー) の一覧で返す。
+    値が dict でない階層の変更は第2キーを None とする（例: (user_id, role_name)）"""
+    if old is None and isinstance(new, dict):
+        old = {}
+    if new is None and isinstance(old, dict):
+        new = {}
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return [] if old == new else [(None, None)]
+    changed = []
+    for key in old.keys() | new.keys():
+        a, b = old.get(key), new.get(key)
+        if a == b:
+            continue
+        if isinstance(a, dict) or isinstance(b, dict):
+            a = a if isinstance(a, dict) else {}
+            b = b if isinstance(b, dict) else {}
+            subs = [sub for sub in a.keys() | b.keys() if a.get(sub) != b.get(sub)]
+            changed.extend((key, sub) for sub in subs or [None])
+        else:
+            changed.append((key, None))
+    return changed
+
+def load_manifest():
+    """マニフェスト {guild_id: [kind, ...]} を返す。未作成の場合は None"""
+    data = read_json(MANIFEST_FILE)
+    if data is None:
+        return None
+    return data.get("guilds", {})
+
+def save_manifest(guilds):
+    write_json(MANIFEST_FILE, {"version": MANIFEST_VERSION, "guilds": guilds})
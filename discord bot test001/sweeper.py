@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import discord
+import logging
+import math
+import time
+from bisect import bisect_right
+from config import (
+    SYNC_INTERVAL, SWEEP_TICK_INTERVAL, SWEEP_MAX_MEMBERS_PER_TICK,
+    SWEEP_MAX_TICK_SECONDS, SWEEP_CHUNK_SIZE, SWEEP_RECENT_PER_TICK
+)
+
+logger = logging.getLogger(__name__)
+
+class ConsistencySweeper:
+    """記録と実際のロールの整合性チェック（1時間ごとの全体同期の代わり）。
+
+    ギルドのメンバーと記録済みユーザーを ID 順に並べ、SWEEP_TICK_INTERVAL ごとに続きから一部ずつ照合して、
+    SYNC_INTERVAL でギルド全体を一巡する。1回あたりの人数は一巡に必要な人数から求め、
+    人数（SWEEP_MAX_MEMBERS_PER_TICK）と処理時間（SWEEP_MAX_TICK_SECONDS）の上限内で処理する。
+    ギルドは chunk しないため、メンバーはメンバーキャッシュではなく HTTP で ID 順に取得する。
+    処理時間の上限は照合（イベントループ上の処理）にかかった時間のみで判定し、取得の待ち時間は含めない。
+    記録が変わったユーザー（DataManager.note_user_change）は順番を待たずに先に照合する。"""
+
+    def __init__(self, bot, period=SYNC_INTERVAL, tick_interval=SWEEP_TICK_INTERVAL,
+                 max_members=SWEEP_MAX_MEMBERS_PER_TICK, max_seconds=SWEEP_MAX_TICK_SECONDS):
+        self.bot = bot
+        self.period = period
+        self.tick_interval = tick_interval
+        self.max_members = max_members
+        self.max_seconds = max_seconds
+        # guild_id -> 一巡分の状態（開始時点の対象 ID 一覧・再開位置・件数）
+        self._cycles = {}
+        self.last_cycle = {}
+
+    def _start_cycle(self, guild):
+        """一巡分の照合対象を用意する。
+        記録済みユーザーの ID 一覧のみ保持し、メンバーは照合時に HTTP で順に取得する
+        （メンバーキャッシュに無いメンバーも一巡で照合する）"""
+        guild_id = str(guild.id)
+        ids = sorted(int(u) for u in self.bot.data.role_data.get(guild_id, {}))
+        total = (guild.member_count or 0) + len(ids)
+        ticks = max(1, self.period // self.tick_interval)
+        quota = max(1, math.ceil(total / ticks))
+        if quota > self.max_members:
+            logger.warning(
+                f"[{guild.name}] 整合性チェック: 1回の上限 {self.max_members}人では {self.period // 60}分で一巡できません"
+                f"（必要 {quota}人/回）"
+            )
+            quota = self.max_members
+        cycle = {
+            "ids": ids, "pos": 0, "cursor": 0, "quota": quota, "total": total,
+            "checked": 0, "prioritized": 0, "corrected": 0, "started_at": time.time(),
+        }
+        self._cycles[guild_id] = cycle
+        return cycle
+
+    async def tick(self):
+        """全ギルドについて1回分の照合を行う（起動時の同期が済んだギルドのみ）"""
+        for guild in list(self.bot.guilds):
+            if guild.id not in self.bot.synced_guilds:
+                continue
+            try:
+                await self.sweep_guild(guild)
+            except Exception as e:
+                logger.error(f"[{guild.name}] 整合性チェックエラー: {e}")
+
+    async def sweep_guild(self, guild):
+        from core import reconcile_members, resolve_members, log_message
+        guild_id = str(guild.id)
+        busy = 0.0
+        cycle = self._cycles.get(guild_id) or self._start_cycle(guild)
+        # 1回分の修正件数（保存とログは最後に1度だけ行う）
+        tick = {"removed": 0, "added": 0}
+
+        # 記録が変わったユーザーを優先して照合する
+        recent = self.bot.data.pop_recent_users(guild_id, SWEEP_RECENT_PER_TICK)
+        if recent:
+            members = await resolve_members(guild, recent)
+            busy += await self._reconcile(guild, cycle, tick, members.values(), recent, reconcile_members, "prioritized")
+
+        remaining = cycle["quota"]
+        while remaining > 0 and busy < self.max_seconds:
+            size = min(SWEEP_CHUNK_SIZE, remaining)
+            user_ids, members, finished = await self._next_fetched(guild, cycle, size)
+            busy += await self._reconcile(guild, cycle, tick, members, user_ids, reconcile_members, "checked")
+            remaining -= size
+            if finished:
+                self._finish_cycle(guild, cycle)
+                break
+
+        if tick["removed"] or tick["added"]:
+            await self.bot.data.save_guild(guild_id)
+            await log_message(
+                self.bot, guild, f"整合性チェック: 削除{tick['removed']}件, 追加{tick['added']}件", "info"
+            )
+
+    async def _next_fetched(self, guild, cycle, size):
+        """cursor より後のメンバーを size 人だけ HTTP で取得し、その ID 範囲内の記録済みユーザーと合わせて返す。
+        limit が 1000 未満の場合は1ページのみ取得される"""
+        members = [
+            m async for m in guild.fetch_members(limit=size, after=discord.Object(id=cycle["cursor"]))
+        ]
+        members.sort(key=lambda m: m.id)
+        finished = len(members) < size
+        end = math.inf if finished else members[-1].id
+        tracked = cycle["ids"]
+        start, stop = bisect_right(tracked, cycle["cursor"]), bisect_right(tracked, end)
+        user_ids = {str(m.id) for m in members if not m.bot}
+        user_ids.update(str(u) for u in tracked[start:stop])
+        if not finished:
+            cycle["cursor"] = end
+        return user_ids, [m for m in members if not m.bot], finished
+
+    async def _reconcile(self, guild, cycle, tick, members, user_ids, reconcile_members, counter):
+        """照合して件数を記録し、かかった時間（秒）を返す"""
+        start = time.monotonic()
+        user_ids = set(user_ids)
+        changes = await reconcile_members(self.bot, guild, members, user_ids, "整合性チェック")
+        cycle[counter] += len(user_ids)
+        cycle["corrected"] += changes["removed"] + changes["added"]
+        tick["removed"] += changes["removed"]
+        tick["added"] += changes["added"]
+        # 照合による修正で記録されたユーザーは優先対象に戻さない
+        self.bot.data.discard_recent_users(str(guild.id), user_ids)
+        return time.monotonic() - start
+
+    def _finish_cycle(self, guild, cycle):
+        guild_id = str(guild.id)
+        elapsed = time.time() - cycle["started_at"]
+        self.last_cycle[guild_id] = {
+            "finished_at": time.time(), "elapsed": elapsed,
+            "checked": cycle["checked"], "prioritized": cycle["prioritized"], "corrected": cycle["corrected"],
+        }
+        del self._cycles[guild_id]
+        logger.info(
+            f"[{guild.name}] 整合性チェック一巡: {cycle['checked']}人を照合（優先 {cycle['prioritized']}人）、"
+            f"修正 {cycle['corrected']}件（{elapsed / 60:.1f}分）"
+        )
+
+    def progress(self, guild_id):
+        """現在の一巡の進捗 (照合済み人数, 対象人数, 1回あたりの人数)。未開始の場合は None"""
+        cycle = self._cycles.get(guild_id)
+        if cycle is None:
+            return None
+        return cycle["checked"], cycle["total"], cycle["quota"]